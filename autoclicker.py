@@ -1,14 +1,23 @@
-import tkinter as tk
-from tkinter import ttk, messagebox, font
-import ttkbootstrap as ttkb
 import threading
-import pyautogui
-import keyboard
 import time
-import random
-from pystray import Icon, MenuItem as item
-from PIL import Image
 import ctypes
+import ctypes.util
+import sys
+import os
+import argparse
+import json
+import numpy as np
+
+def load_gui_modules():
+    # The window, hotkey and tray libraries are only imported when the GUI is
+    # started, so the click engine and its backends load anywhere
+    global tk, ttk, messagebox, font, filedialog, ttkb, keyboard, Icon, item, Image
+    import tkinter as tk
+    from tkinter import ttk, messagebox, font, filedialog
+    import ttkbootstrap as ttkb
+    import keyboard
+    from pystray import Icon, MenuItem as item
+    from PIL import Image
 
 # Constants for default values
 DEFAULT_INTERVAL = 0.01
@@ -19,19 +28,491 @@ DEFAULT_CLICK_TYPE = "left"
 DEFAULT_MAX_CLICKS = 0  # 0 means unlimited
 DEFAULT_START_DELAY = 0
 DEFAULT_POSITION = (None, None)
-
-# Load the user32.dll
-user32 = ctypes.windll.user32
+DEFAULT_MISSED_POLICY = "skip"
+DEFAULT_CLICKS_PER_BATCH = 1
+DEFAULT_DISTRIBUTION = "gaussian"
+DEFAULT_SEED = None  # None draws a fresh seed every run
+
+# Click timing: sleep until a margin before each deadline, yield through the
+# margin and spin only the last SPIN_THRESHOLD onto it. The margin starts at
+# SPIN_MARGIN_START, stays within SPIN_MARGIN_MIN and SPIN_MARGIN_MAX, and
+# shrinks by SPIN_MARGIN_DECAY for every click that lands on time. Missed
+# deadlines are either skipped or clicked back-to-back, at most
+# MAX_CATCH_UP_CLICKS of them, so a long stall cannot turn into a burst of thousands.
+MISSED_POLICIES = ["skip", "catch up"]
+SPIN_THRESHOLD = 0.0001  # seconds
+SPIN_MARGIN_START = 0.001
+SPIN_MARGIN_MIN = 0.0005
+SPIN_MARGIN_MAX = 0.004
+SPIN_MARGIN_DECAY = 0.99
+MAX_CATCH_UP_CLICKS = 100
+TIMER_RESOLUTION_MS = 1  # Windows timer resolution requested while clicking
+
+# Random intervals are drawn ahead of time in blocks of INTERVAL_BLOCK. The
+# Gaussian is truncated to TRUNCATE_STDEVS either side of the mean, and no
+# distribution goes below MIN_RANDOM_INTERVAL.
+DISTRIBUTIONS = ["gaussian", "exponential", "log-normal"]
+INTERVAL_BLOCK = 4096
+TRUNCATE_STDEVS = 3
+MIN_RANDOM_INTERVAL = 0.0
+
+# Click sequences: a JSON list of steps, each {"x", "y", "click", "repeat", "delay"}.
+# x and y may be left out to click wherever the cursor is; "click" is a
+# CLICK_TYPES name, "repeat" the clicks sent at the step in one submission and
+# "delay" the seconds to the next step. Only SEQUENCE_PREVIEW_STEPS are listed.
+SEQUENCE_STEP_DEFAULTS = {'x': None, 'y': None, 'click': DEFAULT_CLICK_TYPE, 'repeat': 1, 'delay': DEFAULT_INTERVAL}
+SEQUENCE_PREVIEW_STEPS = 1000
 
 # Mouse event flags
+MOUSEEVENTF_MOVE = 0x0001
 MOUSEEVENTF_LEFTDOWN = 0x0002
 MOUSEEVENTF_LEFTUP = 0x0004
 MOUSEEVENTF_RIGHTDOWN = 0x0008
 MOUSEEVENTF_RIGHTUP = 0x0010
+MOUSEEVENTF_VIRTUALDESK = 0x4000
+MOUSEEVENTF_ABSOLUTE = 0x8000
+INPUT_MOUSE = 0
+SM_XVIRTUALSCREEN, SM_YVIRTUALSCREEN, SM_CXVIRTUALSCREEN, SM_CYVIRTUALSCREEN = 76, 77, 78, 79
+
+class MOUSEINPUT(ctypes.Structure):
+    _fields_ = [('dx', ctypes.c_long), ('dy', ctypes.c_long), ('mouseData', ctypes.c_ulong),
+                ('dwFlags', ctypes.c_ulong), ('time', ctypes.c_ulong), ('dwExtraInfo', ctypes.POINTER(ctypes.c_ulong))]
+
+class INPUT(ctypes.Structure):
+    # MOUSEINPUT is the largest member of INPUT's union, so this has the size SendInput expects
+    _fields_ = [('type', ctypes.c_ulong), ('mi', MOUSEINPUT)]
+
+# Click type -> (button, clicks)
+CLICK_TYPES = {
+    "left": ("left", 1),
+    "right": ("right", 1),
+    "double": ("left", 2)
+}
+
+class InputBackend:
+    # Sends clicks for the click loop. x and y of None click wherever the cursor
+    # is, and `count` clicks go out together in one submission where the backend
+    # can batch them. A submission that repeats can be built once with prepare()
+    # and sent with click_prepared(). begin() and end() bracket a clicking run;
+    # over a run the backend counts what it sent, for achieved_rate().
+    sent = 0
+    started = None
+    last_sent = None
+
+    def click(self, x, y, button="left", count=1):
+        self.click_prepared(self.prepare(x, y, button, count), count)
+
+    def click_prepared(self, prepared, count):
+        self.send_prepared(prepared)
+        self.sent += count
+        self.last_sent = time.perf_counter()
+
+    def prepare(self, x, y, button="left", count=1):
+        return (x, y, button, count)
+
+    def send_prepared(self, prepared):
+        self.send(*prepared)
+
+    def send(self, x, y, button, count):
+        raise NotImplementedError
+
+    def position(self):
+        raise NotImplementedError
+
+    def begin(self):
+        self.sent = 0
+        self.started = time.perf_counter()
+        self.last_sent = None
+
+    def end(self):
+        pass
+
+    def achieved_rate(self):
+        # Mouse-button clicks per second from the start of the run to the last submission
+        if not self.last_sent or self.last_sent <= self.started:
+            return 0.0
+        return self.sent / (self.last_sent - self.started)
+
+class Win32Backend(InputBackend):
+    WIN32_BUTTONS = {
+        "left": (MOUSEEVENTF_LEFTDOWN, MOUSEEVENTF_LEFTUP),
+        "right": (MOUSEEVENTF_RIGHTDOWN, MOUSEEVENTF_RIGHTUP)
+    }
+
+    def __init__(self):
+        self.user32 = ctypes.windll.user32
+        self.winmm = ctypes.windll.winmm
+
+    def prepare(self, x, y, button="left", count=1):
+        # An optional absolute move, then a down and an up per click, as one INPUT
+        # array for a single SendInput call. The move is scaled to the desktop as
+        # it is now, so a sequence built before a display change targets the old layout.
+        down, up = self.WIN32_BUTTONS[button]
+        inputs = []
+        if x is not None:
+            # Absolute coordinates are 0..65535 across the whole virtual desktop
+            left, top = self.user32.GetSystemMetrics(SM_XVIRTUALSCREEN), self.user32.GetSystemMetrics(SM_YVIRTUALSCREEN)
+            width, height = self.user32.GetSystemMetrics(SM_CXVIRTUALSCREEN), self.user32.GetSystemMetrics(SM_CYVIRTUALSCREEN)
+            dx = round((x - left) * 65535 / max(width - 1, 1))
+            dy = round((y - top) * 65535 / max(height - 1, 1))
+            inputs.append((dx, dy, MOUSEEVENTF_MOVE | MOUSEEVENTF_ABSOLUTE | MOUSEEVENTF_VIRTUALDESK))
+        inputs += [(0, 0, flag) for _ in range(count) for flag in (down, up)]
+        batch = (INPUT * len(inputs))()
+        for entry, (dx, dy, flags) in zip(batch, inputs):
+            entry.type = INPUT_MOUSE
+            entry.mi.dx, entry.mi.dy, entry.mi.dwFlags = dx, dy, flags
+        return batch
+
+    def send_prepared(self, batch):
+        self.user32.SendInput(len(batch), batch, ctypes.sizeof(INPUT))
+
+    def send(self, x, y, button, count):
+        self.send_prepared(self.prepare(x, y, button, count))
+
+    def position(self):
+        point = (ctypes.c_long * 2)()
+        self.user32.GetCursorPos(point)
+        return point[0], point[1]
+
+    def begin(self):
+        super().begin()
+        # Windows wakes sleeping threads every 15.6 ms unless asked for a finer timer
+        self.winmm.timeBeginPeriod(TIMER_RESOLUTION_MS)
+
+    def end(self):
+        self.winmm.timeEndPeriod(TIMER_RESOLUTION_MS)
+
+class XTestBackend(InputBackend):
+    # X11 through the XTest extension, which injects events into the X server
+    # like a real mouse and needs no privileges. Xlib calls from the click thread
+    # and the GUI's position capture share one connection, so they take a lock.
+    X11_BUTTONS = {"left": 1, "right": 3}
+
+    def __init__(self, display=None):
+        x11_path = ctypes.util.find_library('X11')
+        xtst_path = ctypes.util.find_library('Xtst')
+        if not x11_path or not xtst_path:
+            raise OSError("libX11 and libXtst are needed for the xtest backend")
+        self.x11 = ctypes.cdll.LoadLibrary(x11_path)
+        self.xtst = ctypes.cdll.LoadLibrary(xtst_path)
+        self.x11.XOpenDisplay.argtypes = [ctypes.c_char_p]
+        self.x11.XOpenDisplay.restype = ctypes.c_void_p
+        self.x11.XDefaultRootWindow.argtypes = [ctypes.c_void_p]
+        self.x11.XDefaultRootWindow.restype = ctypes.c_ulong
+        self.x11.XFlush.argtypes = [ctypes.c_void_p]
+        self.x11.XQueryPointer.argtypes = [ctypes.c_void_p, ctypes.c_ulong] + [ctypes.c_void_p] * 7
+        self.xtst.XTestFakeMotionEvent.argtypes = [ctypes.c_void_p, ctypes.c_int, ctypes.c_int, ctypes.c_int, ctypes.c_ulong]
+        self.xtst.XTestFakeButtonEvent.argtypes = [ctypes.c_void_p, ctypes.c_uint, ctypes.c_int, ctypes.c_ulong]
+        self.display = self.x11.XOpenDisplay(display.encode() if display else None)
+        if not self.display:
+            raise OSError(f"Cannot open X display {display or os.environ.get('DISPLAY', '')!r}")
+        self.root = self.x11.XDefaultRootWindow(self.display)
+        self.lock = threading.Lock()
+
+    def send(self, x, y, button, count):
+        code = self.X11_BUTTONS[button]
+        with self.lock:
+            if x is not None:
+                self.xtst.XTestFakeMotionEvent(self.display, -1, x, y, 0)
+            for _ in range(count):
+                self.xtst.XTestFakeButtonEvent(self.display, code, True, 0)
+                self.xtst.XTestFakeButtonEvent(self.display, code, False, 0)
+            self.x11.XFlush(self.display)
+
+    def position(self):
+        root, child = ctypes.c_ulong(), ctypes.c_ulong()
+        root_x, root_y, win_x, win_y = ctypes.c_int(), ctypes.c_int(), ctypes.c_int(), ctypes.c_int()
+        mask = ctypes.c_uint()
+        with self.lock:
+            self.x11.XQueryPointer(self.display, self.root, ctypes.byref(root), ctypes.byref(child), ctypes.byref(root_x),
+                                   ctypes.byref(root_y), ctypes.byref(win_x), ctypes.byref(win_y), ctypes.byref(mask))
+        return root_x.value, root_y.value
+
+class RecordingBackend(InputBackend):
+    # Sends nothing and keeps every click as a (perf_counter time, x, y, button,
+    # count) event in memory, for tests and dry runs
+    def __init__(self, position=(0, 0)):
+        self.events = []
+        self.cursor = position
+
+    def send(self, x, y, button, count):
+        if x is not None:
+            self.cursor = (x, y)
+        self.events.append((time.perf_counter(), self.cursor[0], self.cursor[1], button, count))
+
+    def position(self):
+        return self.cursor
+
+INPUT_BACKENDS = {
+    'win32': Win32Backend,
+    'xtest': XTestBackend,
+    'null': RecordingBackend
+}
+
+def default_backend_name():
+    if sys.platform == 'win32':
+        return 'win32'
+    if os.environ.get('DISPLAY'):
+        return 'xtest'
+    return 'null'
+
+class ClickTimer:
+    # Deadlines on the perf_counter clock, each one interval after the previous
+    # deadline rather than after the previous click, so click time never adds up
+    # to drift. Waiting sleeps on the stop event, which keeps CPU near zero at long
+    # intervals and lets Stop interrupt a wait of minutes, until `margin` before
+    # the deadline, then yields with sleep(0) and spins only the last
+    # SPIN_THRESHOLD. How late a sleep wakes varies by machine and load, so a
+    # click that is late after sleeping widens the margin by its lateness, and
+    # clicks on time let it shrink back. The margin never takes more than half of
+    # the time left, so long intervals are almost all sleep; intervals shorter
+    # than twice SPIN_MARGIN_MIN yield all the way.
+    def __init__(self, stop_event, missed_policy=DEFAULT_MISSED_POLICY, spin_threshold=SPIN_THRESHOLD):
+        self.stop_event = stop_event
+        self.missed_policy = missed_policy
+        self.spin_threshold = spin_threshold
+        self.margin = SPIN_MARGIN_START
+        self.deadline = time.perf_counter()
+        self.missed = 0
+
+    def wait(self):
+        # True once the deadline is reached, False if stopped first
+        remaining = self.deadline - time.perf_counter()
+        margin = max(SPIN_MARGIN_MIN, min(self.margin, remaining / 2))
+        slept = remaining > margin
+        if slept and self.stop_event.wait(remaining - margin):
+            return False
+        while self.deadline - time.perf_counter() > self.spin_threshold:
+            if self.stop_event.is_set():
+                return False
+            time.sleep(0)
+        while time.perf_counter() < self.deadline:
+            pass
+        if slept:
+            late = time.perf_counter() - self.deadline
+            if late > self.spin_threshold:
+                self.margin = min(SPIN_MARGIN_MAX, self.margin + late)
+            else:
+                self.margin = max(SPIN_MARGIN_MIN, self.margin * SPIN_MARGIN_DECAY)
+        return not self.stop_event.is_set()
+
+    def advance(self, interval):
+        self.deadline += interval
+        behind = time.perf_counter() - self.deadline
+        if behind <= 0 or interval <= 0:
+            return
+        missed = int(behind // interval) + 1
+        if self.missed_policy == "catch up":
+            # Keep MAX_CATCH_UP_CLICKS of the missed deadlines and drop the rest
+            missed = max(0, missed - MAX_CATCH_UP_CLICKS)
+        self.deadline += missed * interval
+        self.missed += missed
+
+def draw_intervals(rng, distribution, mean, stdev, size):
+    # `size` intervals in seconds with the given mean and standard deviation
+    if distribution == "gaussian":
+        low, high = max(MIN_RANDOM_INTERVAL, mean - TRUNCATE_STDEVS * stdev), mean + TRUNCATE_STDEVS * stdev
+        values = rng.normal(mean, stdev, size)
+        rejected = (values < low) | (values > high)
+        # Redraw only the rejected values until none are left
+        while rejected.any():
+            values[rejected] = rng.normal(mean, stdev, int(rejected.sum()))
+            rejected = (values < low) | (values > high)
+        return values
+    if distribution == "exponential":
+        # Memoryless clicking; the standard deviation of an exponential is its mean
+        return np.maximum(rng.exponential(mean, size), MIN_RANDOM_INTERVAL)
+    if distribution == "log-normal":
+        # Parameters of the underlying normal that give this mean and stdev
+        sigma2 = np.log1p((stdev / mean) ** 2)
+        return np.maximum(rng.lognormal(np.log(mean) - sigma2 / 2, np.sqrt(sigma2), size), MIN_RANDOM_INTERVAL)
+    raise ValueError(f"unknown distribution {distribution!r}")
+
+class IntervalSchedule:
+    # Random intervals for the click loop, double-buffered: next() reads from a
+    # prepared block of Python floats, and a helper thread draws the following
+    # block while this one is used up, so the loop never draws a random number or
+    # waits for a refill. Blocks come from one seeded generator in order, so the
+    # same seed gives the same intervals however the threads are scheduled.
+    def __init__(self, distribution, mean, stdev, seed=DEFAULT_SEED, block_size=INTERVAL_BLOCK):
+        draw_intervals(np.random.default_rng(0), distribution, mean, stdev, 1)  # reject bad settings here
+        self.distribution = distribution
+        self.mean = mean
+        self.stdev = stdev
+        self.block_size = block_size
+        self.rng = np.random.default_rng(seed)
+        self.block = self.draw()
+        self.position = 0
+        self.next_block = None
+        self.closed = False
+        self.wanted = threading.Event()
+        self.ready = threading.Event()
+        self.wanted.set()
+        threading.Thread(target=self.refill, daemon=True).start()
+
+    def draw(self):
+        return draw_intervals(self.rng, self.distribution, self.mean, self.stdev, self.block_size).tolist()
+
+    def refill(self):
+        while True:
+            self.wanted.wait()
+            self.wanted.clear()
+            if self.closed:
+                return
+            self.next_block = self.draw()
+            self.ready.set()
+
+    def next(self):
+        if self.position == len(self.block):
+            # The next block was requested a whole block ago, so this does not wait in practice
+            self.ready.wait()
+            self.ready.clear()
+            self.block, self.next_block, self.position = self.next_block, None, 0
+            self.wanted.set()
+        value = self.block[self.position]
+        self.position += 1
+        return value
+
+    def close(self):
+        self.closed = True
+        self.wanted.set()
+
+def run_clicks(backend, stop_event, interval, click_type=DEFAULT_CLICK_TYPE, position=DEFAULT_POSITION,
+               max_clicks=DEFAULT_MAX_CLICKS, missed_policy=DEFAULT_MISSED_POLICY, on_click=None,
+               clicks_per_batch=DEFAULT_CLICKS_PER_BATCH, intervals=None):
+    # The clicking run behind the GUI, usable without it: clicks every `interval`
+    # seconds until stopped or `max_clicks` is reached, calling on_click(count)
+    # after each submission. In burst mode (`clicks_per_batch` above 1) every
+    # deadline sends that many clicks in one submission and deadlines are
+    # `clicks_per_batch` intervals apart, so the average rate stays one click per
+    # interval. With an IntervalSchedule as `intervals`, each click waits for its
+    # next random interval instead. Returns the number of clicks sent.
+    button, count = CLICK_TYPES[click_type]
+    x, y = position
+    prepared = backend.prepare(x, y, button, count * clicks_per_batch)
+    timer = ClickTimer(stop_event, missed_policy)
+    clicks = 0
+    backend.begin()
+    try:
+        while max_clicks == 0 or clicks < max_clicks:
+            if not timer.wait():
+                break
+            if max_clicks and clicks + clicks_per_batch > max_clicks:
+                batch = max_clicks - clicks
+                backend.click(x, y, button, count * batch)
+            else:
+                batch = clicks_per_batch
+                backend.click_prepared(prepared, count * batch)
+            clicks += batch
+            if on_click:
+                on_click(clicks)
+            if intervals is None:
+                timer.advance(interval * clicks_per_batch)
+            else:
+                timer.advance(sum(intervals.next() for _ in range(clicks_per_batch)))
+    finally:
+        backend.end()
+    return clicks
+
+class ClickSequence:
+    # Steps compiled into parallel arrays: target (x, y and whether the step has
+    # one), an index into CLICK_TYPE_NAMES, repeat count and delay. Everything is
+    # validated and converted here, so running a sequence only indexes lists.
+    CLICK_TYPE_NAMES = list(CLICK_TYPES)
+
+    def __init__(self, steps):
+        self.steps = steps
+        defaults = SEQUENCE_STEP_DEFAULTS
+        xs = [step.get('x') for step in steps]
+        ys = [step.get('y') for step in steps]
+        clicks = [step.get('click', defaults['click']) for step in steps]
+        self.has_position = np.array([x is not None for x in xs], dtype=bool)
+        if not np.array_equal(self.has_position, [y is not None for y in ys]):
+            number = int(np.flatnonzero(self.has_position != np.array([y is not None for y in ys]))[0]) + 1
+            raise ValueError(f"step {number}: give both x and y, or neither")
+        indexes = {name: index for index, name in enumerate(self.CLICK_TYPE_NAMES)}
+        unknown = [number for number, click in enumerate(clicks, 1) if click not in indexes]
+        if unknown:
+            raise ValueError(f"step {unknown[0]}: unknown click type {clicks[unknown[0] - 1]!r}")
+        self.xs = np.array([x or 0 for x in xs], dtype=np.int32)
+        self.ys = np.array([y or 0 for y in ys], dtype=np.int32)
+        self.click_types = np.array([indexes[click] for click in clicks], dtype=np.uint8)
+        self.repeats = np.array([step.get('repeat', defaults['repeat']) for step in steps], dtype=np.int32)
+        self.delays = np.array([step.get('delay', defaults['delay']) for step in steps], dtype=np.float64)
+        if len(steps) and (self.repeats.min() < 1 or self.delays.min() < 0):
+            raise ValueError("every step needs a repeat of at least 1 and a delay of at least 0")
+
+        self.planned = None
+        self.planned_for = None
+
+    def __len__(self):
+        return len(self.steps)
+
+    def plan(self, backend):
+        # Per-step (submission, x, y, button, button clicks, clicks, delay) tuples
+        # for the click loop, with each submission prepared by `backend`. Built once
+        # per backend.
+        if self.planned is None or self.planned_for is not backend:
+            self.planned = self.build_plan(backend)
+            self.planned_for = backend
+        return self.planned
+
+    def build_plan(self, backend):
+        buttons = [CLICK_TYPES[name][0] for name in self.CLICK_TYPE_NAMES]
+        presses = np.array([CLICK_TYPES[name][1] for name in self.CLICK_TYPE_NAMES])[self.click_types] * self.repeats
+        columns = (self.has_position.tolist(), self.xs.tolist(), self.ys.tolist(), self.click_types.tolist(),
+                   presses.tolist(), self.repeats.tolist(), self.delays.tolist())
+        plan = []
+        for has, x, y, click_type, count, repeat, delay in zip(*columns):
+            if not has:
+                x = y = None
+            button = buttons[click_type]
+            plan.append((backend.prepare(x, y, button, count), x, y, button, count, repeat, delay))
+        return plan
+
+def load_sequence(path):
+    with open(path, encoding='utf-8') as f:
+        return ClickSequence(json.load(f))
+
+def save_sequence(path, sequence):
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(sequence.steps, f, indent=1)
+
+def run_sequence(backend, stop_event, sequence, max_clicks=DEFAULT_MAX_CLICKS, missed_policy=DEFAULT_MISSED_POLICY,
+                 on_click=None):
+    # Runs the steps in order, starting over after the last one, until stopped or
+    # `max_clicks` is reached. Returns the number of clicks sent.
+    plan = sequence.plan(backend)
+    if not plan:
+        return 0
+    timer = ClickTimer(stop_event, missed_policy)
+    clicks = 0
+    step = 0
+    backend.begin()
+    try:
+        while max_clicks == 0 or clicks < max_clicks:
+            if not timer.wait():
+                break
+            prepared, x, y, button, count, repeat, delay = plan[step]
+            if max_clicks and clicks + repeat > max_clicks:
+                # Only the last step of a limited run is cut short, so it is built here
+                count, repeat = count // repeat * (max_clicks - clicks), max_clicks - clicks
+                backend.click(x, y, button, count)
+            else:
+                backend.click_prepared(prepared, count)
+            clicks += repeat
+            if on_click:
+                on_click(clicks)
+            timer.advance(delay)
+            step = step + 1 if step + 1 < len(plan) else 0
+    finally:
+        backend.end()
+    return clicks
 
 class AutoClicker:
-    def __init__(self, root):
+    def __init__(self, root, backend):
         self.root = root
+        self.backend = backend
         self.root.title("Auto Clicker")
         self.root.geometry("400x830")
         self.root.resizable(False, False)
@@ -42,6 +523,7 @@ class AutoClicker:
 
         # Variables
         self.clicking = False
+        self.stop_event = threading.Event()
         self.hotkey = DEFAULT_HOTKEY
         self.click_count = 0
         self.pulse_animation_id = None
@@ -64,15 +546,33 @@ class AutoClicker:
         self.click_type = DEFAULT_CLICK_TYPE
         self.max_clicks = DEFAULT_MAX_CLICKS
         self.click_position = DEFAULT_POSITION
+        self.missed_policy = DEFAULT_MISSED_POLICY
+        self.clicks_per_batch = DEFAULT_CLICKS_PER_BATCH
+        self.distribution = DEFAULT_DISTRIBUTION
+        self.seed = DEFAULT_SEED
+        self.use_sequence = False
+        self.sequence = ClickSequence([])
+        self.count_updated = 0
 
     def setup_gui(self):
         main_frame = ttk.Frame(self.root, padding="20 20 20 0")
         main_frame.pack(fill=tk.BOTH, expand=True)
 
+        # Settings sections go in tabs so the window keeps a fixed size as they grow
+        notebook = ttk.Notebook(main_frame)
+        notebook.pack(fill=tk.X)
+        click_tab = ttk.Frame(notebook, padding="10 0")
+        timing_tab = ttk.Frame(notebook, padding="10 0")
+        sequence_tab = ttk.Frame(notebook, padding="10 0")
+        notebook.add(click_tab, text="Click")
+        notebook.add(timing_tab, text="Timing")
+        notebook.add(sequence_tab, text="Sequence")
+
         # Create sections
-        self.create_click_settings(main_frame)
-        self.create_position_settings(main_frame)
-        self.create_advanced_settings(main_frame)
+        self.create_click_settings(click_tab)
+        self.create_position_settings(click_tab)
+        self.create_advanced_settings(timing_tab)
+        self.create_sequence_settings(sequence_tab)
         self.create_control_buttons(main_frame)
         self.create_status_label(main_frame)
 
@@ -83,6 +583,7 @@ class AutoClicker:
         self.entry_interval = self.create_entry(frame, "Interval (s):", str(DEFAULT_INTERVAL), 0)
         self.click_type_var = self.create_combobox(frame, "Click Type:", ["left", "right", "double"], DEFAULT_CLICK_TYPE, 1)
         self.entry_max_clicks = self.create_entry(frame, "Max Clicks:", str(DEFAULT_MAX_CLICKS), 2)
+        self.entry_clicks_per_batch = self.create_entry(frame, "Clicks per Batch:", str(DEFAULT_CLICKS_PER_BATCH), 3)
 
     def create_entry(self, frame, label_text, default_value, row):
         ttk.Label(frame, text=label_text).grid(row=row, column=0, sticky="w", pady=5)
@@ -115,7 +616,90 @@ class AutoClicker:
         self.check_random.grid(row=1, column=0, columnspan=2, sticky="w", pady=5)
         self.entry_random_mean = self.create_entry(frame, "Random Mean:", str(DEFAULT_RANDOM_MEAN), 2)
         self.entry_random_stdev = self.create_entry(frame, "Random Std Dev:", str(DEFAULT_RANDOM_STDEV), 3)
+        self.distribution_var = self.create_combobox(frame, "Distribution:", DISTRIBUTIONS, DEFAULT_DISTRIBUTION, 4)
+        self.entry_seed = self.create_entry(frame, "Seed (optional):", "", 5)
         self.update_random_fields_state()
+        self.missed_policy_var = self.create_combobox(frame, "Missed Clicks:", MISSED_POLICIES, DEFAULT_MISSED_POLICY, 6)
+
+    def create_sequence_settings(self, parent):
+        frame = ttk.LabelFrame(parent, text="Sequence", padding="10")
+        frame.pack(fill=tk.X, pady=10)
+
+        self.var_sequence = tk.IntVar()
+        ttk.Checkbutton(frame, text="Run Sequence", variable=self.var_sequence).grid(row=0, column=0, sticky="w", pady=5)
+        self.sequence_label = ttk.Label(frame, text="No steps")
+        self.sequence_label.grid(row=0, column=1, columnspan=3, sticky="w", pady=5)
+        ttk.Button(frame, text="Add Step", command=self.add_sequence_step).grid(row=1, column=0, padx=2)
+        ttk.Button(frame, text="Edit...", command=self.edit_sequence).grid(row=1, column=1, padx=2)
+        ttk.Button(frame, text="Load...", command=self.load_sequence_file).grid(row=1, column=2, padx=2)
+        ttk.Button(frame, text="Save...", command=self.save_sequence_file).grid(row=1, column=3, padx=2)
+
+    def set_sequence(self, sequence):
+        self.sequence = sequence
+        self.sequence.plan(self.backend)  # built now rather than when clicking starts
+        self.sequence_label.configure(text=f"{len(sequence)} steps" if len(sequence) else "No steps")
+
+    def add_sequence_step(self):
+        # A step from the current position, click type and interval fields
+        try:
+            x, y = self.entry_x.get(), self.entry_y.get()
+            step = {'click': self.click_type_var.get(), 'repeat': 1, 'delay': float(self.entry_interval.get())}
+            if x and y:
+                step['x'], step['y'] = int(x), int(y)
+            self.set_sequence(ClickSequence(self.sequence.steps + [step]))
+        except ValueError as e:
+            messagebox.showerror("Invalid Step", str(e))
+
+    def edit_sequence(self):
+        window = tk.Toplevel(self.root)
+        window.title("Sequence Steps")
+        window.geometry("420x400")
+        listbox = tk.Listbox(window, selectmode=tk.EXTENDED)
+        listbox.pack(fill=tk.BOTH, expand=True, padx=10, pady=10)
+
+        def describe(number, step):
+            target = f"({step['x']}, {step['y']})" if step.get('x') is not None else "cursor"
+            return (f"{number}. {step.get('click', DEFAULT_CLICK_TYPE)} x{step.get('repeat', 1)} at {target}, "
+                    f"then {step.get('delay', DEFAULT_INTERVAL)} s")
+
+        def refresh():
+            steps = self.sequence.steps
+            listbox.delete(0, tk.END)
+            listbox.insert(tk.END, *[describe(number, step) for number, step in enumerate(steps[:SEQUENCE_PREVIEW_STEPS], 1)])
+            if len(steps) > SEQUENCE_PREVIEW_STEPS:
+                listbox.insert(tk.END, f"... and {len(steps) - SEQUENCE_PREVIEW_STEPS} more steps")
+
+        def remove():
+            selected = {index for index in listbox.curselection() if index < SEQUENCE_PREVIEW_STEPS}
+            self.set_sequence(ClickSequence([step for index, step in enumerate(self.sequence.steps) if index not in selected]))
+            refresh()
+
+        def clear():
+            self.set_sequence(ClickSequence([]))
+            refresh()
+
+        buttons = ttk.Frame(window)
+        buttons.pack(fill=tk.X, padx=10, pady=(0, 10))
+        ttk.Button(buttons, text="Remove Selected", command=remove).pack(side=tk.LEFT, padx=5)
+        ttk.Button(buttons, text="Clear", command=clear).pack(side=tk.LEFT, padx=5)
+        refresh()
+
+    def load_sequence_file(self):
+        path = filedialog.askopenfilename(filetypes=[("Click sequences", "*.json"), ("All files", "*.*")])
+        if not path:
+            return
+        try:
+            self.set_sequence(load_sequence(path))
+        except (OSError, ValueError, TypeError, AttributeError) as e:
+            messagebox.showerror("Invalid Sequence", f"Cannot load {path}: {e}")
+
+    def save_sequence_file(self):
+        path = filedialog.asksaveasfilename(defaultextension=".json", filetypes=[("Click sequences", "*.json")])
+        if path:
+            try:
+                save_sequence(path, self.sequence)
+            except OSError as e:
+                messagebox.showerror("Auto Clicker", f"Cannot save {path}: {e}")
 
     def create_control_buttons(self, parent):
         frame = ttk.Frame(parent)
@@ -144,7 +728,7 @@ class AutoClicker:
         self.click_count_label.pack(anchor="w")
 
     def capture_mouse_position(self):
-        x, y = pyautogui.position()
+        x, y = self.backend.position()
         self.entry_x.delete(0, tk.END)
         self.entry_x.insert(0, str(x))
         self.entry_y.delete(0, tk.END)
@@ -154,6 +738,7 @@ class AutoClicker:
         state = tk.NORMAL if self.var_random.get() else tk.DISABLED
         self.entry_random_mean.config(state=state)
         self.entry_random_stdev.config(state=state)
+        self.entry_seed.config(state=state)
 
     def apply_settings(self):
         try:
@@ -168,17 +753,33 @@ class AutoClicker:
             if self.use_random:
                 self.random_mean = float(self.entry_random_mean.get())
                 self.random_stdev = float(self.entry_random_stdev.get())
+                if self.random_mean <= 0 or self.random_stdev < 0:
+                    raise ValueError("the random mean must be positive and the std dev not negative")
+                if self.distribution_var.get() not in DISTRIBUTIONS:
+                    raise ValueError(f"unknown distribution {self.distribution_var.get()!r}")
+                self.distribution = self.distribution_var.get()
+                seed = self.entry_seed.get().strip()
+                self.seed = int(seed) if seed else None
 
             self.max_clicks = int(self.entry_max_clicks.get())
+            if self.click_type_var.get() not in CLICK_TYPES:
+                raise ValueError(f"unknown click type {self.click_type_var.get()!r}")
             self.click_type = self.click_type_var.get()
+            if self.missed_policy_var.get() not in MISSED_POLICIES:
+                raise ValueError(f"unknown missed clicks policy {self.missed_policy_var.get()!r}")
+            self.missed_policy = self.missed_policy_var.get()
+            self.use_sequence = self.var_sequence.get() == 1
+            self.clicks_per_batch = int(self.entry_clicks_per_batch.get())
+            if self.clicks_per_batch < 1:
+                raise ValueError("clicks per batch must be at least 1")
 
             x = self.entry_x.get()
             y = self.entry_y.get()
             self.click_position = (int(x), int(y)) if x and y else (None, None)
 
             messagebox.showinfo("Auto Clicker", "Settings applied successfully.")
-        except ValueError:
-            messagebox.showerror("Invalid Input", "Please enter valid numbers.")
+        except ValueError as e:
+            messagebox.showerror("Invalid Input", str(e))
 
     def bind_hotkey(self):
         keyboard.add_hotkey(self.hotkey, self.toggle_clicking)
@@ -190,61 +791,63 @@ class AutoClicker:
             self.start_clicking()
 
     def start_clicking(self):
+        if self.clicking:
+            return
+        # Built here so bad settings are reported before the run starts
+        intervals = None
+        if self.use_random and not self.use_sequence:
+            try:
+                intervals = IntervalSchedule(self.distribution, self.random_mean, self.random_stdev, self.seed)
+            except ValueError as e:
+                messagebox.showerror("Invalid Input", str(e))
+                return
         self.clicking = True
+        # A fresh event per run, so a run still finishing its last click never sees the next one's
+        self.stop_event = threading.Event()
         self.click_count = 0
         self.update_status("Running")
         self.update_click_count()
-        threading.Thread(target=self.perform_clicking, daemon=True).start()
-
-    def perform_clicking(self):
-        click_funcs = {
-            "left": self.left_click,
-            "right": self.right_click,
-            "double": self.double_click
-        }
-        click_func = click_funcs[self.click_type]
-        
-        start_time = time.perf_counter()
-        click_counter = 0
-        
-        while self.clicking and (self.max_clicks == 0 or self.click_count < self.max_clicks):
-            current_time = time.perf_counter()
-            elapsed = current_time - start_time
-            
-            if elapsed >= self.interval * click_counter:
-                x, y = self.click_position if self.click_position != (None, None) else pyautogui.position()
-                click_func(x, y)
-                click_counter += 1
-                self.click_count += 1
-                
-                if self.interval < 0.1:
-                    if click_counter % 10 == 0:
-                        self.root.after(0, self.update_click_count)
-                else:
-                    self.root.after(0, self.update_click_count)
-            
-            # Yield to other threads briefly
-            time.sleep(0)
-        
-        self.stop_clicking()
+        threading.Thread(target=self.perform_clicking, args=(self.stop_event, intervals), daemon=True).start()
+
+    def perform_clicking(self, stop_event, intervals=None):
+        def on_click(clicks):
+            self.click_count = clicks
+            # At most ten label updates a second, however fast the clicks go
+            now = time.perf_counter()
+            if now - self.count_updated >= 0.1:
+                self.count_updated = now
+                self.root.after(0, self.update_click_count)
+
+        if self.use_sequence:
+            run_sequence(self.backend, stop_event, self.sequence, self.max_clicks, self.missed_policy, on_click)
+            if not stop_event.is_set():
+                self.root.after(0, self.stop_clicking)  # reached max clicks or had no steps
+            return
+
+        try:
+            run_clicks(self.backend, stop_event, self.interval, self.click_type, self.click_position,
+                       self.max_clicks, self.missed_policy, on_click, self.clicks_per_batch, intervals)
+        finally:
+            if intervals:
+                intervals.close()
+
+        if not stop_event.is_set():
+            self.root.after(0, self.stop_clicking)  # reached max clicks
 
     def left_click(self, x, y):
-        user32.SetCursorPos(x, y)
-        user32.mouse_event(MOUSEEVENTF_LEFTDOWN, 0, 0, 0, 0)
-        user32.mouse_event(MOUSEEVENTF_LEFTUP, 0, 0, 0, 0)
+        self.backend.click(x, y, "left")
 
     def right_click(self, x, y):
-        user32.SetCursorPos(x, y)
-        user32.mouse_event(MOUSEEVENTF_RIGHTDOWN, 0, 0, 0, 0)
-        user32.mouse_event(MOUSEEVENTF_RIGHTUP, 0, 0, 0, 0)
+        self.backend.click(x, y, "right")
 
     def double_click(self, x, y):
-        self.left_click(x, y)
-        self.left_click(x, y)
+        self.backend.click(x, y, "left", 2)
 
     def stop_clicking(self):
         self.clicking = False
+        self.stop_event.set()
         self.update_status("Stopped")
+        self.update_click_count()
 
     def update_status(self, status):
         color = self.style.colors.success if status == "Running" else self.style.colors.danger
@@ -280,7 +883,9 @@ class AutoClicker:
         self.indicator_font.configure(size=self.min_font_size)
 
     def update_click_count(self):
-        self.click_count_label.configure(text=f"Clicks: {self.click_count}")
+        # A double click is two button clicks; sequences mix click types, so they report button clicks
+        rate = self.backend.achieved_rate() / (1 if self.use_sequence else CLICK_TYPES[self.click_type][1])
+        self.click_count_label.configure(text=f"Clicks: {self.click_count} ({rate:.1f}/s)" if rate else f"Clicks: {self.click_count}")
 
     def minimize_to_tray(self):
         icon_image = Image.new("RGB", (64, 64), (255, 0, 0))
@@ -299,6 +904,17 @@ class AutoClicker:
 
 # Run the application
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Auto Clicker")
+    parser.add_argument('--backend', choices=sorted(INPUT_BACKENDS), default=default_backend_name(),
+                        help="how clicks are sent (default: win32 on Windows, xtest with an X display, else null)")
+    args = parser.parse_args()
+
+    try:
+        backend = INPUT_BACKENDS[args.backend]()
+    except OSError as e:
+        print(f"Cannot use the {args.backend} backend: {e}")
+        sys.exit(1)
+    load_gui_modules()
     root = ttkb.Window(themename="flatly")
-    app = AutoClicker(root)
+    app = AutoClicker(root, backend)
     root.mainloop()
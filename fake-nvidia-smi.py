@@ -0,0 +1,51 @@
+#!/usr/bin/env python3
+# A stand-in for nvidia-smi for running gpu-monitor.py's nvidia-smi backends
+# without a GPU: python gpu-monitor.py --backend nvidia-smi-stream --smi-path ./fake-nvidia-smi.py
+# It answers the static query, the plain banner and looping --query-gpu and
+# --query-compute-apps queries for FAKE_SMI_GPUS devices. Like the real binary
+# on some drivers, every compute-app row gets its own timestamp, a millisecond
+# apart. Every fourth iteration lists no apps, and FAKE_SMI_DIE_AFTER=SECONDS
+# makes a looping query exit with an error after that long, to test restarts.
+import sys
+import os
+import time
+import datetime
+
+GPUS = int(os.environ.get('FAKE_SMI_GPUS', '2'))
+DIE_AFTER = float(os.environ.get('FAKE_SMI_DIE_AFTER', '0'))
+
+def timestamp():
+    return datetime.datetime.now().strftime('%Y/%m/%d %H:%M:%S.%f')[:-3]
+
+def main(args):
+    query = next((arg for arg in args if arg.startswith('--query')), None)
+    loop_ms = next((int(arg.split('=', 1)[1]) for arg in args if arg.startswith('--loop-ms=')), None)
+    if query is None:
+        print("| NVIDIA-SMI 550.54    Driver Version: 550.54    CUDA Version: 12.4 |")
+        return 0
+    if query.startswith('--query-gpu=index,uuid'):
+        for index in range(GPUS):
+            print(f"{index}, GPU-fake-{index}, Fake RTX {index}, 550.54, 2100, 10501, 4, 16, 100.00, 450.00, 350.00, [N/A]")
+        return 0
+
+    start = time.time()
+    tick = 0
+    while True:
+        if query.startswith('--query-gpu'):
+            for index in range(GPUS):
+                print(f"{index}, {4000 + tick}, 24576, {tick % 100}, 250.5, 350.00, 60, 1800, 10501, 70, 4, 16", flush=True)
+        elif tick % 4 != 3:
+            for index in range(GPUS):
+                # The first process name contains ", " like a command line can
+                name = "/usr/bin/python3 train, epoch 1.py" if index == 0 else "python3"
+                print(f"{timestamp()}, GPU-fake-{index}, {111 * (index + 1)}, {name}, {8000 // (index + 1)}", flush=True)
+                time.sleep(0.001)
+        tick += 1
+        if DIE_AFTER and time.time() - start > DIE_AFTER:
+            return 1
+        if loop_ms is None:
+            return 0
+        time.sleep(loop_ms / 1000)
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -1,58 +1,2837 @@
-import tkinter as tk
-import ttkbootstrap as ttk
-from ttkbootstrap.constants import *
 import pynvml
 import psutil
 import threading
+import queue
 import time
-from matplotlib.figure import Figure
-from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
 import subprocess
 import re
-import matplotlib.dates as mdates
+import socket
+import struct
 import datetime
+import sys
+import os
+import json
+import gzip
+import signal
+import heapq
+from http.server import HTTPServer, BaseHTTPRequestHandler
+import argparse
+import math
+import numpy as np
+from collections import namedtuple, deque
+from types import MappingProxyType
+from concurrent.futures import ThreadPoolExecutor, wait
+try:
+    import fcntl
+except ImportError:
+    fcntl = None  # Windows; the history directory is then not locked
+
+def load_gui_modules():
+    # tkinter, ttkbootstrap and matplotlib are only imported when a window or a graph
+    # is actually built, so the headless exporter never loads the GUI stack
+    global tk, ttk, Figure, Polygon, FigureCanvasTkAgg, mdates
+    import tkinter as tk
+    import ttkbootstrap as ttk
+    from matplotlib.figure import Figure
+    from matplotlib.patches import Polygon
+    from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
+    import matplotlib.dates as mdates
+
+# Values reported when a sample cannot be taken, chosen so the ratios used by
+# the health checks never divide by zero
+DEFAULT_GPU_INFO = {
+    'memory_used': 0,
+    'memory_total': 1,
+    'memory_percent': 0,
+    'gpu_util': 0,
+    'power_draw': 0,
+    'power_limit': 1,
+    'temperature': 0,
+    'gpu_clock': 0,
+    'gpu_clock_percent': 0,
+    'memory_clock': 0,
+    'cuda_util': 0,
+    'mem_util': 0,
+    'mem_bandwidth': 0,
+    'mem_throughput': 0,
+    'pcie_bandwidth': 0,
+    'pcie_max_bandwidth': 0,
+    'pcie_tx': 0,
+    'pcie_rx': 0,
+    'pcie_util': 0,
+    'pcie_link_percent': 100,
+    'power_percent': 0,
+    'flops_per_watt': 0,
+    'is_throttling': False
+}
+
+# Usable PCIe bandwidth per lane and direction in GB/s, by link generation
+PCIE_LANE_BANDWIDTH = {1: 0.25, 2: 0.5, 3: 0.985, 4: 1.969, 5: 3.938, 6: 7.563}
+
+def pcie_link_bandwidth(gen, width):
+    return PCIE_LANE_BANDWIDTH.get(gen, 0) * width
+
+def build_gpu_info(memory_used, memory_total, gpu_util, power_draw, power_limit, temperature,
+                   gpu_clock, memory_clock, mem_util, pcie_gen, pcie_width, profile, pcie_tx=0.0, pcie_rx=0.0):
+    memory_percent = round((memory_used / memory_total) * 100, 2)
+
+    # Memory bandwidth available at the current memory clock, and the share of it
+    # the memory controller reports busy
+    mem_bandwidth = (memory_clock * 2 * profile['memory_bus_width']) / 8 / 1000  # GB/s
+    mem_throughput = mem_bandwidth * mem_util / 100
+
+    # PCIe link capacity at the current and the maximum link state, against the
+    # measured traffic (pcie_tx/pcie_rx in GB/s, per direction)
+    pcie_bandwidth = pcie_link_bandwidth(pcie_gen, pcie_width)
+    pcie_max_bandwidth = pcie_link_bandwidth(profile['pcie_max_gen'], profile['pcie_max_width']) or pcie_bandwidth
+    pcie_util = max(pcie_tx, pcie_rx) / pcie_bandwidth * 100 if pcie_bandwidth > 0 else 0
+
+    # Estimate FLOPS (one FMA per CUDA core per clock)
+    flops = (profile['cuda_cores'] * gpu_clock * 2) / 1e6  # GFLOPS
+
+    # Calculate FLOPS/Watt
+    flops_per_watt = flops / power_draw if power_draw > 0 else 0
+
+    # Calculate GPU clock percentage
+    max_clock_speed = profile['max_sm_clock']
+    gpu_clock_percent = (gpu_clock / max_clock_speed) * 100 if max_clock_speed > 0 else 0
+
+    return {
+        'memory_used': memory_used,
+        'memory_total': memory_total,
+        'memory_percent': memory_percent,
+        'gpu_util': gpu_util,
+        'power_draw': power_draw,
+        'power_limit': power_limit,
+        'temperature': temperature,
+        'gpu_clock': gpu_clock,
+        'gpu_clock_percent': gpu_clock_percent,
+        'memory_clock': memory_clock,
+        'cuda_util': gpu_util,  # Assuming CUDA utilization is same as GPU utilization
+        'mem_util': mem_util,  # Memory controller utilization
+        'mem_bandwidth': round(mem_bandwidth, 2),
+        'mem_throughput': round(mem_throughput, 2),
+        'pcie_bandwidth': round(pcie_bandwidth, 2),
+        'pcie_max_bandwidth': round(pcie_max_bandwidth, 2),
+        'pcie_tx': round(pcie_tx, 3),
+        'pcie_rx': round(pcie_rx, 3),
+        'pcie_util': round(pcie_util, 1),
+        'pcie_link_percent': round(pcie_bandwidth / pcie_max_bandwidth * 100, 1) if pcie_max_bandwidth > 0 else 100,
+        'power_percent': round(power_draw / power_limit * 100, 1) if power_limit > 0 else 0,
+        'flops_per_watt': round(flops_per_watt, 2),
+        'is_throttling': temperature > 80  # Assuming throttling occurs above 80°C
+    }
+
+def get_status(value, thresholds, reverse=False):
+    if isinstance(value, (int, float)):
+        if reverse:
+            if value > thresholds[0]:
+                return "OK"
+            elif value > thresholds[1]:
+                return "Warning"
+            else:
+                return "Critical"
+        else:
+            if value < thresholds[0]:
+                return "OK"
+            elif value < thresholds[1]:
+                return "Warning"
+            else:
+                return "Critical"
+    return "Unknown"
+
+# Health rules, judged over time rather than per sample. A rule is raised once
+# all of its `when` conditions (gpu_info key, '>', '>=', '<' or '<=', threshold)
+# have held for `for` seconds, and cleared once they have stopped holding for
+# `clear_for` seconds. While a rule is raised its conditions are checked against
+# the `clear` thresholds instead, so a value hovering at the limit does not
+# flap. A raised "critical" rule makes a GPU "Poor", a "warning" makes it "Fair".
+DEFAULT_RULES = [
+    {'name': "High temperature", 'severity': 'critical',
+     'when': [('temperature', '>', 80)], 'clear': [75], 'for': 30},
+    {'name': "Running warm", 'severity': 'warning',
+     'when': [('temperature', '>', 70)], 'clear': [67], 'for': 60},
+    {'name': "High memory usage", 'severity': 'critical',
+     'when': [('memory_percent', '>', 95)], 'clear': [90], 'for': 10},
+    {'name': "Memory filling up", 'severity': 'warning',
+     'when': [('memory_percent', '>', 80)], 'clear': [75], 'for': 60},
+    {'name': "High power usage", 'severity': 'critical',
+     'when': [('power_percent', '>', 95)], 'clear': [90], 'for': 10},
+    {'name': "Power near limit", 'severity': 'warning',
+     'when': [('power_percent', '>', 80)], 'clear': [75], 'for': 60},
+    {'name': "Low GPU clock while under load", 'severity': 'warning',
+     'when': [('gpu_util', '>', 50), ('gpu_clock_percent', '<', 10)], 'clear': [40, 15], 'for': 5},
+    {'name': "PCIe link saturated", 'severity': 'warning',
+     'when': [('pcie_util', '>', 90)], 'clear': [80], 'for': 10},
+    # Links train down to save power when idle, but not while the GPU is busy
+    {'name': "PCIe link below its maximum", 'severity': 'warning',
+     'when': [('gpu_util', '>', 50), ('pcie_link_percent', '<', 100)], 'clear': [40, 100], 'for': 30}
+]
+
+SEVERITIES = ('warning', 'critical')
+RULE_OPERATORS = {'>': (1, True), '>=': (1, False), '<': (-1, True), '<=': (-1, False)}
+
+def load_rules(path):
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+def alert_health(alerts):
+    # Overall health of a GPU from its raised (rule, severity) pairs
+    severities = {severity for _, severity in alerts}
+    if 'critical' in severities:
+        return "Poor"
+    if 'warning' in severities:
+        return "Fair"
+    return "Good"
+
+AlertEvent = namedtuple('AlertEvent', ['time', 'gpu', 'rule', 'severity', 'state', 'value'])
+
+class RuleEngine:
+    # Evaluates every rule for every GPU in one pass of array operations. All
+    # conditions are flattened into arrays (metric column, sign, threshold), the
+    # latest sample of each device becomes one row of a value matrix, and each
+    # rule is the AND of its slice of conditions. How long a rule has held (or
+    # stopped holding) is kept as a start time per (device, rule), so windows of
+    # any length cost nothing extra per tick.
+    def __init__(self, rules, devices, log_length=1000):
+        self.rules = rules
+        self.metrics = sorted({metric for rule in rules for metric, _, _ in rule['when']})
+        columns, signs, strict, fire, clear, starts = [], [], [], [], [], []
+        for rule in rules:
+            if rule['severity'] not in SEVERITIES:
+                raise ValueError(f"Rule {rule['name']!r}: severity must be one of {', '.join(SEVERITIES)}")
+            starts.append(len(columns))
+            clear_values = rule.get('clear') or [threshold for _, _, threshold in rule['when']]
+            if len(clear_values) != len(rule['when']):
+                raise ValueError(f"Rule {rule['name']!r}: 'clear' needs one threshold per 'when' condition")
+            for (metric, op, threshold), clear_threshold in zip(rule['when'], clear_values):
+                if metric not in DEFAULT_GPU_INFO:
+                    raise ValueError(f"Rule {rule['name']!r}: unknown metric {metric!r}")
+                if op not in RULE_OPERATORS:
+                    raise ValueError(f"Rule {rule['name']!r}: unknown operator {op!r}")
+                sign, is_strict = RULE_OPERATORS[op]
+                columns.append(self.metrics.index(metric))
+                signs.append(sign)
+                strict.append(is_strict)
+                # Thresholds are stored pre-multiplied by the sign, so every
+                # condition becomes "signed value > signed threshold"
+                fire.append(sign * threshold)
+                clear.append(sign * clear_threshold)
+
+        self.columns = np.array(columns, dtype=np.intp)
+        self.signs = np.array(signs, dtype=np.float64)
+        self.strict = np.array(strict)
+        self.fire_thresholds = np.array(fire, dtype=np.float64)
+        self.clear_thresholds = np.array(clear, dtype=np.float64)
+        self.starts = np.array(starts, dtype=np.intp)
+        self.condition_rules = np.repeat(np.arange(len(rules)), np.diff(np.append(self.starts, len(columns))))
+        self.raise_after = np.array([rule.get('for', 0) for rule in rules], dtype=np.float64)
+        self.clear_after = np.array([rule.get('clear_for', 0) for rule in rules], dtype=np.float64)
+        self.names = [rule['name'] for rule in rules]
+        self.severities = [rule['severity'] for rule in rules]
+
+        self.active = np.zeros((devices, len(rules)), dtype=bool)
+        self.held_since = np.full((devices, len(rules)), np.nan)
+        self.released_since = np.full((devices, len(rules)), np.nan)
+        self.log = deque(maxlen=log_length)
+
+    def evaluate(self, snapshot):
+        # Returns `snapshot` with the raised rules of every device and the alert
+        # events of this tick; devices missing from the snapshot keep their state
+        indices = np.array(sorted(snapshot.samples), dtype=np.intp)
+        if not len(indices) or not len(self.rules):
+            return snapshot._replace(alerts=self.alerts())
+        values = np.array([[snapshot.samples[index].gpu_info[metric] for metric in self.metrics]
+                           for index in indices], dtype=np.float64)
+
+        now = snapshot.time
+        active = self.active[indices]
+        signed = values[:, self.columns] * self.signs
+        thresholds = np.where(active[:, self.condition_rules], self.clear_thresholds, self.fire_thresholds)
+        met = np.where(self.strict, signed > thresholds, signed >= thresholds)
+        holds = np.logical_and.reduceat(met, self.starts, axis=1)
+
+        held_since = self.held_since[indices]
+        held_since = np.where(holds, np.where(np.isnan(held_since), now, held_since), np.nan)
+        released_since = self.released_since[indices]
+        released_since = np.where(holds, np.nan, np.where(np.isnan(released_since), now, released_since))
+        raised = ~active & holds & (now - held_since >= self.raise_after)
+        cleared = active & ~holds & (now - released_since >= self.clear_after)
+
+        self.active[indices] = (active | raised) & ~cleared
+        self.held_since[indices] = held_since
+        self.released_since[indices] = released_since
+
+        events = []
+        for state, changed in (('raised', raised), ('cleared', cleared)):
+            for row, rule in zip(*np.nonzero(changed)):
+                # The value of the rule's first condition, the one its name describes
+                value = values[row, self.columns[self.starts[rule]]]
+                events.append(AlertEvent(now, int(indices[row]), self.names[rule], self.severities[rule], state, float(value)))
+        self.log.extend(events)
+        return snapshot._replace(alerts=self.alerts(), events=tuple(events))
+
+    def alerts(self):
+        # Raised (rule, severity) pairs per device
+        return MappingProxyType({
+            index: tuple((self.names[rule], self.severities[rule]) for rule in np.flatnonzero(row))
+            for index, row in enumerate(self.active)
+        })
+
+def format_cuda_version(cuda_version):
+    # CUDA version is typically returned as an integer, e.g. 12020 for 12.2
+    return f"{cuda_version // 1000}.{(cuda_version % 1000) // 10}"
+
+CACHE_DIR = os.path.join(os.environ.get('XDG_CACHE_HOME', os.path.expanduser('~/.cache')), 'gpu-monitor')
+PROFILE_CACHE = os.path.join(CACHE_DIR, 'profiles.json')
+
+# What a device can do at most, probed once per device and driver. The defaults
+# are an RTX 3090 and only stand in for values the driver does not report.
+DEFAULT_DEVICE_PROFILE = {
+    'memory_bus_width': 384,  # bits
+    'cuda_cores': 10496,
+    'sm_count': 82,
+    'compute_capability': [8, 6],
+    'max_sm_clock': 1500,  # MHz
+    'max_memory_clock': 0,  # MHz
+    'pcie_max_gen': 0,
+    'pcie_max_width': 0,
+    'power_limit_min': 0,  # W
+    'power_limit_max': 0,  # W
+    'power_limit_default': 0  # W
+}
+
+# FP32 CUDA cores per SM by compute capability, for drivers that report the SM
+# count but not the core count
+CORES_PER_SM = {
+    (3, 0): 192, (3, 5): 192, (3, 7): 192,
+    (5, 0): 128, (5, 2): 128, (5, 3): 128,
+    (6, 0): 64, (6, 1): 128, (6, 2): 128,
+    (7, 0): 64, (7, 2): 64, (7, 5): 64,
+    (8, 0): 64, (8, 6): 128, (8, 7): 128, (8, 9): 128,
+    (9, 0): 128, (10, 0): 128, (12, 0): 128
+}
+
+def nvml_query(name, *args):
+    # One optional NVML call: None when the driver, the device or this pynvml
+    # version does not support it
+    query = getattr(pynvml, name, None)
+    if query is None:
+        return None
+    try:
+        return query(*args)
+    except pynvml.NVMLError:
+        return None
+
+def probe_device_profile(handle):
+    profile = dict(DEFAULT_DEVICE_PROFILE)
+
+    capability = nvml_query('nvmlDeviceGetCudaComputeCapability', handle)
+    if capability:
+        profile['compute_capability'] = list(capability)
+    attributes = nvml_query('nvmlDeviceGetAttributes', handle)
+    if attributes and attributes.multiprocessorCount:
+        profile['sm_count'] = attributes.multiprocessorCount
+
+    cores = nvml_query('nvmlDeviceGetNumGpuCores', handle)
+    if cores:
+        profile['cuda_cores'] = cores
+    elif attributes and capability and tuple(capability) in CORES_PER_SM:
+        profile['cuda_cores'] = profile['sm_count'] * CORES_PER_SM[tuple(capability)]
+
+    for key, name, args in (
+            ('memory_bus_width', 'nvmlDeviceGetMemoryBusWidth', ()),
+            ('max_sm_clock', 'nvmlDeviceGetMaxClockInfo', (pynvml.NVML_CLOCK_SM,)),
+            ('max_memory_clock', 'nvmlDeviceGetMaxClockInfo', (pynvml.NVML_CLOCK_MEM,)),
+            ('pcie_max_gen', 'nvmlDeviceGetMaxPcieLinkGeneration', ()),
+            ('pcie_max_width', 'nvmlDeviceGetMaxPcieLinkWidth', ())):
+        value = nvml_query(name, handle, *args)
+        if value:
+            profile[key] = value
+
+    constraints = nvml_query('nvmlDeviceGetPowerManagementLimitConstraints', handle)
+    if constraints:
+        profile['power_limit_min'], profile['power_limit_max'] = constraints[0] / 1000, constraints[1] / 1000
+    default_limit = nvml_query('nvmlDeviceGetPowerManagementDefaultLimit', handle)
+    if default_limit:
+        profile['power_limit_default'] = default_limit / 1000
+    return profile
+
+def load_device_profile(handle, uuid, driver_version, path=PROFILE_CACHE):
+    # Profiles are cached on disk by device UUID and driver version, so a restart
+    # skips the probing and a driver update probes again
+    key = f"{uuid}/{driver_version}"
+    try:
+        with open(path, encoding='utf-8') as f:
+            profiles = json.load(f)
+    except (OSError, ValueError):
+        profiles = {}
+    if key in profiles:
+        return dict(DEFAULT_DEVICE_PROFILE, **profiles[key])
+
+    profile = profiles[key] = probe_device_profile(handle)
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path + '.tmp', 'w', encoding='utf-8') as f:
+            json.dump(profiles, f, indent=1, sort_keys=True)
+        os.replace(path + '.tmp', path)
+    except OSError as e:
+        print(f"Could not cache the device profile in {path}: {e}")
+    return profile
+
+class SamplerBackend:
+    # A sampler produces one gpu_info dict (the keys of DEFAULT_GPU_INFO) and one
+    # process list ({'pid', 'name', 'type', 'gpu_memory'} dicts) per device and
+    # tick, plus the text shown in the System Information frame. Devices are
+    # addressed by index and may be sampled concurrently from worker threads.
+    # `host_processes` says whether the PIDs are real processes on this host that
+    # can be joined with psutil data.
+    host_processes = True
+
+    def device_count(self):
+        return 1
+
+    def get_gpu_info(self, index):
+        raise NotImplementedError
+
+    def get_process_info(self, index):
+        raise NotImplementedError
+
+    def get_process_utilization(self, index):
+        # (pid, sm_util, mem_util, enc_util, dec_util) samples taken since the
+        # previous call, or None when the backend cannot attribute utilization
+        return None
+
+    def get_system_info(self, index):
+        return "Unable to retrieve system information"
+
+    def get_device_name(self, index):
+        return f"GPU {index}"
+
+    def get_device_uuid(self, index):
+        # Stable identity of the device, used to key anything persisted per GPU
+        return f"GPU-{index}"
+
+    def get_cuda_version(self):
+        return "Unknown"
+
+    def get_ecc_info(self, index):
+        return "ECC Memory: Unknown"
+
+    def get_device_profile(self, index):
+        return dict(DEFAULT_DEVICE_PROFILE)
+
+    def close(self):
+        pass
+
+class NVMLBackend(SamplerBackend):
+    # Samples in-process through the NVML handle, so a tick costs a handful of
+    # library calls instead of two nvidia-smi forks
+    def __init__(self):
+        pynvml.nvmlInit()
+        self.handles = [pynvml.nvmlDeviceGetHandleByIndex(i) for i in range(pynvml.nvmlDeviceGetCount())]
+        driver_version = nvml_query('nvmlSystemGetDriverVersion') or 'unknown'
+        driver_version = driver_version.decode('utf-8') if isinstance(driver_version, bytes) else driver_version
+        self.profiles = [load_device_profile(handle, self.get_device_uuid(index), driver_version)
+                         for index, handle in enumerate(self.handles)]
+        # One name cache per device so workers sampling different GPUs never prune each other's entries
+        self.process_names = [{} for _ in self.handles]
+        # Newest process utilization sample read per device, in NVML's microsecond timestamps
+        self.utilization_seen = [0] * len(self.handles)
+
+    def device_count(self):
+        return len(self.handles)
+
+    def get_device_profile(self, index):
+        return self.profiles[index]
+
+    def get_pcie_throughput(self, index):
+        # PCIe traffic in GB/s per direction (TX is GPU to host). NVML counts KB/s
+        # over a 20 ms window; devices without the counters report zero.
+        handle = self.handles[index]
+        tx = nvml_query('nvmlDeviceGetPcieThroughput', handle, pynvml.NVML_PCIE_UTIL_TX_BYTES)
+        rx = nvml_query('nvmlDeviceGetPcieThroughput', handle, pynvml.NVML_PCIE_UTIL_RX_BYTES)
+        return (tx or 0) * 1024 / 1e9, (rx or 0) * 1024 / 1e9
+
+    def get_gpu_info(self, index):
+        try:
+            handle = self.handles[index]
+            mem_info = pynvml.nvmlDeviceGetMemoryInfo(handle)
+            utilization = pynvml.nvmlDeviceGetUtilizationRates(handle)
+            pcie_tx, pcie_rx = self.get_pcie_throughput(index)
+            return build_gpu_info(
+                memory_used=mem_info.used // (1024**2),  # MiB, as reported by nvidia-smi
+                memory_total=mem_info.total // (1024**2),
+                gpu_util=utilization.gpu,
+                power_draw=pynvml.nvmlDeviceGetPowerUsage(handle) / 1000,  # mW -> W
+                power_limit=pynvml.nvmlDeviceGetEnforcedPowerLimit(handle) / 1000,
+                temperature=pynvml.nvmlDeviceGetTemperature(handle, pynvml.NVML_TEMPERATURE_GPU),
+                gpu_clock=pynvml.nvmlDeviceGetClockInfo(handle, pynvml.NVML_CLOCK_SM),
+                memory_clock=pynvml.nvmlDeviceGetClockInfo(handle, pynvml.NVML_CLOCK_MEM),
+                mem_util=utilization.memory,
+                pcie_gen=pynvml.nvmlDeviceGetCurrPcieLinkGeneration(handle),
+                pcie_width=pynvml.nvmlDeviceGetCurrPcieLinkWidth(handle),
+                profile=self.profiles[index],
+                pcie_tx=pcie_tx,
+                pcie_rx=pcie_rx
+            )
+        except pynvml.NVMLError as e:
+            print(f"NVML Error in get_gpu_info: {e}")
+        except Exception as e:
+            print(f"Unexpected error in get_gpu_info: {e}")
+
+        return dict(DEFAULT_GPU_INFO)
+
+    def get_process_name(self, index, pid):
+        # Names are looked up once per PID; the cache is pruned to live PIDs every tick
+        names = self.process_names[index]
+        name = names.get(pid)
+        if name is None:
+            try:
+                name = pynvml.nvmlSystemGetProcessName(pid)
+                name = name.decode('utf-8') if isinstance(name, bytes) else name
+            except pynvml.NVMLError:
+                name = 'N/A'
+            names[pid] = name
+        return name
+
+    def get_process_info(self, index):
+        try:
+            processes = {}
+            for process_type, query in (('C', pynvml.nvmlDeviceGetComputeRunningProcesses),
+                                        ('G', pynvml.nvmlDeviceGetGraphicsRunningProcesses)):
+                for proc in query(self.handles[index]):
+                    existing = processes.get(proc.pid)
+                    if existing:
+                        # Same process holding both contexts, reported as C+G by nvidia-smi
+                        existing['type'] = 'C+G'
+                        continue
+                    used = proc.usedGpuMemory
+                    processes[proc.pid] = {
+                        'pid': proc.pid,
+                        'name': self.get_process_name(index, proc.pid),
+                        'type': process_type,
+                        'gpu_memory': used // (1024**2) if used is not None else 'N/A'
+                    }
+
+            names = self.process_names[index]
+            for pid in list(names):
+                if pid not in processes:
+                    del names[pid]
+
+            return list(processes.values())
+        except pynvml.NVMLError as e:
+            print(f"NVML Error in get_process_info: {e}")
+        except Exception as e:
+            print(f"Unexpected error in get_process_info: {e}")
+
+        return []
+
+    def get_process_utilization(self, index):
+        # NVML buffers a few seconds of per-process samples; asking only for those
+        # newer than the last one seen never returns a sample twice
+        try:
+            samples = pynvml.nvmlDeviceGetProcessUtilization(self.handles[index], self.utilization_seen[index])
+        except pynvml.NVMLError as e:
+            # pynvml raises NOT_FOUND, or SUCCESS from its size query, when nothing ran since the last call
+            if getattr(e, 'value', None) in (pynvml.NVML_SUCCESS, pynvml.NVML_ERROR_NOT_FOUND):
+                return []
+            return None
+        if samples:
+            self.utilization_seen[index] = max(sample.timeStamp for sample in samples)
+        return [(sample.pid, sample.smUtil, sample.memUtil, sample.encUtil, sample.decUtil) for sample in samples]
+
+    def get_system_info(self, index):
+        try:
+            gpu_name = self.get_device_name(index)
+            driver_version = pynvml.nvmlSystemGetDriverVersion()
+            cuda_version = pynvml.nvmlSystemGetCudaDriverVersion()
+
+            # Handle potential bytes objects
+            driver_version = driver_version.decode('utf-8') if isinstance(driver_version, bytes) else driver_version
+
+            return f"GPU: {gpu_name} | Driver: {driver_version} | CUDA: {format_cuda_version(cuda_version)}"
+        except pynvml.NVMLError as e:
+            print(f"NVML Error in get_system_info: {e}")
+        except Exception as e:
+            print(f"Unexpected error in get_system_info: {e}")
+
+        return "Unable to retrieve system information"
+
+    def get_device_name(self, index):
+        try:
+            gpu_name = pynvml.nvmlDeviceGetName(self.handles[index])
+            return gpu_name.decode('utf-8') if isinstance(gpu_name, bytes) else gpu_name
+        except pynvml.NVMLError as e:
+            print(f"Error getting GPU name: {e}")
+            return f"GPU {index}"
+
+    def get_device_uuid(self, index):
+        try:
+            uuid = pynvml.nvmlDeviceGetUUID(self.handles[index])
+            return uuid.decode('utf-8') if isinstance(uuid, bytes) else uuid
+        except pynvml.NVMLError as e:
+            print(f"Error getting GPU UUID: {e}")
+            return f"GPU-{index}"
+
+    def get_cuda_version(self):
+        try:
+            return format_cuda_version(pynvml.nvmlSystemGetCudaDriverVersion())
+        except pynvml.NVMLError as e:
+            print(f"Error getting CUDA version: {e}")
+            return "Unknown"
+
+    def get_ecc_info(self, index):
+        # Check ECC memory status if supported, otherwise show alternative info
+        try:
+            ecc_mode = pynvml.nvmlDeviceGetEccMode(self.handles[index])
+            ecc_status = "Enabled" if ecc_mode[0] == pynvml.NVML_FEATURE_ENABLED else "Disabled"
+            return f"ECC Memory: {ecc_status}"
+        except pynvml.NVMLError as e:
+            if str(e) == "Not Supported":
+                # ECC not supported, show memory type instead
+                try:
+                    mem_info = pynvml.nvmlDeviceGetMemoryInfo(self.handles[index])
+                    total_memory = mem_info.total / (1024**3)  # Convert to GB
+                    return f"GPU Memory: {total_memory:.2f} GB"
+                except pynvml.NVMLError as mem_error:
+                    print(f"Error getting memory info: {mem_error}")
+                    return "GPU Memory: Unknown"
+            print(f"Error getting ECC memory status: {e}")
+            return "ECC Memory: Unknown"
+
+    def close(self):
+        pynvml.nvmlShutdown()
+
+DEFAULT_SMI_PATH = os.environ.get('NVIDIA_SMI', 'nvidia-smi')
+SMI_STATIC_QUERY = ('index,uuid,name,driver_version,clocks.max.sm,clocks.max.memory,pcie.link.gen.max,'
+                    'pcie.link.width.max,power.min_limit,power.max_limit,power.default_limit,ecc.mode.current')
+SMI_APPS_QUERY = 'timestamp,gpu_uuid,pid,process_name,used_memory'
+SMI_SETTLE_SECONDS = 0.05  # a loop iteration prints all its lines within this
+SMI_RESTART_BACKOFF = (0.5, 30)  # first and longest wait before restarting a dead child
+
+def smi_number(value, default=0):
+    # nvidia-smi prints "[N/A]" or "[Not Supported]" for fields a device lacks
+    try:
+        return float(value)
+    except ValueError:
+        return default
+
+SMI_GPU_QUERY = ('memory.used,memory.total,utilization.gpu,power.draw,power.limit,temperature.gpu,clocks.sm,'
+                 'clocks.mem,utilization.memory,pcie.link.gen.current,pcie.link.width.current')
+
+def parse_smi_gpu_info(values, profile, pcie_tx=0.0, pcie_rx=0.0):
+    # One --query-gpu=SMI_GPU_QUERY row, split into its fields
+    if len(values) != 11:
+        raise ValueError(f"Expected 11 values from nvidia-smi, got {len(values)}")
+
+    return build_gpu_info(
+        memory_used=int(values[0]),
+        memory_total=int(values[1]),
+        gpu_util=int(values[2]),
+        power_draw=float(values[3]),
+        power_limit=float(values[4]),
+        temperature=int(values[5]),
+        gpu_clock=int(values[6]),
+        memory_clock=int(values[7]),
+        mem_util=int(values[8]),
+        pcie_gen=int(values[9]),
+        pcie_width=int(values[10]),
+        profile=profile,
+        pcie_tx=pcie_tx,
+        pcie_rx=pcie_rx
+    )
+
+class NvidiaSmiBackend(NVMLBackend):
+    # The original sampler: forks nvidia-smi twice per tick and parses its text
+    # output. Kept as a fallback for drivers whose NVML reports are incomplete.
+    def __init__(self, smi_path=DEFAULT_SMI_PATH):
+        super().__init__()
+        self.smi_path = smi_path
+
+    def get_gpu_info(self, index):
+        try:
+            result = subprocess.run([self.smi_path, '-i', str(index), f'--query-gpu={SMI_GPU_QUERY}', '--format=csv,noheader,nounits'], capture_output=True, text=True, check=True)
+            # nvidia-smi has no query field for PCIe traffic, so that still comes from NVML
+            return self.parse_gpu_info(result.stdout, self.profiles[index], *self.get_pcie_throughput(index))
+        except subprocess.CalledProcessError as e:
+            print(f"Error running nvidia-smi: {e}")
+            print(f"nvidia-smi output: {e.output}")
+        except ValueError as e:
+            print(f"Error parsing nvidia-smi output: {e}")
+        except Exception as e:
+            print(f"Unexpected error in get_gpu_info: {e}")
+
+        # Return default values if any error occurs
+        return dict(DEFAULT_GPU_INFO)
+
+    def parse_gpu_info(self, output, profile, pcie_tx=0.0, pcie_rx=0.0):
+        return parse_smi_gpu_info(output.strip().split(', '), profile, pcie_tx, pcie_rx)
+
+    def get_process_info(self, index):
+        try:
+            result = subprocess.run([self.smi_path, '-i', str(index), '-q', '-d', 'PIDS'], capture_output=True, text=True, check=True)
+            return self.parse_process_info(result.stdout)
+        except subprocess.CalledProcessError as e:
+            print(f"Error running nvidia-smi for process info: {e}")
+            print(f"nvidia-smi output: {e.output}")
+        except Exception as e:
+            print(f"Unexpected error in get_process_info: {e}")
+
+        return []
+
+    def parse_process_info(self, output):
+        processes = []
+        current_process = {}
+        for line in output.split('\n'):
+            line = line.strip()
+            if line.startswith("Process ID"):
+                if current_process:
+                    processes.append(current_process)
+                current_process = {'pid': int(line.split()[-1])}
+            elif line.startswith("Type"):
+                current_process['type'] = line.split()[-1]
+            elif line.startswith("Name"):
+                current_process['name'] = ' '.join(line.split()[2:])
+            elif line.startswith("Used GPU Memory"):
+                mem_str = line.split(':')[-1].strip()
+                if mem_str == 'N/A':
+                    current_process['gpu_memory'] = 'N/A'
+                else:
+                    match = re.search(r'\d+', mem_str)
+                    if match:
+                        current_process['gpu_memory'] = int(match.group())
+                    else:
+                        current_process['gpu_memory'] = 'N/A'
+
+        if current_process:
+            processes.append(current_process)
+
+        return processes
+
+class NvidiaSmiStreamBackend(SamplerBackend):
+    # For hosts where only the nvidia-smi binary works. Instead of two forks per
+    # device and tick it keeps two nvidia-smi children running with --loop-ms, one
+    # for --query-gpu and one for --query-compute-apps, parses their CSV as the
+    # lines arrive and answers every get_* call from the latest values. A child
+    # that exits is restarted with backoff. Static info comes from one query at
+    # start-up. Graphics-only processes are not listed by the compute-apps query,
+    # and there is no PCIe traffic without NVML. fake-nvidia-smi.py stands in for
+    # the binary with --smi-path to exercise it without a GPU.
+    def __init__(self, smi_path=DEFAULT_SMI_PATH, loop_ms=1000):
+        self.smi_path = smi_path
+        self.loop_ms = loop_ms
+        self.period = loop_ms / 1000
+        self.closed = False
+        self.lock = threading.Lock()
+
+        try:
+            result = subprocess.run([smi_path, f'--query-gpu={SMI_STATIC_QUERY}', '--format=csv,noheader,nounits'],
+                                    capture_output=True, text=True, check=True)
+        except subprocess.CalledProcessError as e:
+            raise RuntimeError(f"nvidia-smi exited with status {e.returncode}: "
+                               f"{(e.stderr or e.stdout).strip() or 'no output'}") from None
+        self.static = []
+        self.profiles = []
+        for line in result.stdout.strip().splitlines():
+            values = [value.strip() for value in line.split(', ')]
+            if len(values) != len(SMI_STATIC_QUERY.split(',')):
+                raise ValueError(f"Unexpected nvidia-smi output: {line!r}")
+            self.static.append({'uuid': values[1], 'name': values[2], 'driver': values[3], 'ecc': values[11]})
+            self.profiles.append(dict(
+                DEFAULT_DEVICE_PROFILE,
+                max_sm_clock=smi_number(values[4], DEFAULT_DEVICE_PROFILE['max_sm_clock']),
+                max_memory_clock=smi_number(values[5]),
+                pcie_max_gen=int(smi_number(values[6])),
+                pcie_max_width=int(smi_number(values[7])),
+                power_limit_min=smi_number(values[8]),
+                power_limit_max=smi_number(values[9]),
+                power_limit_default=smi_number(values[10])
+            ))
+        self.indices = {info['uuid']: index for index, info in enumerate(self.static)}
+        self.cuda_version = self.query_cuda_version()
+
+        self.gpu_infos = {}  # index -> (monotonic time, gpu_info)
+        self.apps = ([], [])  # (complete batch, batch being read)
+        self.apps_started = self.apps_seen = 0
+        self.children = {}
+        self.threads = [
+            threading.Thread(target=self.follow, args=('gpu', [f'--query-gpu=index,{SMI_GPU_QUERY}'], self.on_gpu_line),
+                             daemon=True, name="nvidia-smi-gpu"),
+            threading.Thread(target=self.follow, args=('apps', [f'--query-compute-apps={SMI_APPS_QUERY}'], self.on_apps_line),
+                             daemon=True, name="nvidia-smi-apps")
+        ]
+        for thread in self.threads:
+            thread.start()
+
+        # Give the children a moment to report, so the first tick has real values
+        deadline = time.monotonic() + self.period + 2
+        while len(self.gpu_infos) < len(self.static) and time.monotonic() < deadline:
+            time.sleep(0.05)
+
+    def query_cuda_version(self):
+        # Only the plain nvidia-smi banner shows the CUDA version
+        try:
+            result = subprocess.run([self.smi_path], capture_output=True, text=True, timeout=10)
+            match = re.search(r'CUDA Version:\s*([\d.]+)', result.stdout)
+            return match.group(1) if match else "Unknown"
+        except (OSError, subprocess.SubprocessError) as e:
+            print(f"Error getting CUDA version from nvidia-smi: {e}")
+            return "Unknown"
+
+    def follow(self, name, query, on_line):
+        # Keeps one looping nvidia-smi child alive and feeds its lines to on_line
+        backoff = SMI_RESTART_BACKOFF[0]
+        while not self.closed:
+            started = time.monotonic()
+            try:
+                child = subprocess.Popen([self.smi_path, *query, '--format=csv,noheader,nounits', f'--loop-ms={self.loop_ms}'],
+                                         stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True, bufsize=1)
+                self.children[name] = child
+                for line in child.stdout:
+                    try:
+                        on_line(line)
+                    except (ValueError, IndexError) as e:
+                        print(f"Error parsing nvidia-smi {name} output {line.strip()!r}: {e}")
+                child.wait()
+            except OSError as e:
+                print(f"Error starting nvidia-smi: {e}")
+            if self.closed:
+                break
+            if time.monotonic() - started > SMI_RESTART_BACKOFF[1]:
+                backoff = SMI_RESTART_BACKOFF[0]  # it ran fine for a while, restart promptly
+            print(f"nvidia-smi {name} stream ended, restarting in {backoff:g} s")
+            time.sleep(backoff)
+            backoff = min(backoff * 2, SMI_RESTART_BACKOFF[1])
+
+    def on_gpu_line(self, line):
+        values = [value.strip() for value in line.strip().split(', ')]
+        index = int(values[0])
+        gpu_info = parse_smi_gpu_info(values[1:], self.profiles[index])
+        with self.lock:
+            self.gpu_infos[index] = (time.monotonic(), gpu_info)
+
+    def on_apps_line(self, line):
+        _, uuid, pid, rest = line.strip().split(', ', 3)
+        name, used = rest.rsplit(', ', 1)  # the name itself may contain ", "
+        process = {
+            'pid': int(pid),
+            'name': name,
+            'type': 'C',
+            'gpu_memory': int(used) if used.isdigit() else 'N/A'
+        }
+        now = time.monotonic()
+        with self.lock:
+            complete, current = self.apps
+            # The lines of one loop iteration arrive together, but nvidia-smi may stamp
+            # every device or row separately, so a batch ends at a pause in the output
+            # or after one loop period rather than on a new timestamp
+            if now - self.apps_seen > min(SMI_SETTLE_SECONDS, self.period / 2) or now - self.apps_started >= self.period:
+                complete, current = current, []
+                self.apps_started = now
+            current.append((self.indices.get(uuid), process))
+            self.apps = (complete, current)
+            self.apps_seen = now
+
+    def device_count(self):
+        return len(self.static)
+
+    def get_gpu_info(self, index):
+        with self.lock:
+            sampled, gpu_info = self.gpu_infos.get(index, (None, None))
+        if sampled is None or time.monotonic() - sampled > max(5 * self.period, 5):
+            return dict(DEFAULT_GPU_INFO)  # no sample yet, or the stream has stalled
+        return dict(gpu_info)
+
+    def get_process_info(self, index):
+        now = time.monotonic()
+        with self.lock:
+            complete, current = self.apps
+            # An iteration with no compute apps prints nothing, so a batch older than
+            # one period means the list is empty now
+            if now - self.apps_seen > self.period * 1.5 + SMI_SETTLE_SECONDS:
+                return []
+            batch = current if now - self.apps_started > SMI_SETTLE_SECONDS else complete
+        return [dict(process) for gpu, process in batch if gpu == index]
+
+    def get_system_info(self, index):
+        info = self.static[index]
+        return f"GPU: {info['name']} | Driver: {info['driver']} | CUDA: {self.cuda_version}"
+
+    def get_device_name(self, index):
+        return self.static[index]['name']
+
+    def get_device_uuid(self, index):
+        return self.static[index]['uuid']
+
+    def get_cuda_version(self):
+        return self.cuda_version
+
+    def get_ecc_info(self, index):
+        ecc = self.static[index]['ecc']
+        return f"ECC Memory: {ecc if ecc in ('Enabled', 'Disabled') else 'Not Supported'}"
+
+    def get_device_profile(self, index):
+        return self.profiles[index]
+
+    def close(self):
+        self.closed = True
+        for child in list(self.children.values()):
+            if child.poll() is None:
+                child.terminate()
+
+FAKE_DEVICE_PROFILE = dict(DEFAULT_DEVICE_PROFILE, max_sm_clock=2100, max_memory_clock=9751, pcie_max_gen=4,
+                           pcie_max_width=16, power_limit_min=100.0, power_limit_max=350.0, power_limit_default=350.0)
+
+class FakeBackend(SamplerBackend):
+    # Replays scripted samples so the monitor can run and be exercised without a
+    # GPU. Each call returns the next entry of the device's script, wrapping around
+    # at the end; `latency` (seconds, or one value per device) adds a fixed delay
+    # per gpu_info call to imitate a slow device.
+    host_processes = False
+
+    def __init__(self, gpu_script=None, process_script=None, latency=0.0, devices=1):
+        self.devices = devices
+        if gpu_script is not None:
+            self.gpu_scripts = [gpu_script] * devices
+        else:
+            self.gpu_scripts = [self.default_gpu_script(phase=i * 7) for i in range(devices)]
+        self.process_script = process_script if process_script is not None else self.default_process_script()
+        self.latencies = list(latency) if isinstance(latency, (list, tuple)) else [latency] * devices
+        self.gpu_ticks = [0] * devices
+        self.process_ticks = [0] * devices
+
+    def device_count(self):
+        return self.devices
+
+    @staticmethod
+    def default_gpu_script(length=120, phase=0):
+        script = []
+        for i in range(length):
+            load = 0.5 + 0.5 * math.sin((i + phase) / 10)
+            script.append(build_gpu_info(
+                memory_used=int(4096 + 16384 * load),
+                memory_total=24576,
+                gpu_util=int(100 * load),
+                power_draw=round(100 + 250 * load, 2),
+                power_limit=350.0,
+                temperature=int(45 + 40 * load),
+                gpu_clock=int(600 + 1300 * load),
+                memory_clock=9751,
+                mem_util=int(80 * load),
+                pcie_gen=4,
+                pcie_width=16,
+                profile=FAKE_DEVICE_PROFILE,
+                pcie_tx=round(2 * load, 3),
+                pcie_rx=round(12 * load * load, 3)
+            ))
+        return script
+
+    @staticmethod
+    def default_process_script():
+        return [[
+            {'pid': 1001, 'name': 'python train.py', 'type': 'C', 'gpu_memory': 12288},
+            {'pid': 1002, 'name': 'Xorg', 'type': 'G', 'gpu_memory': 512},
+            {'pid': 1003, 'name': 'jupyter-kernel', 'type': 'C', 'gpu_memory': 'N/A'}
+        ]]
+
+    def get_gpu_info(self, index):
+        if self.latencies[index]:
+            time.sleep(self.latencies[index])
+        script = self.gpu_scripts[index]
+        sample = script[self.gpu_ticks[index] % len(script)]
+        self.gpu_ticks[index] += 1
+        return dict(sample)
+
+    def get_process_info(self, index):
+        sample = self.process_script[self.process_ticks[index] % len(self.process_script)]
+        self.process_ticks[index] += 1
+        # Offset PIDs per device so every GPU shows its own tasks
+        return [dict(process, pid=process['pid'] + 1000 * index) for process in sample]
+
+    def get_process_utilization(self, index):
+        # Compute processes share the device's current utilization, the first one taking the most
+        script = self.gpu_scripts[index]
+        gpu_info = script[max(self.gpu_ticks[index] - 1, 0) % len(script)]
+        sample = self.process_script[max(self.process_ticks[index] - 1, 0) % len(self.process_script)]
+        compute = [process['pid'] + 1000 * index for process in sample if 'C' in process['type']]
+        return [(pid, gpu_info['gpu_util'] // (position + 1), gpu_info['mem_util'] // (position + 1), 0, 0)
+                for position, pid in enumerate(compute)]
+
+    def get_system_info(self, index):
+        return f"GPU: {self.get_device_name(index)} | Driver: fake | CUDA: 0.0"
+
+    def get_device_name(self, index):
+        return f"Fake GPU {index}"
+
+    def get_device_uuid(self, index):
+        return f"FAKE-{index}"
+
+    def get_cuda_version(self):
+        return "0.0"
+
+    def get_ecc_info(self, index):
+        return "ECC Memory: Disabled"
+
+    def get_device_profile(self, index):
+        return dict(FAKE_DEVICE_PROFILE)
+
+BACKENDS = {
+    'nvml': NVMLBackend,
+    'nvidia-smi': NvidiaSmiBackend,
+    'nvidia-smi-stream': NvidiaSmiStreamBackend,
+    'fake': FakeBackend
+}
+
+def sample_device(backend, index, gpu=True, processes=True, footprint=None):
+    # (gpu_info, process list, process utilization samples); None for what was not asked for
+    def call(name, method):
+        if footprint is None:
+            return method(index)
+        return footprint.timed(name, method, index)
+    return (call('get_gpu_info', backend.get_gpu_info) if gpu else None,
+            call('get_process_info', backend.get_process_info) if processes else None,
+            call('get_process_utilization', backend.get_process_utilization) if processes else None)
+
+def static_device_info(backend, index):
+    # Everything about a device that cannot change while the monitor runs
+    return {
+        'name': backend.get_device_name(index),
+        'uuid': backend.get_device_uuid(index),
+        'system_info': backend.get_system_info(index),
+        'ecc_info': backend.get_ecc_info(index),
+        'profile': backend.get_device_profile(index)
+    }
+
+# Host-side process details, filled in with these when psutil cannot see the process
+PROCESS_HOST_DEFAULTS = {
+    'user': 'N/A',
+    'command': 'N/A',
+    'container': 'N/A',
+    'started': 'N/A',
+    'create_time': None,
+    'cpu_percent': 'N/A',
+    'rss': 'N/A'
+}
+
+# Docker, containerd, CRI-O and podman all name cgroups after the 64-hex container id
+CONTAINER_ID_RE = re.compile(r'([0-9a-f]{64})')
+
+def container_id(pid):
+    # Container (or other cgroup) a process runs in, from /proc/<pid>/cgroup on Linux
+    try:
+        with open(f"/proc/{pid}/cgroup") as f:
+            paths = [line.rstrip('\n').split(':', 2)[-1] for line in f]
+    except OSError:
+        return 'N/A'
+    for path in paths:
+        match = CONTAINER_ID_RE.search(path)
+        if match:
+            return match.group(1)[:12]
+    path = next((path for path in paths if path not in ('', '/')), '/')
+    return 'host' if path == '/' or path.startswith(('/user.slice', '/init.scope')) else path
+
+class ProcessEnricher:
+    # Joins GPU processes with host-side data from psutil. Anything that cannot
+    # change during a process's life (user, command line, container, start time)
+    # is looked up once and cached under (pid, create_time), so a recycled PID
+    # never inherits another process's details; only CPU % and RSS are read each
+    # tick. Entries for processes that are no longer on any GPU are dropped.
+    def __init__(self):
+        self.cache = {}
+
+    def lookup(self, pid):
+        try:
+            proc = psutil.Process(pid)  # reads the start time that tells a recycled PID apart
+            key = (pid, proc.create_time())
+            entry = self.cache.get(key)
+            if entry is not None:
+                return entry
+            with proc.oneshot():
+                try:
+                    user = proc.username()
+                except (psutil.AccessDenied, KeyError):
+                    user = 'N/A'
+                try:
+                    command = " ".join(proc.cmdline()) or proc.name()
+                except psutil.AccessDenied:
+                    command = 'N/A'
+            proc.cpu_percent()  # primes the counter; the first real reading comes next tick
+        except (psutil.NoSuchProcess, psutil.ZombieProcess, psutil.AccessDenied):
+            return None
+        for stale in [cached for cached in self.cache if cached[0] == pid]:
+            del self.cache[stale]
+        entry = self.cache[key] = (proc, {
+            'user': user,
+            'command': command,
+            'container': container_id(pid),
+            'started': datetime.datetime.fromtimestamp(key[1]).strftime('%Y-%m-%d %H:%M:%S'),
+            'create_time': key[1]
+        })
+        return entry
+
+    def enrich(self, processes, keep):
+        # Fills in `processes` and forgets every cached process whose PID is not in `keep`
+        for process in processes:
+            pid = process['pid']
+            entry = self.lookup(pid)
+            if entry is None:
+                process.update(PROCESS_HOST_DEFAULTS)
+                continue
+            proc, details = entry
+            process.update(details)
+            try:
+                with proc.oneshot():
+                    process['cpu_percent'] = round(proc.cpu_percent(), 1)
+                    process['rss'] = proc.memory_info().rss // (1024**2)
+            except (psutil.NoSuchProcess, psutil.AccessDenied):
+                process['cpu_percent'] = process['rss'] = 'N/A'
+
+        for key in [key for key in self.cache if key[0] not in keep]:
+            del self.cache[key]
+
+PROCESS_UTILIZATION_FIELDS = ('sm_util', 'mem_util', 'enc_util', 'dec_util')
+PROCESS_UTILIZATION_HISTORY = 30  # polls kept per process, a minute at the default process period
+SPARKLINE_BLOCKS = "▁▂▃▄▅▆▇█"
+
+def sparkline(values, top=100):
+    return "".join(SPARKLINE_BLOCKS[min(int(value / top * len(SPARKLINE_BLOCKS)), len(SPARKLINE_BLOCKS) - 1)]
+                   for value in values)
+
+class ProcessUtilization:
+    # Per-process SM, memory, encoder and decoder utilization. Each poll's samples
+    # are averaged per PID into one history entry, so a history covers the same
+    # time span however often the driver samples. Histories are bounded deques and
+    # those of processes that left the device are dropped on every refresh.
+    def __init__(self, history=PROCESS_UTILIZATION_HISTORY):
+        self.history = history
+        self.histories = {}  # (gpu, pid) -> deque of (sm, mem, enc, dec) per poll
+
+    def add(self, index, samples):
+        polled = {}
+        for pid, *values in samples:
+            polled.setdefault(pid, []).append(values)
+        for pid, values in polled.items():
+            history = self.histories.get((index, pid))
+            if history is None:
+                history = self.histories[(index, pid)] = deque(maxlen=self.history)
+            history.append(tuple(sum(column) / len(values) for column in zip(*values)))
+
+    def annotate(self, index, processes):
+        # Adds the latest utilization, the SM average and an SM sparkline to a fresh process list
+        for process in processes:
+            history = self.histories.get((index, process['pid']))
+            if not history:
+                continue
+            process.update((field, round(value, 1)) for field, value in zip(PROCESS_UTILIZATION_FIELDS, history[-1]))
+            sm = [entry[0] for entry in history]
+            process['sm_avg'] = round(sum(sm) / len(sm), 1)
+            process['sm_trend'] = sparkline(sm)
+
+    def prune(self, keep):
+        for key in list(self.histories):
+            if key not in keep:
+                del self.histories[key]
+
+class DeviceSampler:
+    # Samples every device on a small worker pool, so a tick takes as long as the
+    # slowest device rather than the sum of all of them. A tick waits at most
+    # `timeout` seconds; a device still busy after that keeps its sample running
+    # and is left out of this tick instead of holding up the others. gpu_info and
+    # process lists are only re-read when asked for; otherwise a device's sample
+    # reuses the last one read. With a `footprint`, every backend call is timed.
+    def __init__(self, backend, timeout=1.0, max_workers=8, footprint=None):
+        self.backend = backend
+        self.footprint = footprint
+        self.enricher = ProcessEnricher() if backend.host_processes else None
+        self.utilization = ProcessUtilization()
+        self.timeout = timeout
+        self.devices = list(range(backend.device_count()))
+        self.static = [static_device_info(backend, index) for index in self.devices]
+        self.cuda_version = backend.get_cuda_version()
+        self.executor = ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(self.devices))),
+                                           thread_name_prefix="gpu-sampler")
+        self.pending = {}
+        self.gpu_infos = {}
+        self.processes = {}
+
+    def sample(self, gpu=True, processes=True):
+        for index in self.devices:
+            if index not in self.pending:
+                self.pending[index] = self.executor.submit(sample_device, self.backend, index, gpu, processes, self.footprint)
+
+        done, _ = wait(self.pending.values(), timeout=self.timeout)
+        samples = {}
+        fresh = []
+        for index, future in list(self.pending.items()):
+            if future not in done:
+                continue
+            del self.pending[index]
+            try:
+                gpu_info, process_info, utilization = future.result()
+            except Exception as e:
+                print(f"Error sampling GPU {index}: {e}")
+                continue
+            if gpu_info is not None:
+                self.gpu_infos[index] = gpu_info
+            if process_info is not None:
+                self.processes[index] = process_info
+                fresh.extend(process_info)
+                if utilization is not None:
+                    self.utilization.add(index, utilization)
+                    self.utilization.annotate(index, process_info)
+            if index in self.gpu_infos:
+                samples[index] = (self.gpu_infos[index], self.processes.get(index, []))
+
+        if self.enricher and fresh:
+            try:
+                self.enricher.enrich(fresh, {process['pid'] for process_info in self.processes.values() for process in process_info})
+            except Exception as e:
+                print(f"Error reading host process details: {e}")
+        if processes:
+            self.utilization.prune({(index, process['pid']) for index, process_info in self.processes.items()
+                                    for process in process_info})
+        return samples
+
+    def close(self):
+        self.executor.shutdown(wait=False)
+
+# Default period in seconds of each sampling group. Static device info (names,
+# driver and CUDA versions, ECC mode) is read once when the sampler starts.
+SAMPLING_PERIODS = {
+    'gpu': 1.0,
+    'processes': 2.0
+}
+
+class RateScheduler:
+    # Fires named groups on fixed deadlines of the monotonic clock. A group's next
+    # deadline is its previous deadline plus its period rather than "now plus
+    # period", so the time spent sampling never turns into drift. A group that
+    # falls a whole period behind skips the ticks it missed instead of bursting to
+    # catch up. Every tick records its lateness (start time minus deadline) and
+    # its jitter (start-to-start interval minus period).
+    def __init__(self, periods, history=1000):
+        now = time.monotonic()
+        self.periods = dict(periods)
+        self.deadlines = {group: now for group in self.periods}
+        self.started = {}
+        self.lateness = {group: deque(maxlen=history) for group in self.periods}
+        self.jitter = {group: deque(maxlen=history) for group in self.periods}
+        self.ticks = dict.fromkeys(self.periods, 0)
+        self.missed = dict.fromkeys(self.periods, 0)
+
+    def now(self):
+        # Wall-clock time stamped on snapshots
+        return time.time()
+
+    def wait(self):
+        # Sleeps until the earliest deadline and returns the groups that are due
+        delay = min(self.deadlines.values()) - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+        now = time.monotonic()
+        due = []
+        for group, deadline in self.deadlines.items():
+            if deadline > now:
+                continue
+            period = self.periods[group]
+            behind = int((now - deadline) // period)
+            self.deadlines[group] = deadline + (behind + 1) * period
+            self.missed[group] += behind
+            self.ticks[group] += 1
+            self.lateness[group].append(now - deadline)
+            if group in self.started:
+                self.jitter[group].append(now - self.started[group] - period)
+            self.started[group] = now
+            due.append(group)
+        return due
+
+    def stats(self):
+        # Per group: ticks run and skipped, lateness and jitter in milliseconds
+        stats = {}
+        for group in self.periods:
+            lateness = np.array(self.lateness[group]) * 1000
+            jitter = np.abs(np.array(self.jitter[group])) * 1000
+            stats[group] = {
+                'period_ms': self.periods[group] * 1000,
+                'ticks': self.ticks[group],
+                'missed': self.missed[group],
+                'lateness_p50_ms': float(np.percentile(lateness, 50)) if len(lateness) else 0.0,
+                'lateness_p95_ms': float(np.percentile(lateness, 95)) if len(lateness) else 0.0,
+                'lateness_max_ms': float(lateness.max()) if len(lateness) else 0.0,
+                'jitter_p95_ms': float(np.percentile(jitter, 95)) if len(jitter) else 0.0
+            }
+        return stats
+
+# One device's sample, and everything sampled in one tick keyed by device index
+# together with the raised alerts per device and the alert events of that tick
+# (both filled in by RuleEngine). Snapshots are frozen (read-only mappings and tuples) before they leave the
+# sampler thread, so consumers on other threads can hold on to them safely.
+DeviceSample = namedtuple('DeviceSample', ['gpu_info', 'processes'])
+Snapshot = namedtuple('Snapshot', ['time', 'samples', 'alerts', 'events'], defaults=(MappingProxyType({}), ()))
+
+def make_snapshot(current_time, samples):
+    return Snapshot(current_time, MappingProxyType({
+        index: DeviceSample(MappingProxyType(gpu_info), tuple(MappingProxyType(process) for process in processes))
+        for index, (gpu_info, processes) in samples.items()
+    }))
+
+class SnapshotQueue:
+    # Bounded hand-off from the sampler to a consumer. Publishing never blocks:
+    # when the consumer falls behind the oldest snapshot is dropped, so a slow
+    # redraw can never back-pressure the sampler.
+    def __init__(self, maxsize=16):
+        self.queue = queue.Queue(maxsize=maxsize)
+
+    def publish(self, snapshot):
+        while True:
+            try:
+                self.queue.put_nowait(snapshot)
+                return
+            except queue.Full:
+                try:
+                    self.queue.get_nowait()
+                except queue.Empty:
+                    pass
+
+    def drain(self):
+        # Everything published since the last drain, oldest first
+        snapshots = []
+        try:
+            while True:
+                snapshots.append(self.queue.get_nowait())
+        except queue.Empty:
+            pass
+        return snapshots
+
+RECORDING_FORMAT = 'gpu-monitor-recording'
+RECORDING_VERSION = 1
+RECORDING_FLUSH_FRAMES = 60  # frames between flushes, so a killed recorder loses at most a minute
+
+class SnapshotRecorder:
+    # Writes the sampled stream to a gzip'd JSON-lines file. The header holds the
+    # static device info and the gpu_info field order; each frame then holds the
+    # tick time, the groups sampled, one value list per device and, only when it
+    # changed, the device's process list. Alerts are not recorded, replay
+    # evaluates the rules again.
+    def __init__(self, path, sampler):
+        self.file = gzip.open(path, 'wt', encoding='utf-8')
+        self.fields = list(DEFAULT_GPU_INFO)
+        self.processes = {}
+        self.frames = 0
+        self.write({
+            'format': RECORDING_FORMAT,
+            'version': RECORDING_VERSION,
+            'fields': self.fields,
+            'devices': sampler.static,
+            'cuda_version': sampler.cuda_version
+        })
+        self.file.flush()  # so even a recorder killed before its first flush leaves a readable header
+
+    def write(self, record):
+        self.file.write(json.dumps(record, separators=(',', ':')) + "\n")
+
+    def record(self, snapshot, due):
+        frame = {'t': snapshot.time, 'due': list(due), 'gpu': {}}
+        for index, sample in snapshot.samples.items():
+            frame['gpu'][index] = [sample.gpu_info[field] for field in self.fields]
+            processes = [dict(process) for process in sample.processes]
+            if processes != self.processes.get(index):
+                self.processes[index] = processes
+                frame.setdefault('processes', {})[index] = processes
+        self.write(frame)
+        self.frames += 1
+        if self.frames % RECORDING_FLUSH_FRAMES == 0:
+            self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+def read_recording(path):
+    # Header and frames of a recording; a file cut short by a crash replays up to
+    # its last complete frame
+    frames = []
+    with gzip.open(path, 'rt', encoding='utf-8') as f:
+        try:
+            header = json.loads(f.readline())
+        except (EOFError, OSError, ValueError):
+            raise ValueError(f"{path} has no complete recording header; the recorder was stopped before writing one, "
+                             f"or this is not a recording") from None
+        if not isinstance(header, dict) or header.get('format') != RECORDING_FORMAT or header.get('version') != RECORDING_VERSION:
+            raise ValueError(f"{path} is not a version {RECORDING_VERSION} recording")
+        try:
+            for line in f:
+                frames.append(json.loads(line))
+        except (EOFError, OSError, ValueError):
+            print(f"{path} ends early, replaying its {len(frames)} complete frames")
+    return header, frames
+
+class ReplayBackend(SamplerBackend):
+    # Serves a recording as if it were live devices. The static info comes from
+    # the header and every get_* call returns the device's value in the current
+    # frame, which ReplayScheduler advances.
+    host_processes = False  # recorded processes already carry their host details
+
+    def __init__(self, path):
+        header, self.frames = read_recording(path)
+        self.fields = header['fields']
+        self.static = header['devices']
+        self.cuda_version = header['cuda_version']
+        self.gpu_infos = {}
+        self.processes = {}
+
+    def show(self, frame):
+        for index, values in frame['gpu'].items():
+            self.gpu_infos[int(index)] = dict(DEFAULT_GPU_INFO, **dict(zip(self.fields, values)))
+        for index, processes in frame.get('processes', {}).items():
+            self.processes[int(index)] = processes
+
+    def device_count(self):
+        return len(self.static)
+
+    def get_gpu_info(self, index):
+        return dict(self.gpu_infos.get(index, DEFAULT_GPU_INFO))
+
+    def get_process_info(self, index):
+        return [dict(process) for process in self.processes.get(index, [])]
+
+    def get_system_info(self, index):
+        return self.static[index]['system_info']
+
+    def get_device_name(self, index):
+        return self.static[index]['name']
+
+    def get_device_uuid(self, index):
+        return self.static[index]['uuid']
+
+    def get_cuda_version(self):
+        return self.cuda_version
+
+    def get_ecc_info(self, index):
+        return self.static[index]['ecc_info']
+
+    def get_device_profile(self, index):
+        return dict(DEFAULT_DEVICE_PROFILE, **self.static[index]['profile'])
+
+class ReplayScheduler:
+    # Stands in for RateScheduler during replay: each wait() moves the backend to
+    # the next frame and returns the groups sampled in it, paced by the recorded
+    # timestamps divided by `speed`. A speed of 0 replays as fast as the pipeline
+    # takes it. The clock is the recording's, so graphs, history and alerts show
+    # the original times. wait() returns None at the end of the recording.
+    def __init__(self, backend, speed=1.0):
+        self.backend = backend
+        self.speed = speed
+        self.position = 0
+        self.started = None
+
+    def wait(self):
+        frames = self.backend.frames
+        if self.position >= len(frames):
+            if self.started is not None:
+                elapsed = time.monotonic() - self.started[0]
+                print(f"Replay finished: {len(frames)} frames in {elapsed:.2f} s ({len(frames) / max(elapsed, 1e-9):.0f} frames/s)")
+                self.started = None
+            return None
+        frame = frames[self.position]
+        if self.started is None:
+            self.started = (time.monotonic(), frame['t'])
+        elif self.speed:
+            delay = self.started[0] + (frame['t'] - self.started[1]) / self.speed - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+        self.position += 1
+        self.frame_time = frame['t']
+        self.backend.show(frame)
+        return frame['due']
+
+    def now(self):
+        return self.frame_time
+
+    def stats(self):
+        return {}
+
+def measure_sampling_latency(backend, ticks=100):
+    # Per-tick cost of sampling every device once through a DeviceSampler, in milliseconds
+    sampler = DeviceSampler(backend, timeout=None)
+    durations = []
+    for _ in range(ticks):
+        start = time.perf_counter()
+        sampler.sample()
+        durations.append((time.perf_counter() - start) * 1000)
+    sampler.close()
+    durations.sort()
+    return {
+        'mean': sum(durations) / len(durations),
+        'p50': durations[len(durations) // 2],
+        'p95': durations[min(len(durations) - 1, int(len(durations) * 0.95))],
+        'max': durations[-1]
+    }
+
+# The monitor's own footprint. Timers hold durations in seconds, the rest their own unit.
+FOOTPRINT_HISTORY = 1000  # values kept per metric
+FOOTPRINT_UNITS = {'cpu_percent': '%', 'rss': 'MiB'}  # everything else is a timer, shown in ms
+FOOTPRINT_LAG_INTERVAL_MS = 250  # how often the GUI measures how late the Tk loop runs a callback
+FOOTPRINT_REFRESH_MS = 1000
+
+class MonitorFootprint:
+    # What the monitor itself costs: how long its hot paths take, how late the Tk
+    # loop runs callbacks and the process's CPU and RSS. A recording is two
+    # perf_counter calls and a deque append, which is atomic, so the sampler's
+    # worker threads record without a lock. Percentiles are only computed when
+    # stats() is asked for.
+    def __init__(self, history=FOOTPRINT_HISTORY):
+        self.history = history
+        self.values = {}
+        self.process = psutil.Process()
+        self.process.cpu_percent()  # the first call only starts the measurement
+
+    def record(self, name, value):
+        values = self.values.get(name)
+        if values is None:
+            values = self.values.setdefault(name, deque(maxlen=self.history))
+        values.append(value)
+
+    def timed(self, name, function, *args):
+        start = time.perf_counter()
+        result = function(*args)
+        self.record(name, time.perf_counter() - start)
+        return result
+
+    def sample_process(self):
+        # CPU use since the previous call, over all threads, and resident memory
+        with self.process.oneshot():
+            self.record('cpu_percent', self.process.cpu_percent())
+            self.record('rss', self.process.memory_info().rss / 1024**2)
+
+    def stats(self):
+        # Per metric: its unit, how many values are kept and their p50, p95 and max
+        stats = {}
+        for name, values in sorted(self.values.items()):
+            values = np.array(values)
+            unit = FOOTPRINT_UNITS.get(name)
+            if unit is None:
+                unit, values = 'ms', values * 1000
+            p50, p95 = np.percentile(values, (50, 95))
+            stats[name] = {'unit': unit, 'count': len(values), 'p50': float(p50), 'p95': float(p95), 'max': float(values.max())}
+        return stats
+
+# Metrics kept in each device's history, with the dtype of their column
+HISTORY_FIELDS = {
+    'time': np.float64,
+    'gpu_util': np.float32,
+    'mem_util': np.float32,
+    'power': np.float32,
+    'temp': np.float32,
+    'mem_used': np.float32,
+    'mem_free': np.float32,
+    'cuda_util': np.float32,
+    'mem_bandwidth': np.float32,
+    'mem_throughput': np.float32,
+    'mem_ctrl_util': np.float32,
+    'pcie_bandwidth': np.float32,
+    'pcie_tx': np.float32,
+    'pcie_rx': np.float32,
+    'flops_per_watt': np.float32,
+    'throttling': np.uint8
+}
+
+def history_row(current_time, gpu_info):
+    return {
+        'time': current_time,
+        'gpu_util': gpu_info['gpu_util'],
+        'mem_util': gpu_info['memory_percent'],
+        'power': gpu_info['power_draw'],
+        'temp': gpu_info['temperature'],
+        'mem_used': gpu_info['memory_used'],
+        'mem_free': gpu_info['memory_total'] - gpu_info['memory_used'],
+        'cuda_util': gpu_info['cuda_util'],
+        'mem_bandwidth': gpu_info['mem_bandwidth'],
+        'mem_throughput': gpu_info['mem_throughput'],
+        'mem_ctrl_util': gpu_info['mem_util'],
+        'pcie_bandwidth': gpu_info['pcie_bandwidth'],
+        'pcie_tx': gpu_info['pcie_tx'],
+        'pcie_rx': gpu_info['pcie_rx'],
+        'flops_per_watt': gpu_info['flops_per_watt'],
+        'throttling': 1 if gpu_info['is_throttling'] else 0
+    }
+
+DEFAULT_HISTORY_LENGTH = 300  # samples per device, 5 minutes at one sample per second
+
+class RingBuffer:
+    # Fixed-capacity columnar history with one preallocated array per field.
+    # Each column holds two copies of the ring back to back and every sample is
+    # written to both, so the newest `len(self)` samples are always a single
+    # contiguous slice: appends are O(1) and never allocate, and reads are
+    # zero-copy, chronologically ordered views.
+    def __init__(self, fields, capacity):
+        self.capacity = capacity
+        self.columns = {name: np.zeros(2 * capacity, dtype=dtype) for name, dtype in fields.items()}
+        self.head = 0  # slot the next sample is written to
+        self.count = 0
+
+    def __len__(self):
+        return self.count
+
+    def append(self, values):
+        head = self.head
+        mirror = head + self.capacity
+        for name, column in self.columns.items():
+            column[head] = column[mirror] = values[name]
+        self.head = (head + 1) % self.capacity
+        if self.count < self.capacity:
+            self.count += 1
+
+    def view(self, name, last=None):
+        # The newest `last` samples of a field (all of them by default), oldest first.
+        # The view is read-only and aliases the buffer, so copy it before handing it
+        # to anything that outlives the next append.
+        n = self.count if last is None else min(last, self.count)
+        end = self.head + self.capacity
+        view = self.columns[name][end - n:end]
+        view.flags.writeable = False
+        return view
+
+    def __getitem__(self, name):
+        return self.view(name)
+
+    def __contains__(self, name):
+        return name in self.columns
+
+    def views(self, names=None, last=None):
+        return {name: self.view(name, last) for name in (names or self.columns)}
+
+    def copy(self, names=None, last=None):
+        # Like views(), but detached from the buffer, for readers that let go of
+        # the lock before they are done with the history
+        return {name: view.copy() for name, view in self.views(names, last).items()}
+
+DEFAULT_STORE_DIR = os.path.join(CACHE_DIR, 'history')
+
+# History metrics persisted by MetricStore, every field but the timestamp
+STORE_METRICS = [name for name in HISTORY_FIELDS if name != 'time']
+
+# (name, seconds per row, rows kept). Every tier is rolled up straight from the
+# incoming samples; with the 15 metrics above a GPU needs about 26 MB on disk
+# for a day at 1 s, a week at 10 s and a month at 1 min.
+STORE_TIERS = [
+    ('raw', 1, 86400),
+    ('10s', 10, 60480),
+    ('1m', 60, 43200)
+]
+
+class StoreTier:
+    # One fixed-size, memory-mapped ring file. The header holds the layout and the
+    # write position, the rows follow it. The raw tier keeps the mean of each
+    # bucket, the coarser tiers also keep min/max and the sample count.
+    MAGIC = 0x47504d48  # "GPMH"
+    HEADER_FIELDS = 8  # int64 words: magic, row size, capacity, head, count, reserved
+
+    def __init__(self, path, resolution, capacity, aggregate):
+        self.resolution = resolution
+        self.capacity = capacity
+        fields = [('time', np.float64)]
+        if aggregate:
+            fields.append(('count', np.uint32))
+            for name in STORE_METRICS:
+                fields += [(f'{name}_min', np.float32), (f'{name}_max', np.float32), (name, np.float32)]
+        else:
+            fields += [(name, np.float32) for name in STORE_METRICS]
+        self.dtype = np.dtype(fields)
+        self.aggregate = aggregate
+        self.open(path)
+
+        self.bucket = None
+        self.count = 0
+        self.sums = np.zeros(len(STORE_METRICS))
+        self.mins = np.full(len(STORE_METRICS), np.inf)
+        self.maxs = np.full(len(STORE_METRICS), -np.inf)
+
+    def open(self, path):
+        header_bytes = self.HEADER_FIELDS * 8
+        expected = (self.MAGIC, self.dtype.itemsize, self.capacity)
+        mode = 'r+'
+        if os.path.exists(path):
+            header = np.fromfile(path, dtype=np.int64, count=3)
+            if tuple(header) != expected or os.path.getsize(path) != header_bytes + self.capacity * self.dtype.itemsize:
+                print(f"History file {path} has a different layout, starting a new one")
+                mode = 'w+'
+        else:
+            mode = 'w+'
+
+        self.header = np.memmap(path, dtype=np.int64, mode=mode, shape=(self.HEADER_FIELDS,))
+        if mode == 'w+':
+            self.header[:3] = expected
+            self.header.flush()
+        self.rows = np.memmap(path, dtype=self.dtype, mode='r+', offset=header_bytes, shape=(self.capacity,))
+
+    def add(self, current_time, values):
+        bucket = current_time - current_time % self.resolution
+        if self.bucket is not None and bucket != self.bucket:
+            self.flush_bucket()
+        self.bucket = bucket
+        self.count += 1
+        self.sums += values
+        np.minimum(self.mins, values, out=self.mins)
+        np.maximum(self.maxs, values, out=self.maxs)
+
+    def flush_bucket(self):
+        if not self.count:
+            return
+        row = [self.bucket]
+        means = self.sums / self.count
+        if self.aggregate:
+            row.append(self.count)
+            for low, high, mean in zip(self.mins, self.maxs, means):
+                row += [low, high, mean]
+        else:
+            row += list(means)
+
+        head = int(self.header[3])
+        self.rows[head] = tuple(row)
+        self.header[3] = (head + 1) % self.capacity
+        self.header[4] = min(int(self.header[4]) + 1, self.capacity)
+
+        self.count = 0
+        self.sums[:] = 0
+        self.mins[:] = np.inf
+        self.maxs[:] = -np.inf
+
+    def segments(self):
+        # The stored rows as at most two chronological slices, oldest first
+        head, count = int(self.header[3]), int(self.header[4])
+        if count < self.capacity:
+            return [self.rows[:count]]
+        return [self.rows[head:], self.rows[:head]]
+
+    def oldest(self):
+        segments = [segment for segment in self.segments() if len(segment)]
+        return float(segments[0]['time'][0]) if segments else None
+
+    def count_range(self, start, end):
+        # Rows that range(start, end) would return, without copying them
+        count = 0
+        for segment in self.segments():
+            times = segment['time']
+            count += max(0, np.searchsorted(times, end, side='right') - np.searchsorted(times, start, side='left'))
+        return int(count)
+
+    def range(self, start, end):
+        parts = []
+        for segment in self.segments():
+            times = segment['time']
+            low = np.searchsorted(times, start, side='left')
+            high = np.searchsorted(times, end, side='right')
+            if high > low:
+                parts.append(segment[low:high])
+        return np.concatenate(parts) if parts else np.zeros(0, dtype=self.dtype)
+
+    def close(self):
+        self.flush_bucket()
+        self.rows.flush()
+        self.header.flush()
+
+class DeviceStore:
+    def __init__(self, directory):
+        os.makedirs(directory, exist_ok=True)
+        self.tiers = [StoreTier(os.path.join(directory, f'{name}.bin'), resolution, capacity, aggregate=index > 0)
+                      for index, (name, resolution, capacity) in enumerate(STORE_TIERS)]
+
+    def append(self, row):
+        values = np.array([row[name] for name in STORE_METRICS], dtype=np.float64)
+        for tier in self.tiers:
+            tier.add(row['time'], values)
+
+    def query(self, start, end, max_points=None, tier=None):
+        # Picks the finest tier holding at most `max_points` rows in the range,
+        # falling back to the coarsest tier, or reads the tier named `tier`
+        if tier is not None:
+            tier = self.tiers[[name for name, _, _ in STORE_TIERS].index(tier)]
+        else:
+            tier = self.tiers[-1]
+            for candidate in self.tiers:
+                if max_points is None or candidate.count_range(start, end) <= max_points:
+                    tier = candidate
+                    break
+        rows = tier.range(start, end)
+        result = {name: rows[name] for name in rows.dtype.names}
+        result['resolution'] = tier.resolution
+        return result
+
+    def close(self):
+        for tier in self.tiers:
+            tier.close()
+
+class MetricStore:
+    # Append-only on-disk history, one directory of tier files per device keyed by
+    # its UUID, so history survives restarts and follows a GPU across slot changes.
+    # Only one monitor may write to a directory at a time: opening one that another
+    # monitor holds raises BlockingIOError.
+    def __init__(self, directory=DEFAULT_STORE_DIR):
+        self.directory = directory
+        self.devices = {}
+        self.lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self.lock_file = open(os.path.join(directory, '.lock'), 'w')
+        if fcntl:
+            try:
+                fcntl.flock(self.lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                self.lock_file.close()
+                raise
+
+    def device(self, key):
+        store = self.devices.get(key)
+        if store is None:
+            safe_key = re.sub(r'[^A-Za-z0-9_.-]', '_', key)
+            store = self.devices[key] = DeviceStore(os.path.join(self.directory, safe_key))
+        return store
+
+    def append(self, key, row):
+        with self.lock:
+            self.device(key).append(row)
+
+    def query(self, key, start, end, max_points=None, tier=None):
+        with self.lock:
+            return self.device(key).query(start, end, max_points, tier)
+
+    def close(self):
+        with self.lock:
+            for store in self.devices.values():
+                store.close()
+            self.devices = {}
+            self.lock_file.close()  # releases the directory lock
+
+# OpenMetrics gauges exported per GPU: (gpu_info key, metric name, scale, help)
+OPENMETRICS_GAUGES = [
+    ('gpu_util', 'gpu_utilization_percent', 1, "GPU utilization."),
+    ('mem_util', 'gpu_memory_controller_utilization_percent', 1, "Memory controller utilization."),
+    ('memory_used', 'gpu_memory_used_bytes', 1024**2, "Framebuffer memory in use."),
+    ('memory_total', 'gpu_memory_total_bytes', 1024**2, "Total framebuffer memory."),
+    ('power_draw', 'gpu_power_draw_watts', 1, "Current power draw."),
+    ('power_limit', 'gpu_power_limit_watts', 1, "Enforced power limit."),
+    ('temperature', 'gpu_temperature_celsius', 1, "GPU core temperature."),
+    ('gpu_clock', 'gpu_sm_clock_hertz', 1e6, "Current SM clock."),
+    ('memory_clock', 'gpu_memory_clock_hertz', 1e6, "Current memory clock."),
+    ('mem_bandwidth', 'gpu_memory_bandwidth_bytes_per_second', 1e9, "Memory bandwidth available at the current memory clock."),
+    ('mem_throughput', 'gpu_memory_throughput_bytes_per_second', 1e9, "Memory bandwidth in use, from memory controller utilization."),
+    ('pcie_bandwidth', 'gpu_pcie_link_bandwidth_bytes_per_second', 1e9, "PCIe link capacity per direction at the current generation and width."),
+    ('pcie_max_bandwidth', 'gpu_pcie_link_max_bandwidth_bytes_per_second', 1e9, "PCIe link capacity per direction at the maximum generation and width."),
+    ('pcie_tx', 'gpu_pcie_tx_bytes_per_second', 1e9, "Measured PCIe traffic from the GPU."),
+    ('pcie_rx', 'gpu_pcie_rx_bytes_per_second', 1e9, "Measured PCIe traffic to the GPU."),
+    ('flops_per_watt', 'gpu_flops_per_watt', 1e9, "Estimated power efficiency."),
+    ('is_throttling', 'gpu_throttling', 1, "1 while the GPU is considered to be throttling."),
+]
+HEALTH_STATES = ["Good", "Fair", "Poor"]
+OPENMETRICS_CONTENT_TYPE = "application/openmetrics-text; version=1.0.0; charset=utf-8"
+
+# Sampling scheduler statistics exported alongside the GPU metrics, converted from ms to seconds
+SCHEDULER_GAUGES = [
+    ('lateness_p95_ms', 'gpu_monitor_tick_lateness_p95_seconds', "95th percentile of how late sampling ticks started."),
+    ('lateness_max_ms', 'gpu_monitor_tick_lateness_max_seconds', "Latest start of a sampling tick."),
+    ('jitter_p95_ms', 'gpu_monitor_tick_jitter_p95_seconds', "95th percentile of the tick interval's deviation from its period.")
+]
+
+# The monitor's own CPU and memory, and the statistics exported for each footprint metric
+FOOTPRINT_GAUGES = [
+    ('cpu_percent', 'gpu_monitor_cpu_percent', 1, "CPU used by the monitor process, 100 per busy core."),
+    ('rss', 'gpu_monitor_resident_memory_bytes', 1024**2, "Resident memory of the monitor process.")
+]
+FOOTPRINT_STATS = ('p50', 'p95', 'max')
+
+def escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def render_openmetrics(snapshot, device_names, scheduler_stats=None, footprint_stats=None):
+    devices = sorted(snapshot.samples.items())
+    labels = {index: f'gpu="{index}",name="{escape_label(device_names[index])}"' for index, _ in devices}
+    lines = []
+    for key, name, scale, help_text in OPENMETRICS_GAUGES:
+        lines.append(f"# TYPE {name} gauge")
+        lines.append(f"# HELP {name} {help_text}")
+        for index, sample in devices:
+            lines.append(f"{name}{{{labels[index]}}} {float(sample.gpu_info[key]) * scale!r}")
+
+    lines.append("# TYPE gpu_health stateset")
+    lines.append("# HELP gpu_health Overall GPU health.")
+    for index, sample in devices:
+        health = alert_health(snapshot.alerts.get(index, ()))
+        for state in HEALTH_STATES:
+            lines.append(f'gpu_health{{{labels[index]},gpu_health="{state}"}} {1 if state == health else 0}')
+
+    lines.append("# TYPE gpu_warnings gauge")
+    lines.append("# HELP gpu_warnings Number of raised alert rules.")
+    for index, sample in devices:
+        lines.append(f"gpu_warnings{{{labels[index]}}} {len(snapshot.alerts.get(index, ()))}")
+
+    lines.append("# TYPE gpu_alert gauge")
+    lines.append("# HELP gpu_alert Alert rules currently raised.")
+    for index, sample in devices:
+        for rule, severity in snapshot.alerts.get(index, ()):
+            lines.append(f'gpu_alert{{{labels[index]},rule="{escape_label(rule)}",severity="{severity}"}} 1')
+
+    lines.append("# TYPE gpu_process_memory_used_bytes gauge")
+    lines.append("# HELP gpu_process_memory_used_bytes GPU memory used by a process.")
+    for index, sample in devices:
+        for process in sample.processes:
+            if process.get('gpu_memory', 'N/A') == 'N/A':
+                continue
+            process_labels = f'{labels[index]},pid="{process["pid"]}",process="{escape_label(process.get("name", ""))}"'
+            lines.append(f"gpu_process_memory_used_bytes{{{process_labels}}} {process['gpu_memory'] * 1024**2}")
+
+    lines.append("# TYPE gpu_process_sm_utilization_percent gauge")
+    lines.append("# HELP gpu_process_sm_utilization_percent Share of the GPU's SMs a process kept busy over the last poll.")
+    for index, sample in devices:
+        for process in sample.processes:
+            if 'sm_util' not in process:
+                continue
+            process_labels = f'{labels[index]},pid="{process["pid"]}",process="{escape_label(process.get("name", ""))}"'
+            lines.append(f"gpu_process_sm_utilization_percent{{{process_labels}}} {float(process['sm_util'])!r}")
+
+    if scheduler_stats:
+        for key, name, help_text in SCHEDULER_GAUGES:
+            lines.append(f"# TYPE {name} gauge")
+            lines.append(f"# HELP {name} {help_text}")
+            for group, stats in scheduler_stats.items():
+                lines.append(f'{name}{{group="{group}"}} {stats[key] / 1000!r}')
+
+    if footprint_stats:
+        timers = {name: stats for name, stats in footprint_stats.items() if stats['unit'] == 'ms'}
+        lines.append("# TYPE gpu_monitor_duration_seconds gauge")
+        lines.append("# HELP gpu_monitor_duration_seconds Time the monitor spends in one of its own hot paths.")
+        for timer, stats in timers.items():
+            for stat in FOOTPRINT_STATS:
+                lines.append(f'gpu_monitor_duration_seconds{{timer="{timer}",stat="{stat}"}} {stats[stat] / 1000!r}')
+        for key, name, scale, help_text in FOOTPRINT_GAUGES:
+            if key not in footprint_stats:
+                continue
+            lines.append(f"# TYPE {name} gauge")
+            lines.append(f"# HELP {name} {help_text}")
+            for stat in FOOTPRINT_STATS:
+                lines.append(f'{name}{{stat="{stat}"}} {footprint_stats[key][stat] * scale!r}')
+
+    lines.append("# EOF")
+    return ("\n".join(lines) + "\n").encode('utf-8')
+
+def snapshot_record(snapshot, device_names, footprint_stats=None):
+    # JSON-serialisable form of a snapshot, one object per tick
+    record = {
+        'time': snapshot.time,
+        'gpus': [
+            dict(sample.gpu_info,
+                 index=index,
+                 name=device_names[index],
+                 health=alert_health(snapshot.alerts.get(index, ())),
+                 warnings=[rule for rule, _ in snapshot.alerts.get(index, ())],
+                 processes=[dict(process) for process in sample.processes])
+            for index, sample in sorted(snapshot.samples.items())
+        ],
+        'alert_events': [event._asdict() for event in snapshot.events]
+    }
+    if footprint_stats:
+        record['monitor'] = footprint_stats
+    return record
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split('?')[0] != '/metrics':
+            self.send_error(404)
+            return
+        body = self.server.monitor.metrics_page
+        self.send_response(200)
+        self.send_header('Content-Type', OPENMETRICS_CONTENT_TYPE)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass  # scrapes would otherwise log a line to stderr every few seconds
+
+def interrupt_on_signal(signum, frame):
+    raise KeyboardInterrupt
+
+class HeadlessMonitor:
+    # Collects with the same DeviceSampler, histories and health checks as the GUI,
+    # without importing the GUI stack. The OpenMetrics page is rendered once per
+    # tick and served as-is, so a scrape costs no sampling and takes no lock.
+    def __init__(self, backend, periods=SAMPLING_PERIODS, history_length=DEFAULT_HISTORY_LENGTH,
+                 listen=None, json_output=None, store=None, rules=DEFAULT_RULES, record=None, speed=1.0,
+                 agent=None):
+        self.backend = backend
+        self.store = store
+        self.footprint = MonitorFootprint()
+        self.sampler = DeviceSampler(backend, timeout=periods['gpu'], footprint=self.footprint)
+        if isinstance(backend, ReplayBackend):
+            self.scheduler = ReplayScheduler(backend, speed)
+        else:
+            self.scheduler = RateScheduler(periods)
+        self.recorder = SnapshotRecorder(record, self.sampler) if record else None
+        self.rules = RuleEngine(rules, len(self.sampler.devices))
+        self.device_names = [info['name'] for info in self.sampler.static]
+        self.device_keys = [info['uuid'] for info in self.sampler.static]
+        self.data = [RingBuffer(HISTORY_FIELDS, history_length) for _ in self.sampler.devices]
+        self.json_output = json_output
+        self.agent = None
+        if agent:
+            address, transport = agent
+            self.agent = FleetAgent(address, transport, devices=self.sampler.static)
+        self.metrics_page = b"# EOF\n"
+
+        self.server = None
+        if listen:
+            self.server = HTTPServer(listen, MetricsHandler)
+            self.server.monitor = self
+            threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def run(self):
+        # A service manager stops us with SIGTERM; treat it like Ctrl+C so close()
+        # still writes out the store's open buckets and the recording
+        signal.signal(signal.SIGTERM, interrupt_on_signal)
+        try:
+            while True:
+                due = self.scheduler.wait()
+                if due is None:
+                    break
+                try:
+                    self.tick(due)
+                except Exception as e:
+                    print(f"Unexpected error in headless tick: {e}", file=sys.stderr)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.close()
+
+    def tick(self, due=('gpu', 'processes')):
+        start = time.perf_counter()
+        snapshot = make_snapshot(self.scheduler.now(), self.sampler.sample(gpu='gpu' in due, processes='processes' in due))
+        if self.recorder:
+            self.recorder.record(snapshot, due)
+        snapshot = self.rules.evaluate(snapshot)
+        for event in snapshot.events:
+            print(f"Alert {event.state}: GPU {event.gpu} {event.rule} ({event.value:g})", file=sys.stderr)
+        if 'gpu' in due:
+            for index, sample in snapshot.samples.items():
+                row = history_row(snapshot.time, sample.gpu_info)
+                self.data[index].append(row)
+                if self.store:
+                    self.store.append(self.device_keys[index], row)
+            if self.agent:
+                self.agent.send_snapshot(snapshot)
+            self.footprint.sample_process()
+
+        footprint_stats = self.footprint.stats()
+        self.metrics_page = render_openmetrics(snapshot, self.device_names, self.scheduler.stats(), footprint_stats)
+        if self.json_output:
+            self.json_output.write(json.dumps(snapshot_record(snapshot, self.device_names, footprint_stats)) + "\n")
+            self.json_output.flush()
+        self.footprint.record('update_stats', time.perf_counter() - start)
+
+    def close(self):
+        if self.recorder:
+            self.recorder.close()
+        if self.server:
+            self.server.shutdown()
+        if self.agent:
+            self.agent.close()
+        if self.store:
+            self.store.close()
+        self.sampler.close()
+        self.backend.close()
+
+def parse_listen_address(value):
+    # "PORT" or "HOST:PORT"; a bare port binds to localhost only
+    host, _, port = value.rpartition(':')
+    return (host or '127.0.0.1', int(port))
+
+# Fleet mode: agents push compact samples to one aggregator over UDP (one
+# datagram per host and tick) or TCP (the same packets, each prefixed with its
+# length). A packet is a fixed header, the host name and either one binary
+# record per GPU (kind FLEET_SAMPLES) or a JSON list of the GPUs' names and
+# UUIDs (kind FLEET_DEVICES), which agents resend every FLEET_DEVICES_INTERVAL
+# so an aggregator started later, or a lost datagram, catches up.
+FLEET_MAGIC = b'GPMF'
+FLEET_VERSION = 1
+FLEET_SAMPLES = 0
+FLEET_DEVICES = 1
+FLEET_HEADER = struct.Struct('<4sBBHd')  # magic, version, kind, host name length, time
+FLEET_LENGTH = struct.Struct('<I')  # TCP frame length
+FLEET_DEVICES_INTERVAL = 30
+FLEET_FIELDS = ['gpu_util', 'memory_percent', 'memory_used', 'memory_total', 'power_draw', 'power_limit',
+                'temperature', 'gpu_clock_percent', 'mem_util', 'pcie_util']
+FLEET_RECORD = np.dtype([('index', '<u2'), ('health', 'u1'), ('alerts', 'u1'),
+                        ('values', '<f4', (len(FLEET_FIELDS),))])
+FLEET_MAX_DEVICES = 256  # GPUs per host; packets with higher indices are dropped
+FLEET_MAX_PACKET = 65535  # every packet must fit one UDP datagram, TCP frames included
+FLEET_HISTORY_LENGTH = 300  # samples kept per device
+FLEET_STALE_SECONDS = 5  # a device not heard from for this long shows as stale
+
+def encode_fleet_packet(kind, host, current_time, payload):
+    host = host.encode('utf-8')
+    return FLEET_HEADER.pack(FLEET_MAGIC, FLEET_VERSION, kind, len(host), current_time) + host + payload
+
+def encode_fleet_samples(host, current_time, devices):
+    # devices: (index, gpu_info, alerts) per GPU, alerts being raised (rule, severity) pairs
+    records = np.zeros(len(devices), dtype=FLEET_RECORD)
+    for record, (index, gpu_info, alerts) in zip(records, devices):
+        record['index'] = index
+        record['health'] = HEALTH_STATES.index(alert_health(alerts))
+        record['alerts'] = min(len(alerts), 255)
+        record['values'] = [gpu_info[field] for field in FLEET_FIELDS]
+    return encode_fleet_packet(FLEET_SAMPLES, host, current_time, records.tobytes())
+
+def decode_fleet_packet(packet):
+    magic, version, kind, host_length, current_time = FLEET_HEADER.unpack_from(packet)
+    if magic != FLEET_MAGIC or version != FLEET_VERSION:
+        raise ValueError("not a fleet packet")
+    start = FLEET_HEADER.size + host_length
+    return kind, packet[FLEET_HEADER.size:start].decode('utf-8'), current_time, packet[start:]
+
+class FleetAgent:
+    # Pushes this host's samples to an aggregator. Sends never block the sampler
+    # for long: UDP is fire-and-forget, and a TCP connection that fails is dropped
+    # and retried on a later tick, losing the samples in between.
+    def __init__(self, address, transport='udp', host=None, devices=()):
+        self.address = address
+        self.transport = transport
+        self.host = host or socket.gethostname()
+        self.devices = json.dumps([{'index': index, 'name': info['name'], 'uuid': info['uuid']}
+                                   for index, info in enumerate(devices)]).encode('utf-8')
+        self.devices_sent = 0
+        self.sock = None
+        self.retry_at = 0
+
+    def connect(self):
+        if self.transport == 'udp':
+            self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        else:
+            self.sock = socket.create_connection(self.address, timeout=1)
+        self.devices_sent = 0  # a new connection may be a restarted aggregator
+
+    def send(self, current_time, devices):
+        packets = []
+        if current_time - self.devices_sent >= FLEET_DEVICES_INTERVAL:
+            packets.append(encode_fleet_packet(FLEET_DEVICES, self.host, current_time, self.devices))
+        packets.append(encode_fleet_samples(self.host, current_time, devices))
+        if self.sock is None:
+            if time.monotonic() < self.retry_at:
+                return
+            try:
+                self.connect()
+            except OSError as e:
+                print(f"Cannot reach the fleet aggregator at {self.address[0]}:{self.address[1]}: {e}", file=sys.stderr)
+                self.retry_at = time.monotonic() + 5
+                return
+        try:
+            for packet in packets:
+                if self.transport == 'udp':
+                    self.sock.sendto(packet, self.address)
+                else:
+                    self.sock.sendall(FLEET_LENGTH.pack(len(packet)) + packet)
+            if len(packets) > 1:
+                self.devices_sent = current_time
+        except OSError as e:
+            print(f"Lost the fleet aggregator connection: {e}", file=sys.stderr)
+            self.close()
+
+    def send_snapshot(self, snapshot):
+        self.send(snapshot.time, [(index, sample.gpu_info, snapshot.alerts.get(index, ()))
+                                  for index, sample in sorted(snapshot.samples.items())])
+
+    def close(self):
+        if self.sock:
+            self.sock.close()
+            self.sock = None
+
+class FleetAggregator:
+    # Latest values, health and a ring of recent samples for every device of every
+    # agent, in arrays with one row per device. Devices are keyed by (host, GPU
+    # index) and get a row the first time they report; the arrays double when
+    # they fill up. A samples packet is decoded with one frombuffer and written
+    # with fancy indexing, so ingest cost is per packet rather than per field.
+    def __init__(self, capacity=64, history_length=FLEET_HISTORY_LENGTH):
+        self.lock = threading.Lock()
+        self.history_length = history_length
+        self.slots = {}  # (host, index) -> row
+        self.keys = []
+        self.names = []
+        self.packets = 0
+        self.errors = 0
+        self.allocate(capacity)
+
+    def allocate(self, capacity):
+        self.capacity = capacity
+        self.times = np.zeros(capacity)
+        self.values = np.full((capacity, len(FLEET_FIELDS)), np.nan, dtype=np.float32)
+        self.health = np.zeros(capacity, dtype=np.uint8)
+        self.alerts = np.zeros(capacity, dtype=np.uint8)
+        self.history = np.full((capacity, self.history_length, len(FLEET_FIELDS)), np.nan, dtype=np.float32)
+        self.history_times = np.full((capacity, self.history_length), np.nan)
+        self.heads = np.zeros(capacity, dtype=np.int64)
+
+    def grow(self):
+        old = (self.times, self.values, self.health, self.alerts, self.history, self.history_times, self.heads)
+        self.allocate(self.capacity * 2)
+        new = (self.times, self.values, self.health, self.alerts, self.history, self.history_times, self.heads)
+        for old_array, new_array in zip(old, new):
+            new_array[:len(old_array)] = old_array
+
+    def slot(self, host, index):
+        key = (host, index)
+        row = self.slots.get(key)
+        if row is None:
+            row = self.slots[key] = len(self.keys)
+            self.keys.append(key)
+            self.names.append(f"GPU {index}")
+            if row >= self.capacity:
+                self.grow()
+        return row
+
+    def ingest(self, packet):
+        try:
+            kind, host, current_time, payload = decode_fleet_packet(packet)
+            # Everything below comes off the network, so it is range-checked before
+            # it reaches the arrays
+            if kind == FLEET_DEVICES:
+                devices = [(int(device['index']), str(device['name'])) for device in json.loads(payload)]
+                if any(not 0 <= index < FLEET_MAX_DEVICES for index, _ in devices):
+                    raise ValueError("GPU index out of range")
+            elif kind == FLEET_SAMPLES:
+                records = np.frombuffer(payload, dtype=FLEET_RECORD)
+                if (len(records) > FLEET_MAX_DEVICES or (records['index'] >= FLEET_MAX_DEVICES).any()
+                        or (records['health'] >= len(HEALTH_STATES)).any()):
+                    raise ValueError("sample record out of range")
+            else:
+                raise ValueError(f"unknown packet kind {kind}")
+        except (ValueError, KeyError, TypeError, struct.error):
+            self.errors += 1
+            return
+        with self.lock:
+            self.packets += 1
+            if kind == FLEET_DEVICES:
+                for index, name in devices:
+                    self.names[self.slot(host, index)] = name
+                return
+            rows = np.array([self.slot(host, index) for index in records['index'].tolist()], dtype=np.intp)
+            values = records['values']
+            self.values[rows] = values
+            self.times[rows] = current_time
+            self.health[rows] = records['health']
+            self.alerts[rows] = records['alerts']
+            positions = self.heads[rows] % self.history_length
+            self.history[rows, positions] = values
+            self.history_times[rows, positions] = current_time
+            self.heads[rows] += 1
+
+    def rows(self, now=None):
+        # One dict per device for the fleet table
+        now = time.time() if now is None else now
+        with self.lock:
+            count = len(self.keys)
+            values = self.values[:count].copy()
+            ages = now - self.times[:count]
+            health = self.health[:count].copy()
+            alerts = self.alerts[:count].copy()
+            keys = list(self.keys)
+            names = list(self.names)
+        columns = {field: values[:, i] for i, field in enumerate(FLEET_FIELDS)}
+        return [{
+            'device': f"{host}:{index}",
+            'host': host,
+            'gpu': index,
+            'name': names[row],
+            'gpu_util': round(float(columns['gpu_util'][row]), 1),
+            'memory_percent': round(float(columns['memory_percent'][row]), 1),
+            'power_draw': round(float(columns['power_draw'][row]), 1),
+            'temperature': round(float(columns['temperature'][row]), 1),
+            'health': "Stale" if ages[row] > FLEET_STALE_SECONDS else HEALTH_STATES[health[row]],
+            'alerts': int(alerts[row]),
+            'age': round(float(ages[row]), 1)
+        } for row, (host, index) in enumerate(keys)]
+
+def serve_fleet(aggregator, address):
+    # Feeds the aggregator from UDP datagrams and TCP connections on the same port
+    udp = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    udp.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4 * 1024 * 1024)
+    udp.bind(address)
+    tcp = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    tcp.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    tcp.bind(address)
+    tcp.listen(128)
+
+    def receive_udp():
+        while True:
+            aggregator.ingest(udp.recv(65535))
+
+    def receive_tcp(conn):
+        with conn, conn.makefile('rb') as stream:
+            while True:
+                header = stream.read(FLEET_LENGTH.size)
+                if len(header) < FLEET_LENGTH.size:
+                    return
+                length = FLEET_LENGTH.unpack(header)[0]
+                if length > FLEET_MAX_PACKET:
+                    # Not a fleet agent, or out of step with the framing; nothing after this can be trusted
+                    aggregator.errors += 1
+                    return
+                aggregator.ingest(stream.read(length))
+
+    def accept_tcp():
+        while True:
+            conn, _ = tcp.accept()
+            threading.Thread(target=receive_tcp, args=(conn,), daemon=True).start()
+
+    threading.Thread(target=receive_udp, daemon=True, name="fleet-udp").start()
+    threading.Thread(target=accept_tcp, daemon=True, name="fleet-tcp").start()
+
+def render_fleet_openmetrics(aggregator):
+    rows = aggregator.rows()
+    lines = []
+    for key, name, help_text in FLEET_GAUGES:
+        lines.append(f"# TYPE {name} gauge")
+        lines.append(f"# HELP {name} {help_text}")
+        for row in rows:
+            lines.append(f'{name}{{host="{escape_label(row["host"])}",gpu="{row["gpu"]}"}} {row[key]!r}')
+    lines.append("# EOF")
+    return ("\n".join(lines) + "\n").encode('utf-8')
+
+FLEET_GAUGES = [
+    ('gpu_util', 'fleet_gpu_utilization_percent', "GPU utilization reported by the agent."),
+    ('memory_percent', 'fleet_gpu_memory_used_percent', "Framebuffer memory in use."),
+    ('power_draw', 'fleet_gpu_power_draw_watts', "Current power draw."),
+    ('temperature', 'fleet_gpu_temperature_celsius', "GPU core temperature."),
+    ('alerts', 'fleet_gpu_alerts', "Alert rules raised on the agent."),
+    ('age', 'fleet_gpu_sample_age_seconds', "Time since the device last reported.")
+]
+
+class HeadlessAggregator:
+    # Aggregates without a window, serving the fleet as OpenMetrics on --listen
+    def __init__(self, address, listen=None):
+        self.aggregator = FleetAggregator()
+        serve_fleet(self.aggregator, address)
+        self.metrics_page = b"# EOF\n"
+        self.server = None
+        if listen:
+            self.server = HTTPServer(listen, MetricsHandler)
+            self.server.monitor = self
+            threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def run(self):
+        try:
+            while True:
+                time.sleep(1)
+                self.metrics_page = render_fleet_openmetrics(self.aggregator)
+        except KeyboardInterrupt:
+            pass
+
+def simulate_agents(address, hosts, devices, interval=1.0, transport='udp'):
+    # Local stand-ins for `hosts` agents with `devices` fake GPUs each, all sent
+    # from this process on one drift-free schedule
+    backend = FakeBackend(devices=devices)
+    static = [{'name': f"Simulated GPU {index}", 'uuid': f"SIM-{index}"} for index in range(devices)]
+    agents = [FleetAgent(address, transport, host=f"sim-{host:04d}", devices=static) for host in range(hosts)]
+    scheduler = RateScheduler({'gpu': interval})
+    tick = 0
+    try:
+        while True:
+            scheduler.wait()
+            now = time.time()
+            for host, agent in enumerate(agents):
+                # Each host runs at its own phase of the fake script
+                agent.send(now, [(index, backend.gpu_scripts[index][(tick + host * 7) % len(backend.gpu_scripts[index])], ())
+                                 for index in range(devices)])
+            tick += 1
+    except KeyboardInterrupt:
+        pass
+
+DRAIN_INTERVAL_MS = 100  # how often the Tk main loop picks up new snapshots
+SAMPLER_STOP_SECONDS = 5  # how long closing the window waits for the sampler thread's last tick
+STORE_REFRESH_SECONDS = 10  # how often graphs of a stored time range are re-queried
+GRAPH_MAX_POINTS = 2000  # rows requested from the store for one graph
+
+ALERT_LOG_ROWS = 1000
+
+TASK_HEADINGS = {
+    'gpu': 'GPU',
+    'pid': 'PID',
+    'user': 'User',
+    'name': 'Name',
+    'type': 'Type',
+    'gpu_memory': 'GPU Memory',
+    'sm_util': 'SM %',
+    'sm_avg': 'SM Avg %',
+    'sm_trend': 'SM Trend',
+    'mem_util': 'Mem %',
+    'enc_util': 'Enc %',
+    'cpu_percent': 'CPU %',
+    'rss': 'RSS (MiB)',
+    'container': 'Container',
+    'started': 'Started',
+    'command': 'Command'
+}
+# Initial column widths in pixels; the command line takes whatever is left
+TASK_WIDTHS = {'gpu': 40, 'pid': 70, 'user': 90, 'name': 140, 'type': 50, 'gpu_memory': 100, 'sm_util': 50,
+               'sm_avg': 70, 'sm_trend': 240, 'mem_util': 50, 'enc_util': 50, 'cpu_percent': 60, 'rss': 80,
+               'container': 110, 'started': 140, 'command': 300}
+
+# Graph time ranges offered in the Overview; None plots the in-memory history
+GRAPH_WINDOWS = {
+    "Live": None,
+    "Last 1 h": 3600,
+    "Last 24 h": 86400,
+    "Last 7 days": 7 * 86400
+}
+RESIZE_DEBOUNCE_MS = 150  # quiet period after the last <Configure> before the graphs are resized
+
+def to_datenums(times):
+    # Epoch seconds to matplotlib date numbers in local time, in one vectorised step.
+    # The UTC offset is looked up once; only a range spanning a DST change falls back
+    # to converting every timestamp.
+    times = np.asarray(times, dtype=np.float64)
+    epoch = mdates.date2num(datetime.datetime(1970, 1, 1))
+    first, last = (datetime.datetime.fromtimestamp(t).astimezone().utcoffset() for t in (times[0], times[-1]))
+    if first == last:
+        return epoch + (times + first.total_seconds()) / 86400
+    return mdates.date2num([datetime.datetime.fromtimestamp(t) for t in times])
+
+def downsample_minmax(x, y, buckets):
+    # Reduce a series to at most about 2 * buckets points by keeping the minimum and
+    # the maximum of each bucket of consecutive samples, in their original order.
+    # Peaks and single-sample spikes survive whatever the history length, and with
+    # one bucket per pixel the plot looks the same as with every sample.
+    n = len(y)
+    if buckets <= 0 or n <= 2 * buckets:
+        return x, y
+    size = n // buckets
+    blocks = y[:size * buckets].reshape(buckets, size)
+    offsets = np.arange(buckets) * size
+    indices = [blocks.argmin(axis=1) + offsets, blocks.argmax(axis=1) + offsets, [0, n - 1]]
+    if size * buckets < n:
+        tail = y[size * buckets:]
+        indices.append([size * buckets + tail.argmin(), size * buckets + tail.argmax()])
+    indices = np.unique(np.concatenate(indices))
+    return x[indices], y[indices]
+
+def series_values(data, times, key):
+    # Rolled-up store rows carry a min and a max per row; plotting both keeps the
+    # peaks that the per-row mean would flatten
+    if f'{key}_min' in data:
+        return np.repeat(times, 2), np.column_stack((data[f'{key}_min'], data[f'{key}_max'])).ravel()
+    return times, data[key]
+
+class PerformanceGraphs:
+    # The six performance graphs, drawn with blitting. The axes and their artists
+    # are created once; each update moves the new samples into the existing
+    # artists, restores the cached background and redraws only the axes regions.
+    # A full draw happens only when an axis has to change its limits or the
+    # canvas was resized, and that draw refreshes the cached background.
+    X_PADDING = 0.1  # fraction of the visible span left free past the newest sample
+    MIN_X_PADDING = 10 / 86400  # at least 10 s, in matplotlib date units (days)
+    Y_MARGIN = 0.1
+
+    def __init__(self, fig, canvas):
+        self.fig = fig
+        self.canvas = canvas
+        self.background = None
+        self.needs_layout = True
+        self.needs_draw = False
+        self.build()
+        canvas.mpl_connect('draw_event', self.on_draw)
+
+    def build(self):
+        # Set the background color to match the cyborg theme
+        self.fig.patch.set_facecolor('#060606')
+
+        # Create a 3x2 grid of subplots
+        gs = self.fig.add_gridspec(3, 2, wspace=0.3, hspace=0.4)
+
+        # Common style for all subplots
+        plot_style = {
+            'facecolor': '#222222',
+        }
+
+        ax1 = self.fig.add_subplot(gs[0, 0], **plot_style)
+        ax2 = self.fig.add_subplot(gs[0, 1], **plot_style)
+        ax3 = self.fig.add_subplot(gs[1, 0], **plot_style)
+        ax4 = self.fig.add_subplot(gs[1, 1], **plot_style)
+        ax5 = self.fig.add_subplot(gs[2, 0], **plot_style)
+        ax6 = self.fig.add_subplot(gs[2, 1], **plot_style)
+
+        # (axis, history key, colour, legend label) for every plotted series
+        series = [
+            (ax1, 'gpu_util', '#00bc8c', 'GPU'),
+            (ax1, 'cuda_util', '#3498db', 'CUDA'),
+            (ax1, 'mem_ctrl_util', '#f39c12', 'Memory controller'),
+            (ax2, 'power', '#e74c3c', None),
+            (ax3, 'mem_bandwidth', '#f39c12', 'Available'),
+            (ax3, 'mem_throughput', '#f1c40f', 'In use'),
+            (ax4, 'pcie_bandwidth', '#2ecc71', 'Link'),
+            (ax4, 'pcie_tx', '#3498db', 'TX'),
+            (ax4, 'pcie_rx', '#e74c3c', 'RX'),
+            (ax5, 'flops_per_watt', '#9b59b6', None),
+            (ax6, 'temp', '#e67e22', None)
+        ]
+        self.lines = {}
+        # Ceilings are dashed, the traffic measured against them solid
+        ceilings = ('mem_bandwidth', 'pcie_bandwidth')
+        for ax, key, color, label in series:
+            self.lines[key], = ax.plot([], [], '--' if key in ceilings else '-', color=color, label=label, animated=True)
+        for ax in (ax1, ax3, ax4):
+            ax.legend(loc='upper left', fontsize='x-small', facecolor='#222222', edgecolor='#444444', labelcolor='#ffffff')
+
+        ax1.set_ylim(0, 100)
+        ax1.set_ylabel('Utilization %', color='#ffffff')
+        ax1.set_title('GPU Utilization', color='#ffffff')
+
+        ax2.set_ylabel('Power (W)', color='#ffffff')
+        ax2.set_title('Power Usage', color='#ffffff')
+
+        ax3.set_ylabel('GB/s', color='#ffffff')
+        ax3.set_title('Memory Throughput / Bandwidth', color='#ffffff')
+
+        ax4.set_ylabel('GB/s', color='#ffffff')
+        ax4.set_title('PCIe TX / RX / Link', color='#ffffff')
+
+        ax5.set_ylabel('GFLOPS/W', color='#ffffff')
+        ax5.set_title('Power Efficiency', color='#ffffff')
+
+        ax6.set_ylabel('Temperature (°C)', color='#ffffff')
+        ax6.set_title('GPU Temperature', color='#ffffff')
+
+        # Add throttling indicator
+        ax6_twin = ax6.twinx()
+        self.throttle_patch = Polygon(np.zeros((0, 2)), closed=True, alpha=0.3, color='red', animated=True)
+        ax6_twin.add_patch(self.throttle_patch)
+        ax6_twin.set_ylim(0, 1)
+        ax6_twin.set_yticks([])
+
+        for ax in [ax1, ax2, ax3, ax4, ax5, ax6, ax6_twin]:
+            ax.tick_params(colors='#ffffff')
+            ax.xaxis.set_major_formatter(mdates.DateFormatter('%H:%M:%S'))
+            ax.xaxis.set_major_locator(mdates.AutoDateLocator())
+            for spine in ax.spines.values():
+                spine.set_edgecolor('#444444')
+                spine.set_linewidth(0.5)
+
+        self.fig.autofmt_xdate()
+
+        self.axes = [ax1, ax2, ax3, ax4, ax5, ax6]
+        # Axes whose y range follows the data, with the series that decide it
+        self.autoscaled = [(ax2, ['power']), (ax3, ['mem_bandwidth', 'mem_throughput']),
+                           (ax4, ['pcie_bandwidth', 'pcie_tx', 'pcie_rx']),
+                           (ax5, ['flops_per_watt']), (ax6, ['temp'])]
+        self.artists = list(self.lines.values()) + [self.throttle_patch]
+
+    def invalidate(self):
+        # Recompute every limit on the next update, e.g. after switching devices
+        self.needs_layout = True
+
+    def update(self, data):
+        self.set_data(data)
+        self.render()
+
+    def set_data(self, data):
+        # Copies what it needs out of `data` (a RingBuffer or a MetricStore query
+        # result), so the history may change as soon as this returns
+        if len(data['time']) == 0:
+            return
+
+        # Every series is reduced to about one min/max pair per horizontal pixel of
+        # its axes before it reaches an artist, so drawing costs the same for 300
+        # samples as for a week of history
+        times = to_datenums(data['time'])
+        values = {}
+        for key, line in self.lines.items():
+            x, y = downsample_minmax(*series_values(data, times, key), self.pixel_width(line.axes))
+            line.set_data(x, y)
+            values[key] = y
+
+        x, throttling = downsample_minmax(*series_values(data, times, 'throttling'), self.pixel_width(self.axes[-1]))
+        self.throttle_patch.set_xy(np.column_stack((
+            np.concatenate(([x[0]], x, [x[-1]])),
+            np.concatenate(([0], throttling, [0]))
+        )))
+
+        if self.rescale(times, values):
+            self.needs_draw = True
+
+    def pixel_width(self, ax):
+        return max(int(ax.bbox.width), 1)
+
+    def render(self):
+        if self.needs_draw or self.background is None:
+            # The draw_event handler caches the new background and draws the artists
+            self.canvas.draw()
+        else:
+            self.blit()
+
+    def rescale(self, times, values):
+        # Only move a limit when the data has left it; returns True if anything moved
+        changed = False
+        left, right = self.axes[0].get_xlim()
+        if self.needs_layout or times[-1] > right or times[0] < left:
+            span = times[-1] - times[0]
+            limits = (times[0], times[-1] + max(span * self.X_PADDING, self.MIN_X_PADDING))
+            date_format = '%H:%M:%S' if span < 1 else '%m-%d %H:%M'  # span is in days
+            for ax in self.axes:
+                ax.set_xlim(limits)
+                ax.xaxis.set_major_formatter(mdates.DateFormatter(date_format))
+            changed = True
+
+        for ax, keys in self.autoscaled:
+            low = min(float(values[key].min()) for key in keys)
+            high = max(float(values[key].max()) for key in keys)
+            bottom, top = ax.get_ylim()
+            # Limits are widened as soon as the data leaves them, and only narrowed
+            # when the x range moves anyway and a full draw is due
+            if changed or low < bottom or high > top:
+                margin = (high - low) * self.Y_MARGIN or max(abs(high) * self.Y_MARGIN, 1)
+                limits = (low - margin, high + margin)
+                if limits != (bottom, top):
+                    ax.set_ylim(limits)
+                    changed = True
+
+        self.needs_layout = False
+        return changed
+
+    def on_draw(self, event):
+        # Cache everything but the data artists, then draw them over it
+        self.needs_draw = False
+        self.background = self.canvas.copy_from_bbox(self.fig.bbox)
+        self.draw_artists()
+
+    def draw_artists(self):
+        for artist in self.artists:
+            self.fig.draw_artist(artist)
+
+    def blit(self):
+        self.canvas.restore_region(self.background)
+        self.draw_artists()
+        for ax in self.axes:
+            self.canvas.blit(ax.bbox)
+
+def sort_value(value):
+    # Numbers sort numerically, text case-insensitively, and 'N/A' below everything
+    if value is None or value == 'N/A':
+        return (0, 0)
+    return (1, value.lower() if isinstance(value, str) else value)
+
+def gpu_memory_key(process):
+    return process['gpu_memory'] if process['gpu_memory'] != 'N/A' else -1
+
+class ProcessTable:
+    # A Treeview kept in sync with a process list by (gpu, pid). A refresh only
+    # inserts, deletes, updates or moves the rows that changed, so selection and
+    # scroll position survive and the Tk work follows the changes rather than the
+    # table size. Clicking a heading sorts by that column. With `virtual=True` only
+    # the rows that fit on screen exist in the Treeview and a separate scrollbar
+    # pages through the sorted list, so thousands of processes cost no more than a
+    # screenful. `key` names a row, `sort_keys` overrides how a column sorts and
+    # `descending_columns` sort largest first on their first click.
+    def __init__(self, parent, columns, headings, height=None, virtual=False,
+                 sort_column='gpu_memory', descending=True, widths=TASK_WIDTHS,
+                 key=lambda process: f"{process.get('gpu', '')}:{process['pid']}",
+                 sort_keys=None, descending_columns=('gpu_memory',)):
+        self.columns = columns
+        self.headings = headings
+        self.virtual = virtual
+        self.sort_column = sort_column
+        self.descending = descending
+        self.key = key
+        self.sort_keys = sort_keys or {}
+        self.descending_columns = descending_columns
+
+        options = {'height': height} if height else {}
+        self.tree = ttk.Treeview(parent, columns=columns, show='headings', bootstyle="info", **options)
+        for column in columns:
+            self.tree.heading(column, command=lambda column=column: self.sort_by(column))
+            self.tree.column(column, width=widths.get(column, 100), stretch=column in ('name', 'command'))
+        self.update_headings()
+
+        self.rows = []  # every (iid, values) pair, sorted
+        self.shown = {}  # iid -> values of the rows currently in the Treeview
+        self.order = []  # iids in Treeview order
+        self.offset = 0
+
+        self.scrollbar = None
+        if virtual:
+            self.scrollbar = ttk.Scrollbar(parent, orient=tk.VERTICAL, command=self.on_scrollbar)
+            self.tree.bind("<MouseWheel>", lambda event: self.scroll(-1 if event.delta > 0 else 1))
+            self.tree.bind("<Button-4>", lambda event: self.scroll(-1))
+            self.tree.bind("<Button-5>", lambda event: self.scroll(1))
+            self.tree.bind("<Configure>", lambda event: self.render())
+
+    def update_headings(self):
+        for column in self.columns:
+            arrow = (" ▼" if self.descending else " ▲") if column == self.sort_column else ""
+            self.tree.heading(column, text=self.headings[column] + arrow)
+
+    def sort_by(self, column):
+        if column == self.sort_column:
+            self.sort(column, not self.descending)
+        else:
+            self.sort(column, column in self.descending_columns)
+
+    def sort(self, column, descending):
+        self.sort_column, self.descending = column, descending
+        self.update_headings()
+        self.sort_rows()
+        self.render()
+
+    def update(self, processes):
+        self.rows = [(self.key(process), tuple(process.get(column, 'N/A') for column in self.columns))
+                     for process in processes]
+        self.sort_rows()
+        self.render()
+
+    def sort_rows(self):
+        position = self.columns.index(self.sort_column)
+        key = self.sort_keys.get(self.sort_column, sort_value)
+        self.rows.sort(key=lambda row: key(row[1][position]), reverse=self.descending)
+
+    def visible_rows(self):
+        # Rows that fit below the heading, measured from the first row's bounding box
+        height = self.tree.winfo_height()
+        box = self.tree.bbox(self.order[0]) if self.order else None
+        if box:
+            return max(1, (height - box[1]) // box[3])
+        return max(1, height // 20)
+
+    def render(self):
+        rows = self.rows
+        if self.virtual:
+            count = self.visible_rows()
+            self.offset = max(0, min(self.offset, len(rows) - count))
+            rows = rows[self.offset:self.offset + count]
+            if self.rows:
+                self.scrollbar.set(self.offset / len(self.rows), (self.offset + len(rows)) / len(self.rows))
+            else:
+                self.scrollbar.set(0, 1)
+        self.sync(rows)
+
+    def sync(self, rows):
+        wanted = dict(rows)
+        removed = [iid for iid in self.order if iid not in wanted]
+        if removed:
+            self.tree.delete(*removed)
+            for iid in removed:
+                del self.shown[iid]
+        order = [iid for iid in self.order if iid in wanted]
+
+        for index, (iid, values) in enumerate(rows):
+            if iid not in self.shown:
+                self.tree.insert('', index, iid=iid, values=values)
+                order.insert(index, iid)
+            else:
+                if self.shown[iid] != values:
+                    self.tree.item(iid, values=values)
+                if order[index] != iid:
+                    self.tree.move(iid, '', index)
+                    order.remove(iid)
+                    order.insert(index, iid)
+            self.shown[iid] = values
+        self.order = order
+
+    def scroll(self, rows):
+        self.offset += rows
+        self.render()
+
+    def on_scrollbar(self, action, amount, unit=None):
+        count = self.visible_rows()
+        if action == 'moveto':
+            self.offset = int(float(amount) * len(self.rows))
+        elif unit == 'pages':
+            self.offset += int(amount) * count
+        else:
+            self.offset += int(amount)
+        self.render()
 
 class GPUMonitor:
-    def __init__(self, master):
+    def __init__(self, master, backend=None, history_length=DEFAULT_HISTORY_LENGTH, store=None,
+                 periods=SAMPLING_PERIODS, rules=DEFAULT_RULES, record=None, speed=1.0):
         self.master = master
         master.title("Enhanced GPU Resource Monitor")
         master.geometry("1200x1200")
+        master.protocol("WM_DELETE_WINDOW", self.on_close)
 
-        pynvml.nvmlInit()
-        self.handle = pynvml.nvmlDeviceGetHandleByIndex(0)  # Assuming single GPU system
-
-        self.data = {
-            'time': [],
-            'gpu_util': [],
-            'mem_util': [],
-            'power': [],
-            'temp': [],
-            'mem_used': [],
-            'mem_free': [],
-            'cuda_util': [],
-            'mem_bandwidth': [],
-            'pcie_bandwidth': [],
-            'flops_per_watt': [],
-            'throttling': []
-        }
-
-        self.max_clock_speed = self.get_max_clock_speed()
+        self.backend = backend if backend is not None else NVMLBackend()
+        self.footprint = MonitorFootprint()
+        self.sampler = DeviceSampler(self.backend, timeout=periods['gpu'], footprint=self.footprint)
+        if isinstance(self.backend, ReplayBackend):
+            self.scheduler = ReplayScheduler(self.backend, speed)
+        else:
+            self.scheduler = RateScheduler(periods)
+        self.recorder = SnapshotRecorder(record, self.sampler) if record else None
+        self.rules = RuleEngine(rules, len(self.sampler.devices))
+        self.device_names = [info['name'] for info in self.sampler.static]
+        self.device_keys = [info['uuid'] for info in self.sampler.static]
+        self.selected_device = 0
+
+        # One history per device, written by the sampler thread under data_lock and
+        # seeded from the on-disk store so a restart keeps the recent graphs
+        self.store = store
+        self.data = [RingBuffer(HISTORY_FIELDS, history_length) for _ in self.sampler.devices]
+        self.data_lock = threading.Lock()
+        if self.store:
+            self.load_stored_history()
+
+        # Graph time range; stored ranges are re-queried every STORE_REFRESH_SECONDS
+        self.graph_window = None
+        self.window_loaded_at = 0
+
+        # The sampler thread only publishes snapshots; every widget is updated on the
+        # Tk main loop, which drains the queue every DRAIN_INTERVAL_MS
+        self.snapshots = SnapshotQueue()
+        self.latest = {}  # latest DeviceSample per device, main thread only
+        self.alerts = {}  # raised (rule, severity) pairs per device, main thread only
 
         self.create_widgets()
+        self.stopping = threading.Event()
         self.update_thread = threading.Thread(target=self.update_stats, daemon=True)
         self.update_thread.start()
+        self.master.after(DRAIN_INTERVAL_MS, self.drain_snapshots)
+        self.lag_deadline = time.perf_counter() + FOOTPRINT_LAG_INTERVAL_MS / 1000
+        self.master.after(FOOTPRINT_LAG_INTERVAL_MS, self.measure_loop_lag)
+        self.master.after(FOOTPRINT_REFRESH_MS, self.update_footprint)
+
+    def load_stored_history(self):
+        now = time.time()
+        for index, key in enumerate(self.device_keys):
+            history = self.data[index]
+            # Only raw rows match the live history's resolution
+            rows = self.store.query(key, now - history.capacity, now, tier='raw')
+            for i in range(len(rows['time'])):
+                history.append({name: rows[name][i] for name in HISTORY_FIELDS})
 
     def create_widgets(self):
         self.notebook = ttk.Notebook(self.master)
-        self.notebook.pack(fill=BOTH, expand=YES, padx=10, pady=10)
+        self.notebook.pack(fill=tk.BOTH, expand=tk.YES, padx=10, pady=10)
 
         # Overview Tab
-        overview_frame = ttk.Frame(self.notebook)
+        self.overview_frame = overview_frame = ttk.Frame(self.notebook)
         self.notebook.add(overview_frame, text="Overview")
 
+        # Device selector, the rest of the Overview tab follows the selected GPU
+        device_frame = ttk.Frame(overview_frame)
+        device_frame.pack(fill=tk.X, pady=(0, 10), padx=5)
+
+        ttk.Label(device_frame, text="Device:").pack(side=tk.LEFT, padx=(0, 5))
+        self.device_selector = ttk.Combobox(device_frame, state="readonly", width=40,
+                                            values=[f"{index}: {name}" for index, name in enumerate(self.device_names)])
+        if self.device_names:
+            self.device_selector.current(self.selected_device)
+        self.device_selector.bind("<<ComboboxSelected>>", lambda event: self.select_device(self.device_selector.current()))
+        self.device_selector.pack(side=tk.LEFT)
+
+        ttk.Label(device_frame, text="Graphs:").pack(side=tk.LEFT, padx=(15, 5))
+        windows = list(GRAPH_WINDOWS) if self.store else ["Live"]
+        self.window_selector = ttk.Combobox(device_frame, state="readonly", width=12, values=windows)
+        self.window_selector.current(0)
+        self.window_selector.bind("<<ComboboxSelected>>", lambda event: self.select_window(GRAPH_WINDOWS[self.window_selector.get()]))
+        self.window_selector.pack(side=tk.LEFT)
+
         # System Info frame
         system_frame = ttk.Labelframe(overview_frame, text="System Information", bootstyle="info")
-        system_frame.pack(fill=X, pady=(0, 10), padx=5)
+        system_frame.pack(fill=tk.X, pady=(0, 10), padx=5)
 
         self.system_info_label = ttk.Label(system_frame, text="Loading system information...")
         self.system_info_label.pack(padx=5, pady=5, anchor='w')
@@ -68,7 +2847,7 @@ class GPUMonitor:
 
         # Overview frame
         overview_inner_frame = ttk.Labelframe(overview_frame, text="GPU Overview", bootstyle="info")
-        overview_inner_frame.pack(fill=X, pady=(0, 10), padx=5)
+        overview_inner_frame.pack(fill=tk.X, pady=(0, 10), padx=5)
 
         self.memory_label = ttk.Label(overview_inner_frame, text="Memory Usage: ")
         self.memory_label.grid(row=0, column=0, sticky='w', padx=5, pady=2)
@@ -105,455 +2884,649 @@ class GPUMonitor:
 
         # Top Tasks frame
         tasks_frame = ttk.Labelframe(overview_frame, text="Top 5 GPU Tasks", bootstyle="info")
-        tasks_frame.pack(fill=X, pady=(0, 10), padx=5)
+        tasks_frame.pack(fill=tk.X, pady=(0, 10), padx=5)
 
-        self.tasks_tree = ttk.Treeview(tasks_frame, columns=('pid', 'name', 'type', 'gpu_memory'), show='headings', height=5, bootstyle="info")
-        self.tasks_tree.heading('pid', text='PID')
-        self.tasks_tree.heading('name', text='Name')
-        self.tasks_tree.heading('type', text='Type')
-        self.tasks_tree.heading('gpu_memory', text='GPU Memory')
-        self.tasks_tree.pack(fill=X, padx=5, pady=5)
+        self.tasks_table = ProcessTable(tasks_frame, ('pid', 'user', 'name', 'type', 'gpu_memory', 'sm_util', 'sm_avg',
+                                                    'sm_trend', 'cpu_percent', 'rss'), TASK_HEADINGS, height=5)
+        self.tasks_tree = self.tasks_table.tree
+        self.tasks_tree.pack(fill=tk.X, padx=5, pady=5)
 
         # Graphs frame
         self.graphs_frame = ttk.Labelframe(overview_frame, text="Performance Graphs", bootstyle="info")
-        self.graphs_frame.pack(fill=BOTH, expand=YES, pady=(0, 5), padx=5)
+        self.graphs_frame.pack(fill=tk.BOTH, expand=tk.YES, pady=(0, 5), padx=5)
 
         self.fig = Figure(figsize=(12, 8), dpi=100)
         self.canvas = FigureCanvasTkAgg(self.fig, master=self.graphs_frame)
+        self.graphs = PerformanceGraphs(self.fig, self.canvas)
         self.canvas.draw()
-        self.canvas.get_tk_widget().pack(side=TOP, fill=BOTH, expand=YES, padx=5, pady=5)
+        self.canvas.get_tk_widget().pack(side=tk.TOP, fill=tk.BOTH, expand=tk.YES, padx=5, pady=5)
+
+        # All GPUs Tab, one row per device; double-click a row to open it in the Overview
+        devices_frame = ttk.Frame(self.notebook)
+        self.notebook.add(devices_frame, text="All GPUs")
+
+        self.devices_tree = ttk.Treeview(devices_frame, columns=('gpu', 'name', 'gpu_util', 'memory', 'power', 'temperature', 'health'), show='headings', bootstyle="info")
+        self.devices_tree.heading('gpu', text='GPU')
+        self.devices_tree.heading('name', text='Name')
+        self.devices_tree.heading('gpu_util', text='Utilization')
+        self.devices_tree.heading('memory', text='Memory')
+        self.devices_tree.heading('power', text='Power')
+        self.devices_tree.heading('temperature', text='Temperature')
+        self.devices_tree.heading('health', text='Health')
+        for index, name in enumerate(self.device_names):
+            self.devices_tree.insert('', 'end', iid=str(index), values=(index, name, '', '', '', '', ''))
+        self.devices_tree.bind("<Double-1>", self.on_device_activated)
+        self.devices_tree.pack(fill=tk.BOTH, expand=tk.YES, padx=10, pady=10)
 
         # All Tasks Tab
         all_tasks_frame = ttk.Frame(self.notebook)
         self.notebook.add(all_tasks_frame, text="All Tasks")
 
-        self.all_tasks_tree = ttk.Treeview(all_tasks_frame, columns=('pid', 'name', 'type', 'gpu_memory'), show='headings', bootstyle="info")
-        self.all_tasks_tree.heading('pid', text='PID')
-        self.all_tasks_tree.heading('name', text='Name')
-        self.all_tasks_tree.heading('type', text='Type')
-        self.all_tasks_tree.heading('gpu_memory', text='GPU Memory')
-        self.all_tasks_tree.pack(fill=BOTH, expand=YES, padx=10, pady=10)
+        self.all_tasks_table = ProcessTable(all_tasks_frame, ('gpu', 'pid', 'user', 'name', 'type', 'gpu_memory',
+                                                              'sm_util', 'sm_avg', 'mem_util', 'enc_util', 'cpu_percent',
+                                                              'rss', 'container', 'started', 'command'),
+                                            TASK_HEADINGS, virtual=True)
+        self.all_tasks_tree = self.all_tasks_table.tree
+        self.all_tasks_table.scrollbar.pack(side=tk.RIGHT, fill=tk.Y, pady=10, padx=(0, 10))
+        self.all_tasks_tree.pack(fill=tk.BOTH, expand=tk.YES, padx=(10, 0), pady=10)
+
+        # Alerts Tab, the log of alert rules raised and cleared on every GPU
+        alerts_frame = ttk.Frame(self.notebook)
+        self.notebook.add(alerts_frame, text="Alerts")
+
+        self.alerts_tree = ttk.Treeview(alerts_frame, columns=('time', 'gpu', 'rule', 'severity', 'state', 'value'), show='headings', bootstyle="info")
+        self.alerts_tree.heading('time', text='Time')
+        self.alerts_tree.heading('gpu', text='GPU')
+        self.alerts_tree.heading('rule', text='Rule')
+        self.alerts_tree.heading('severity', text='Severity')
+        self.alerts_tree.heading('state', text='State')
+        self.alerts_tree.heading('value', text='Value')
+        self.alerts_tree.pack(fill=tk.BOTH, expand=tk.YES, padx=10, pady=10)
+
+        # Monitor Health Tab, what the monitor itself costs
+        footprint_frame = ttk.Frame(self.notebook)
+        self.notebook.add(footprint_frame, text="Monitor Health")
+
+        self.footprint_tree = ttk.Treeview(footprint_frame, columns=('metric', 'unit', 'count', 'p50', 'p95', 'max'), show='headings', bootstyle="info")
+        self.footprint_tree.heading('metric', text='Metric')
+        self.footprint_tree.heading('unit', text='Unit')
+        self.footprint_tree.heading('count', text='Samples')
+        self.footprint_tree.heading('p50', text='p50')
+        self.footprint_tree.heading('p95', text='p95')
+        self.footprint_tree.heading('max', text='Max')
+        self.footprint_tree.pack(fill=tk.BOTH, expand=tk.YES, padx=10, pady=10)
+
+        # Adjust graph layout when window is resized. This replaces the canvas' own
+        # <Configure> handler, which redraws the whole figure on every event.
+        self.resize_after_id = None
+        self.canvas.get_tk_widget().bind("<Configure>", self.on_resize)
 
-        # Adjust graph layout when window is resized
-        self.graphs_frame.bind("<Configure>", self.on_resize)
-        time.sleep(1)
+    def on_resize(self, event):
+        # Dragging the window fires a stream of <Configure> events; resize once the
+        # size has been stable for RESIZE_DEBOUNCE_MS
+        if self.resize_after_id:
+            self.master.after_cancel(self.resize_after_id)
+        self.resize_after_id = self.master.after(RESIZE_DEBOUNCE_MS, self.apply_resize, event)
+
+    def apply_resize(self, event):
+        self.resize_after_id = None
+        self.canvas.resize(event)
+        # The graphs keep one point pair per pixel, so resample for the new width
+        self.window_loaded_at = 0
         self.update_graph()
-        self.fig.autofmt_xdate()
-        self.canvas.draw()
-        #self.fig.tight_layout()
 
-    def on_resize(self, event):
-        # Update graph size when window is resized
+    def select_device(self, index):
+        self.selected_device = index
+        self.device_selector.current(index)
+        self.graphs.invalidate()
+        self.window_loaded_at = 0
+        self.refresh_views()
+
+    def select_window(self, seconds):
+        self.graph_window = seconds
+        self.graphs.invalidate()
+        self.window_loaded_at = 0
         self.update_graph()
 
+    def on_close(self):
+        # The sampler thread appends to the store and the recording, so it has to
+        # finish its tick before either is closed
+        self.stopping.set()
+        self.update_thread.join(SAMPLER_STOP_SECONDS)
+        if self.update_thread.is_alive():
+            print("The sampler did not stop in time; leaving the history and recording as they are")
+        else:
+            if self.store:
+                self.store.close()
+                self.store = None
+            if self.recorder:
+                self.recorder.close()
+                self.recorder = None
+        self.master.destroy()
+
+    def on_device_activated(self, event):
+        selection = self.devices_tree.selection()
+        if selection:
+            self.select_device(int(selection[0]))
+            self.notebook.select(self.overview_frame)
+
     def update_stats(self):
-        while True:
+        # Runs on the sampler thread and must not touch any widget
+        while not self.stopping.is_set():
+            due = self.scheduler.wait()
+            if due is None or self.stopping.is_set():
+                return  # closing, or the end of a replay, where the window keeps showing its last state
             try:
-                gpu_info = self.get_gpu_info()
-                process_info = self.get_process_info()
-                system_info = self.get_system_info()
-
-                # Update system info
-                self.system_info_label.config(text=system_info)
-                
-                # Update CUDA version
-                try:
-                    cuda_version = pynvml.nvmlSystemGetCudaDriverVersion()
-                    cuda_version_str = f"{cuda_version // 1000}.{(cuda_version % 1000) // 10}"
-                    self.cuda_version_label.config(text=f"CUDA Version: {cuda_version_str}")
-                except pynvml.NVMLError as e:
-                    print(f"Error getting CUDA version: {e}")
-                    self.cuda_version_label.config(text="CUDA Version: Unknown")
-
-                # Check ECC memory status if supported, otherwise show alternative info
-                try:
-                    ecc_mode = pynvml.nvmlDeviceGetEccMode(self.handle)
-                    ecc_status = "Enabled" if ecc_mode[0] == pynvml.NVML_FEATURE_ENABLED else "Disabled"
-                    self.ecc_memory_label.config(text=f"ECC Memory: {ecc_status}")
-                except pynvml.NVMLError as e:
-                    if str(e) == "Not Supported":
-                        # ECC not supported, show memory type instead
-                        try:
-                            mem_info = pynvml.nvmlDeviceGetMemoryInfo(self.handle)
-                            total_memory = mem_info.total / (1024**3)  # Convert to GB
-                            self.ecc_memory_label.config(text=f"GPU Memory: {total_memory:.2f} GB")
-                        except pynvml.NVMLError as mem_error:
-                            print(f"Error getting memory info: {mem_error}")
-                            self.ecc_memory_label.config(text="GPU Memory: Unknown")
-                    else:
-                        print(f"Error getting ECC memory status: {e}")
-                        self.ecc_memory_label.config(text="ECC Memory: Unknown")
-
-                # Determine overall health
-                overall_health = self.determine_overall_health(gpu_info)
-                self.overall_health_label.config(text=f"Overall GPU Health: {overall_health}")
-
-                # Update labels with health status
-                self.memory_label.config(text=f"Memory Usage: {gpu_info['memory_used']}/{gpu_info['memory_total']} MB ({gpu_info['memory_percent']}%) - {self.get_status(gpu_info['memory_percent'], [80, 95])}")
-                self.utilization_label.config(text=f"GPU Utilization: {gpu_info['gpu_util']}% - {self.get_status(gpu_info['gpu_util'], [80, 95])}")
-                self.power_label.config(text=f"Power Usage: {gpu_info['power_draw']}W / {gpu_info['power_limit']}W - {self.get_status(gpu_info['power_draw'] / gpu_info['power_limit'] * 100, [80, 95])}")
-                self.temp_label.config(text=f"Temperature: {gpu_info['temperature']}°C - {self.get_status(gpu_info['temperature'], [70, 80])}")
-                
-                # Update GPU clock label
-                clock_status = self.get_status(gpu_info['gpu_clock_percent'], [30, 10], reverse=True)
-                clock_text = f"GPU Clock: {gpu_info['gpu_clock']} MHz ({gpu_info['gpu_clock_percent']:.1f}% of max)"
-                if clock_status != "Critical":
-                    clock_text += f" - {clock_status}"
-                else:
-                    clock_text += " - Idle"
-                self.clock_label.config(text=clock_text)
-                
-                self.memory_clock_label.config(text=f"Memory Clock: {gpu_info['memory_clock']} MHz")
-                self.cuda_util_label.config(text=f"CUDA Core Utilization: {gpu_info['cuda_util']}% - {self.get_status(gpu_info['cuda_util'], [80, 95])}")
-                self.mem_bandwidth_label.config(text=f"Memory Bandwidth: {gpu_info['mem_bandwidth']:.2f} GB/s")
-                self.pcie_bandwidth_label.config(text=f"PCIe Bandwidth: {gpu_info['pcie_bandwidth']:.2f} GB/s - {self.get_status(gpu_info['pcie_bandwidth'], [10, 5], reverse=True)}")
-                self.power_efficiency_label.config(text=f"Power Efficiency: {gpu_info['flops_per_watt']:.2f} GFLOPS/W")
-
-                # Update GPU warnings
-                warnings = self.get_gpu_warnings(gpu_info)
-                self.gpu_warnings_label.config(text=f"GPU Warnings: {', '.join(warnings) if warnings else 'None'}")
-
-                # Update data for graphs
-                current_time = time.time()
-                self.data['time'].append(current_time)
-                self.data['gpu_util'].append(gpu_info['gpu_util'])
-                self.data['mem_util'].append(gpu_info['memory_percent'])
-                self.data['power'].append(gpu_info['power_draw'])
-                self.data['temp'].append(gpu_info['temperature'])
-                self.data['mem_used'].append(gpu_info['memory_used'])
-                self.data['mem_free'].append(gpu_info['memory_total'] - gpu_info['memory_used'])
-                self.data['cuda_util'].append(gpu_info['cuda_util'])
-                self.data['mem_bandwidth'].append(gpu_info['mem_bandwidth'])
-                self.data['pcie_bandwidth'].append(gpu_info['pcie_bandwidth'])
-                self.data['flops_per_watt'].append(gpu_info['flops_per_watt'])
-                self.data['throttling'].append(1 if gpu_info['is_throttling'] else 0)
-
-                # Keep only last 5 minutes of data
-                for key in self.data:
-                    self.data[key] = self.data[key][-300:]
-
-                self.update_graph()
-                self.update_top_tasks(process_info)
-                self.update_all_tasks(process_info)
+                start = time.perf_counter()
+                snapshot = make_snapshot(self.scheduler.now(), self.sampler.sample(gpu='gpu' in due, processes='processes' in due))
+                recorder = self.recorder
+                if recorder:
+                    recorder.record(snapshot, due)
+                snapshot = self.rules.evaluate(snapshot)
+                rows = {}
+                if 'gpu' in due:
+                    rows = {index: history_row(snapshot.time, sample.gpu_info) for index, sample in snapshot.samples.items()}
+                with self.data_lock:
+                    for index, row in rows.items():
+                        self.data[index].append(row)
+                store = self.store
+                if store:
+                    for index, row in rows.items():
+                        store.append(self.device_keys[index], row)
+                self.snapshots.publish(snapshot)
+                if 'gpu' in due:
+                    self.footprint.sample_process()
+                self.footprint.record('update_stats', time.perf_counter() - start)
 
             except Exception as e:
                 print(f"Unexpected error in update_stats: {e}")
                 import traceback
                 traceback.print_exc()
 
-            time.sleep(1)  # Update every second
-
-    def get_gpu_info(self):
-        try:
-            result = subprocess.run(['nvidia-smi', '--query-gpu=memory.used,memory.total,utilization.gpu,power.draw,power.limit,temperature.gpu,clocks.sm,clocks.mem,utilization.memory,pcie.link.gen.current,pcie.link.width.current', '--format=csv,noheader,nounits'], capture_output=True, text=True, check=True)
-            values = result.stdout.strip().split(', ')
-            
-            if len(values) != 11:
-                raise ValueError(f"Expected 11 values from nvidia-smi, got {len(values)}")
-
-            memory_used = int(values[0])
-            memory_total = int(values[1])
-            memory_percent = round((memory_used / memory_total) * 100, 2)
-
-            # Calculate memory bandwidth (simplified estimation)
-            mem_clock = int(values[7])  # MHz
-            mem_width = 384  # Assuming a 384-bit memory interface, adjust as needed
-            mem_bandwidth = (mem_clock * 2 * mem_width) / 8 / 1000  # GB/s
-
-            # Calculate PCIe bandwidth (simplified estimation)
-            pcie_gen = int(values[9])
-            pcie_width = int(values[10])
-            pcie_bandwidth = pcie_gen * pcie_width * 0.985  # GB/s
-
-            # Estimate FLOPS (very rough estimation, adjust based on your GPU model)
-            cuda_cores = 10496  # Example for RTX 3090, adjust for your GPU
-            gpu_clock = int(values[6])  # MHz
-            flops = (cuda_cores * gpu_clock * 2) / 1e6  # GFLOPS
-
-            # Calculate FLOPS/Watt
-            power_draw = float(values[3])
-            flops_per_watt = flops / power_draw if power_draw > 0 else 0
-
-            # Calculate GPU clock percentage
-            gpu_clock_percent = (gpu_clock / self.max_clock_speed) * 100 if self.max_clock_speed > 0 else 0
-
-            return {
-                'memory_used': memory_used,
-                'memory_total': memory_total,
-                'memory_percent': memory_percent,
-                'gpu_util': int(values[2]),
-                'power_draw': float(values[3]),
-                'power_limit': float(values[4]),
-                'temperature': int(values[5]),
-                'gpu_clock': gpu_clock,
-                'gpu_clock_percent': gpu_clock_percent,
-                'memory_clock': int(values[7]),
-                'cuda_util': int(values[2]),  # Assuming CUDA utilization is same as GPU utilization
-                'mem_util': int(values[8]),  # Memory controller utilization
-                'mem_bandwidth': round(mem_bandwidth, 2),
-                'pcie_bandwidth': round(pcie_bandwidth, 2),
-                'flops_per_watt': round(flops_per_watt, 2),
-                'is_throttling': int(values[5]) > 80  # Assuming throttling occurs above 80°C
-            }
-        except subprocess.CalledProcessError as e:
-            print(f"Error running nvidia-smi: {e}")
-            print(f"nvidia-smi output: {e.output}")
-        except ValueError as e:
-            print(f"Error parsing nvidia-smi output: {e}")
-        except Exception as e:
-            print(f"Unexpected error in get_gpu_info: {e}")
-        
-        # Return default values if any error occurs
-        return {
-            'memory_used': 0,
-            'memory_total': 1,
-            'memory_percent': 0,
-            'gpu_util': 0,
-            'power_draw': 0,
-            'power_limit': 1,
-            'temperature': 0,
-            'gpu_clock': 0,
-            'gpu_clock_percent': 0,
-            'memory_clock': 0,
-            'cuda_util': 0,
-            'mem_util': 0,
-            'mem_bandwidth': 0,
-            'pcie_bandwidth': 0,
-            'flops_per_watt': 0,
-            'is_throttling': False
-        }
-
-    def get_process_info(self):
+    def drain_snapshots(self):
         try:
-            result = subprocess.run(['nvidia-smi', '-q', '-d', 'PIDS'], capture_output=True, text=True, check=True)
-            output = result.stdout
-
-            processes = []
-            current_process = {}
-            for line in output.split('\n'):
-                line = line.strip()
-                if line.startswith("Process ID"):
-                    if current_process:
-                        processes.append(current_process)
-                    current_process = {'pid': int(line.split()[-1])}
-                elif line.startswith("Type"):
-                    current_process['type'] = line.split()[-1]
-                elif line.startswith("Name"):
-                    current_process['name'] = ' '.join(line.split()[2:])
-                elif line.startswith("Used GPU Memory"):
-                    mem_str = line.split(':')[-1].strip()
-                    if mem_str == 'N/A':
-                        current_process['gpu_memory'] = 'N/A'
-                    else:
-                        match = re.search(r'\d+', mem_str)
-                        if match:
-                            current_process['gpu_memory'] = int(match.group())
-                        else:
-                            current_process['gpu_memory'] = 'N/A'
-
-            if current_process:
-                processes.append(current_process)
-
-            return processes
-        except subprocess.CalledProcessError as e:
-            print(f"Error running nvidia-smi for process info: {e}")
-            print(f"nvidia-smi output: {e.output}")
+            snapshots = self.snapshots.drain()
+            if snapshots:
+                # Merge oldest to newest so each device ends up with its latest sample,
+                # then render that state once
+                events = []
+                for snapshot in snapshots:
+                    self.latest.update(snapshot.samples)
+                    self.alerts.update(snapshot.alerts)
+                    events.extend(snapshot.events)
+                self.refresh_views()
+                self.footprint.timed('update_alert_log', self.update_alert_log, events)
         except Exception as e:
-            print(f"Unexpected error in get_process_info: {e}")
+            print(f"Unexpected error in drain_snapshots: {e}")
+            import traceback
+            traceback.print_exc()
+
+        self.master.after(DRAIN_INTERVAL_MS, self.drain_snapshots)
+
+    def refresh_views(self):
+        index = self.selected_device
+        if index in self.latest:
+            gpu_info, process_info = self.latest[index]
+            self.update_overview(index, gpu_info)
+            self.footprint.timed('update_graph', self.update_graph)
+            self.footprint.timed('update_top_tasks', self.update_top_tasks, process_info)
+
+        all_processes = [dict(process, gpu=gpu) for gpu, (_, processes) in sorted(self.latest.items()) for process in processes]
+        self.footprint.timed('update_all_tasks', self.update_all_tasks, all_processes)
+        self.footprint.timed('update_devices', self.update_devices)
+
+    def update_overview(self, index, gpu_info):
+        # Update system info, read once when the sampler started
+        static = self.sampler.static[index]
+        self.system_info_label.config(text=static['system_info'])
+        self.cuda_version_label.config(text=f"CUDA Version: {self.sampler.cuda_version}")
+        self.ecc_memory_label.config(text=static['ecc_info'])
+
+        # Overall health follows the alert rules raised for this GPU
+        alerts = self.alerts.get(index, ())
+        overall_health = alert_health(alerts)
+        self.overall_health_label.config(text=f"Overall GPU Health: {overall_health}")
+
+        # Update labels with health status
+        self.memory_label.config(text=f"Memory Usage: {gpu_info['memory_used']}/{gpu_info['memory_total']} MB ({gpu_info['memory_percent']}%) - {get_status(gpu_info['memory_percent'], [80, 95])}")
+        self.utilization_label.config(text=f"GPU Utilization: {gpu_info['gpu_util']}% - {get_status(gpu_info['gpu_util'], [80, 95])}")
+        self.power_label.config(text=f"Power Usage: {gpu_info['power_draw']}W / {gpu_info['power_limit']}W - {get_status(gpu_info['power_draw'] / gpu_info['power_limit'] * 100, [80, 95])}")
+        self.temp_label.config(text=f"Temperature: {gpu_info['temperature']}°C - {get_status(gpu_info['temperature'], [70, 80])}")
         
-        return []
-    
-    def get_max_clock_speed(self):
-        try:
-            # Get the maximum clock speed of the GPU
-            max_clock = pynvml.nvmlDeviceGetMaxClockInfo(self.handle, pynvml.NVML_CLOCK_GRAPHICS)
-            return max_clock
-        except pynvml.NVMLError as e:
-            print(f"Error getting max clock speed: {e}")
-            return 1500  # Default to a common max clock speed if unable to fetch
-
-    def get_system_info(self):
-        try:
-            gpu_name = pynvml.nvmlDeviceGetName(self.handle)
-            driver_version = pynvml.nvmlSystemGetDriverVersion()
-            cuda_version = pynvml.nvmlSystemGetCudaDriverVersion()
-
-            # Handle potential bytes objects
-            gpu_name = gpu_name.decode('utf-8') if isinstance(gpu_name, bytes) else gpu_name
-            driver_version = driver_version.decode('utf-8') if isinstance(driver_version, bytes) else driver_version
-
-            # CUDA version is typically returned as an integer
-            cuda_version_major = cuda_version // 1000
-            cuda_version_minor = (cuda_version % 1000) // 10
-
-            return f"GPU: {gpu_name} | Driver: {driver_version} | CUDA: {cuda_version_major}.{cuda_version_minor}"
-        except pynvml.NVMLError as e:
-            print(f"NVML Error in get_system_info: {e}")
-        except Exception as e:
-            print(f"Unexpected error in get_system_info: {e}")
+        # Update GPU clock label
+        clock_status = get_status(gpu_info['gpu_clock_percent'], [30, 10], reverse=True)
+        clock_text = f"GPU Clock: {gpu_info['gpu_clock']} MHz ({gpu_info['gpu_clock_percent']:.1f}% of max)"
+        if clock_status != "Critical":
+            clock_text += f" - {clock_status}"
+        else:
+            clock_text += " - Idle"
+        self.clock_label.config(text=clock_text)
         
-        return "Unable to retrieve system information"
+        self.memory_clock_label.config(text=f"Memory Clock: {gpu_info['memory_clock']} MHz")
+        self.cuda_util_label.config(text=f"CUDA Core Utilization: {gpu_info['cuda_util']}% - {get_status(gpu_info['cuda_util'], [80, 95])}")
+        self.mem_bandwidth_label.config(text=f"Memory Throughput: {gpu_info['mem_throughput']:.2f} / {gpu_info['mem_bandwidth']:.2f} GB/s ({gpu_info['mem_util']}%)")
+        self.pcie_bandwidth_label.config(text=f"PCIe: TX {gpu_info['pcie_tx']:.2f} / RX {gpu_info['pcie_rx']:.2f} of {gpu_info['pcie_bandwidth']:.2f} GB/s ({gpu_info['pcie_util']:.0f}%) - {get_status(gpu_info['pcie_util'], [80, 95])}")
+        self.power_efficiency_label.config(text=f"Power Efficiency: {gpu_info['flops_per_watt']:.2f} GFLOPS/W")
+
+        # Update GPU warnings
+        warnings = [rule for rule, _ in alerts]
+        self.gpu_warnings_label.config(text=f"GPU Warnings: {', '.join(warnings) if warnings else 'None'}")
+
+    def update_devices(self):
+        for index, (gpu_info, _) in self.latest.items():
+            self.devices_tree.item(str(index), values=(
+                index,
+                self.device_names[index],
+                f"{gpu_info['gpu_util']}%",
+                f"{gpu_info['memory_used']}/{gpu_info['memory_total']} MB",
+                f"{gpu_info['power_draw']}W",
+                f"{gpu_info['temperature']}°C",
+                alert_health(self.alerts.get(index, ()))
+            ))
 
-    def get_status(self, value, thresholds, reverse=False):
-        if isinstance(value, (int, float)):
-            if reverse:
-                if value > thresholds[0]:
-                    return "OK"
-                elif value > thresholds[1]:
-                    return "Warning"
-                else:
-                    return "Critical"
+    def update_alert_log(self, events):
+        # Newest first; only the last ALERT_LOG_ROWS events stay in the table
+        for event in events:
+            self.alerts_tree.insert('', 0, values=(
+                datetime.datetime.fromtimestamp(event.time).strftime('%Y-%m-%d %H:%M:%S'),
+                event.gpu,
+                event.rule,
+                event.severity,
+                event.state,
+                f"{event.value:g}"
+            ))
+        rows = self.alerts_tree.get_children()
+        if len(rows) > ALERT_LOG_ROWS:
+            self.alerts_tree.delete(*rows[ALERT_LOG_ROWS:])
+
+    def measure_loop_lag(self):
+        # How much later than asked for the Tk loop ran this callback
+        now = time.perf_counter()
+        self.footprint.record('tk_loop_lag', max(0.0, now - self.lag_deadline))
+        self.lag_deadline = now + FOOTPRINT_LAG_INTERVAL_MS / 1000
+        self.master.after(FOOTPRINT_LAG_INTERVAL_MS, self.measure_loop_lag)
+
+    def update_footprint(self):
+        for name, stats in self.footprint.stats().items():
+            values = (name, stats['unit'], stats['count'], f"{stats['p50']:.2f}", f"{stats['p95']:.2f}", f"{stats['max']:.2f}")
+            if self.footprint_tree.exists(name):
+                self.footprint_tree.item(name, values=values)
             else:
-                if value < thresholds[0]:
-                    return "OK"
-                elif value < thresholds[1]:
-                    return "Warning"
-                else:
-                    return "Critical"
-        return "Unknown"
-
-    def determine_overall_health(self, gpu_info):
-        critical_count = 0
-        warning_count = 0
-        
-        checks = [
-            (gpu_info['temperature'], [70, 80]),
-            (gpu_info['memory_percent'], [80, 95]),
-            (gpu_info['power_draw'] / gpu_info['power_limit'] * 100, [80, 95]),
-            (gpu_info['gpu_clock_percent'], [30, 10], True),  # Changed from absolute clock to percentage
-            (gpu_info['pcie_bandwidth'], [10, 5], True)
-        ]
-        
-        for value, thresholds, *args in checks:
-            status = self.get_status(value, thresholds, *args)
-            if status == "Critical" and not (value == checks[3][0] and value < checks[3][1][1]):  # Don't count low GPU clock as critical
-                critical_count += 1
-            elif status == "Warning":
-                warning_count += 1
-        
-        if critical_count > 0:
-            return "Poor"
-        elif warning_count > 1:
-            return "Fair"
-        else:
-            return "Good"
-
-    def get_gpu_warnings(self, gpu_info):
-        warnings = []
-        if gpu_info['temperature'] > 80:
-            warnings.append("High temperature")
-        if gpu_info['memory_percent'] > 95:
-            warnings.append("High memory usage")
-        if gpu_info['power_draw'] / gpu_info['power_limit'] > 0.95:
-            warnings.append("High power usage")
-        if gpu_info['gpu_clock_percent'] < 10 and gpu_info['gpu_util'] > 50:
-            warnings.append("Low GPU clock while under load")
-        if gpu_info['pcie_bandwidth'] < 5:
-            warnings.append("Low PCIe bandwidth")
-        return warnings
+                self.footprint_tree.insert('', 'end', iid=name, values=values)
+        self.master.after(FOOTPRINT_REFRESH_MS, self.update_footprint)
 
     def update_graph(self):
-        self.fig.clear()
-
-        # Get the current size of the graphs frame
-        width = self.graphs_frame.winfo_width()
-        height = self.graphs_frame.winfo_height()
-
-        # Update the figure size
-        self.fig.set_size_inches(width / self.fig.dpi, height / self.fig.dpi)
-
-        # Set the background color to match the cyborg theme
-        self.fig.patch.set_facecolor('#060606')
-
-        # Create a 3x2 grid of subplots
-        gs = self.fig.add_gridspec(3, 2, wspace=0.3, hspace=0.4)
-
-        # Common style for all subplots
-        plot_style = {
-            'facecolor': '#222222',
-        }
-
-        ax1 = self.fig.add_subplot(gs[0, 0], **plot_style)
-        ax2 = self.fig.add_subplot(gs[0, 1], **plot_style)
-        ax3 = self.fig.add_subplot(gs[1, 0], **plot_style)
-        ax4 = self.fig.add_subplot(gs[1, 1], **plot_style)
-        ax5 = self.fig.add_subplot(gs[2, 0], **plot_style)
-        ax6 = self.fig.add_subplot(gs[2, 1], **plot_style)
-
-        # Convert timestamp to datetime
-        times = [datetime.datetime.fromtimestamp(t) for t in self.data['time']]
-
-        ax1.plot(times, self.data['gpu_util'], '-', color='#00bc8c')
-        ax1.plot(times, self.data['cuda_util'], '-', color='#3498db')
-        ax1.set_ylim(0, 100)
-        ax1.set_ylabel('Utilization %', color='#ffffff')
-        ax1.set_title('GPU Utilization', color='#ffffff')
-
-        ax2.plot(times, self.data['power'], '-', color='#e74c3c')
-        ax2.set_ylabel('Power (W)', color='#ffffff')
-        ax2.set_title('Power Usage', color='#ffffff')
-
-        ax3.plot(times, self.data['mem_bandwidth'], '-', color='#f39c12')
-        ax3.set_ylabel('GB/s', color='#ffffff')
-        ax3.set_title('Memory Bandwidth', color='#ffffff')
-
-        ax4.plot(times, self.data['pcie_bandwidth'], '-', color='#2ecc71')
-        ax4.set_ylabel('GB/s', color='#ffffff')
-        ax4.set_title('PCIe Bandwidth', color='#ffffff')
-
-        ax5.plot(times, self.data['flops_per_watt'], '-', color='#9b59b6')
-        ax5.set_ylabel('GFLOPS/W', color='#ffffff')
-        ax5.set_title('Power Efficiency', color='#ffffff')
-
-        ax6.plot(times, self.data['temp'], '-', color='#e67e22')
-        ax6.set_ylabel('Temperature (°C)', color='#ffffff')
-        ax6.set_title('GPU Temperature', color='#ffffff')
-
-        # Add throttling indicator
-        ax6_twin = ax6.twinx()
-        ax6_twin.fill_between(times, self.data['throttling'], alpha=0.3, color='red')
-        ax6_twin.set_ylim(0, 1)
-        ax6_twin.set_yticks([])
-
-        for ax in [ax1, ax2, ax3, ax4, ax5, ax6, ax6_twin]:
-            ax.tick_params(colors='#ffffff')
-            ax.xaxis.set_major_formatter(mdates.DateFormatter('%H:%M:%S'))
-            ax.xaxis.set_major_locator(mdates.AutoDateLocator())
-            for spine in ax.spines.values():
-                spine.set_edgecolor('#444444')
-                spine.set_linewidth(0.5)
-
-        #self.fig.tight_layout()
-        self.fig.autofmt_xdate()
-        self.canvas.draw()
+        if self.graph_window is None:
+            # Hold the lock only while the history is copied; downsampling and
+            # drawing happen after the sampler is free to append again
+            with self.data_lock:
+                history = self.data[self.selected_device].copy()
+            self.graphs.set_data(history)
+        else:
+            # Long ranges come from the store's rolled-up tiers and change slowly
+            now = time.time()
+            if now - self.window_loaded_at < STORE_REFRESH_SECONDS:
+                return
+            self.window_loaded_at = now
+            key = self.device_keys[self.selected_device]
+            self.graphs.set_data(self.store.query(key, now - self.graph_window, now, max_points=GRAPH_MAX_POINTS))
+        self.graphs.render()
 
     def update_top_tasks(self, processes):
-        self.tasks_tree.delete(*self.tasks_tree.get_children())
-        sorted_processes = sorted(processes, 
-                                  key=lambda x: int(x['gpu_memory']) if x['gpu_memory'] != 'N/A' else -1, 
-                                  reverse=True)
-        for process in sorted_processes[:5]:
-            self.tasks_tree.insert('', 'end', values=(
-                process['pid'],
-                process['name'],
-                process['type'],
-                process['gpu_memory']
-            ))
+        # A partial selection of the 5 largest; the table then orders those by the chosen column
+        self.tasks_table.update(heapq.nlargest(5, processes, key=gpu_memory_key))
 
     def update_all_tasks(self, processes):
-        self.all_tasks_tree.delete(*self.all_tasks_tree.get_children())
-        for process in processes:
-            self.all_tasks_tree.insert('', 'end', values=(
-                process['pid'],
-                process['name'],
-                process['type'],
-                process['gpu_memory']
-            ))
+        self.all_tasks_table.update(processes)
 
     def __del__(self):
-        pynvml.nvmlShutdown()
+        if self.store:
+            self.store.close()
+        self.sampler.close()
+        self.backend.close()
+
+FLEET_HEADINGS = {
+    'device': 'Device',
+    'name': 'Name',
+    'gpu_util': 'Utilization %',
+    'memory_percent': 'Memory %',
+    'power_draw': 'Power (W)',
+    'temperature': 'Temperature',
+    'health': 'Health',
+    'alerts': 'Alerts',
+    'age': 'Age (s)'
+}
+FLEET_WIDTHS = {'device': 180, 'name': 220, 'gpu_util': 100, 'memory_percent': 90, 'power_draw': 90,
+                'temperature': 100, 'health': 80, 'alerts': 60, 'age': 70}
+FLEET_HEALTH_RANK = {"Good": 0, "Fair": 1, "Poor": 2, "Stale": 3}
+FLEET_REFRESH_MS = 1000
+
+class FleetMonitor:
+    # One row per device of every agent reporting to this aggregator, refreshed
+    # once a second from the aggregator's latest values
+    def __init__(self, master, address):
+        self.master = master
+        master.title("GPU Fleet Monitor")
+        master.geometry("1200x800")
+
+        self.aggregator = FleetAggregator()
+        serve_fleet(self.aggregator, address)
+
+        controls = ttk.Frame(master)
+        controls.pack(fill=tk.X, padx=10, pady=(10, 0))
+        ttk.Label(controls, text="Sort by:").pack(side=tk.LEFT, padx=(0, 5))
+        ttk.Button(controls, text="Hottest", bootstyle="danger",
+                   command=lambda: self.table.sort('temperature', True)).pack(side=tk.LEFT, padx=2)
+        ttk.Button(controls, text="Busiest", bootstyle="info",
+                   command=lambda: self.table.sort('gpu_util', True)).pack(side=tk.LEFT, padx=2)
+        ttk.Button(controls, text="Unhealthiest", bootstyle="warning",
+                   command=lambda: self.table.sort('health', True)).pack(side=tk.LEFT, padx=2)
+        self.summary_label = ttk.Label(controls, text=f"Listening on {address[0]}:{address[1]}")
+        self.summary_label.pack(side=tk.RIGHT)
+
+        frame = ttk.Frame(master)
+        frame.pack(fill=tk.BOTH, expand=tk.YES)
+        self.table = ProcessTable(frame, tuple(FLEET_HEADINGS), FLEET_HEADINGS, virtual=True,
+                                  sort_column='health', widths=FLEET_WIDTHS, key=lambda row: row['device'],
+                                  sort_keys={'health': FLEET_HEALTH_RANK.get},
+                                  descending_columns=('gpu_util', 'memory_percent', 'power_draw', 'temperature',
+                                                      'health', 'alerts', 'age'))
+        self.table.scrollbar.pack(side=tk.RIGHT, fill=tk.Y, pady=10, padx=(0, 10))
+        self.table.tree.pack(fill=tk.BOTH, expand=tk.YES, padx=(10, 0), pady=10)
+        self.master.after(FLEET_REFRESH_MS, self.refresh)
+
+    def refresh(self):
+        rows = self.aggregator.rows()
+        # Devices with more raised alerts come first among equals in any column
+        rows.sort(key=lambda row: row['alerts'], reverse=True)
+        self.table.update(rows)
+        hosts = len({row['host'] for row in rows})
+        stale = sum(row['health'] == "Stale" for row in rows)
+        self.summary_label.config(text=f"{len(rows)} GPUs on {hosts} hosts, {stale} stale | "
+                                       f"{self.aggregator.packets} packets, {self.aggregator.errors} rejected")
+        self.master.after(FLEET_REFRESH_MS, self.refresh)
+
+# Benchmarks of the hot paths, all on fake data so they run without a GPU. Each
+# case is timed as the best of BENCH_REPEATS runs of at least BENCH_MIN_TIME
+# seconds. Results are normalised by a fixed pure-Python loop timed alongside
+# them, so a baseline saved on one machine stays comparable on another.
+BENCH_MIN_TIME = 0.2
+BENCH_REPEATS = 5
+BENCH_TOLERANCE = 0.25  # slowdown against the baseline that counts as a regression
+BENCH_HISTORY_LENGTHS = (300, 3600, 86400)
+BENCH_FIGURE_SIZES = ((8, 6), (16, 12))  # inches at 100 dpi
+BENCH_PROCESS_COUNTS = (10, 100, 1000)
+BENCH_DEVICE_COUNTS = (1, 8, 64)
+
+def bench_processes(count, tick=0):
+    # `count` processes spread over 8 GPUs, with memory and CPU moving every tick
+    return [{'gpu': pid % 8, 'pid': 1000 + pid, 'user': f"user{pid % 5}", 'name': f"python job{pid}.py",
+             'type': 'C', 'gpu_memory': (pid * 37 + tick * 11) % 8000, 'cpu_percent': float((pid + tick) % 100),
+             'rss': 1000 + pid, 'container': 'host', 'started': '2024-01-01 00:00:00', 'command': f"python job{pid}.py --rank {pid}"}
+            for pid in range(count)]
+
+def bench_smi_process_output(count):
+    lines = []
+    for pid in range(count):
+        lines += [
+            "    Process ID                        : %d" % (1000 + pid),
+            "        Type                          : C",
+            "        Name                          : python job%d.py" % pid,
+            "        Used GPU Memory               : %d MiB" % (pid * 37 % 8000)
+        ]
+    return "\n".join(["==============NVSMI LOG==============", "", "GPU 00000000:01:00.0", "    Processes"] + lines) + "\n"
+
+def benchmark_cases():
+    # (name, callable) pairs; every callable runs one operation
+    cases = []
+    smi = NvidiaSmiBackend.__new__(NvidiaSmiBackend)  # the parsers need no NVML handle
+    csv = "12288, 24576, 87, 301.52, 350.00, 71, 1890, 9751, 64, 4, 16\n"
+    cases.append(("smi_parse_gpu", lambda: smi.parse_gpu_info(csv, FAKE_DEVICE_PROFILE)))
+    for count in BENCH_PROCESS_COUNTS:
+        output = bench_smi_process_output(count)
+        cases.append((f"smi_parse_processes[{count}]", lambda output=output: smi.parse_process_info(output)))
+
+    for count in BENCH_DEVICE_COUNTS:
+        backend = FakeBackend(devices=count)
+        engine = RuleEngine(DEFAULT_RULES, count)
+        snapshots = [make_snapshot(float(t), {index: (backend.get_gpu_info(index), []) for index in range(count)})
+                     for t in range(120)]
+        clock = iter(range(10**9))
+        cases.append((f"health_rules[{count} gpus]",
+                      lambda engine=engine, snapshots=snapshots, clock=clock: engine.evaluate(snapshots[next(clock) % 120])))
+
+    # One second of a 1000-GPU fleet: a samples packet from each of 125 hosts with 8 GPUs
+    backend = FakeBackend(devices=8)
+    aggregator = FleetAggregator()
+    packets = [encode_fleet_samples(f"host-{host}", 0.0, [(index, backend.get_gpu_info(index), ()) for index in range(8)])
+               for host in range(125)]
+
+    def ingest_fleet(aggregator=aggregator, packets=packets):
+        for packet in packets:
+            aggregator.ingest(packet)
+    cases.append(("fleet_ingest[125 hosts x 8 gpus]", ingest_fleet))
+
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    load_gui_modules()
+    backend = FakeBackend()
+    gpu_script = backend.gpu_scripts[0]
+    for length in BENCH_HISTORY_LENGTHS:
+        for size in BENCH_FIGURE_SIZES:
+            history = RingBuffer(HISTORY_FIELDS, length)
+            start = time.time() - length
+            for i in range(length):
+                history.append(history_row(start + i, gpu_script[i % len(gpu_script)]))
+            fig = Figure(figsize=size, dpi=100)
+            graphs = PerformanceGraphs(fig, FigureCanvasAgg(fig))
+            graphs.update(history)
+            clock = iter(range(10**9))
+
+            def update_graph(history=history, graphs=graphs, clock=clock):
+                # One new sample, then the redraw update_graph does for the live window
+                i = next(clock)
+                history.append(history_row(start + length + i, gpu_script[i % len(gpu_script)]))
+                graphs.update(history)
+            cases.append((f"update_graph[{length} samples, {size[0] * 100}x{size[1] * 100}]", update_graph))
+
+    try:
+        root = ttk.Window(themename="cyborg")
+        root.withdraw()
+    except tk.TclError:
+        print("No display, skipping the Treeview benchmarks")
+        return cases
+    for count in BENCH_PROCESS_COUNTS:
+        for virtual in (False, True):
+            table = ProcessTable(root, ('gpu', 'pid', 'user', 'name', 'type', 'gpu_memory', 'cpu_percent',
+                                        'rss', 'container', 'started', 'command'), TASK_HEADINGS, virtual=virtual)
+            table.tree.pack()
+            ticks = [bench_processes(count, tick) for tick in range(10)]
+            clock = iter(range(10**9))
+
+            def refresh(table=table, ticks=ticks, clock=clock):
+                table.update(ticks[next(clock) % len(ticks)])
+                table.tree.update_idletasks()
+            cases.append((f"treeview_refresh[{count} processes{', virtual' if virtual else ''}]", refresh))
+    return cases
+
+def time_case(operation, min_time=BENCH_MIN_TIME, repeats=BENCH_REPEATS):
+    # Seconds per call, best of `repeats` runs of at least `min_time` seconds
+    operation()  # warm up caches and first-draw work
+    best = float('inf')
+    for _ in range(repeats):
+        calls = 0
+        start = time.perf_counter()
+        while True:
+            operation()
+            calls += 1
+            elapsed = time.perf_counter() - start
+            if elapsed >= min_time:
+                break
+        best = min(best, elapsed / calls)
+    return best
+
+def calibration_loop():
+    total = 0
+    for i in range(100000):
+        total += i * i % 7
+    return total
+
+def run_benchmarks(name_filter=None, baseline=None, tolerance=BENCH_TOLERANCE):
+    # Prints one line per case and returns (results, names of regressed cases)
+    results = {'calibration': time_case(calibration_loop), 'cases': {}}
+    scale = results['calibration'] / baseline['calibration'] if baseline else 1.0
+    regressions = []
+    for name, operation in benchmark_cases():
+        if name_filter and name_filter not in name:
+            continue
+        seconds = results['cases'][name] = time_case(operation)
+        line = f"{name:<50} {seconds * 1e6:12.1f} us"
+        previous = baseline['cases'].get(name) if baseline else None
+        if previous:
+            ratio = seconds / (previous * scale)
+            line += f"  {ratio:6.2f}x baseline"
+            if ratio > 1 + tolerance:
+                regressions.append(name)
+                line += "  REGRESSION"
+        print(line)
+    return results, regressions
 
 if __name__ == "__main__":
-    root = ttk.Window(themename="cyborg")
-    gpu_monitor = GPUMonitor(root)
-    root.mainloop()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Enhanced GPU Resource Monitor")
+    parser.add_argument('--backend', choices=sorted(BACKENDS), default='nvml',
+                        help="sampler used to read GPU and process stats (default: nvml)")
+    parser.add_argument('--smi-path', default=DEFAULT_SMI_PATH, metavar='PATH',
+                        help="nvidia-smi binary used by the nvidia-smi backends (default: $NVIDIA_SMI or nvidia-smi)")
+    parser.add_argument('--loop-ms', type=int, metavar='MS',
+                        help="update period of the nvidia-smi-stream children (default: --interval)")
+    parser.add_argument('--fake-devices', type=int, default=1, metavar='N',
+                        help="number of GPUs simulated by the fake backend (default: 1)")
+    parser.add_argument('--history', type=int, default=DEFAULT_HISTORY_LENGTH, metavar='SAMPLES',
+                        help=f"samples of history kept per GPU (default: {DEFAULT_HISTORY_LENGTH})")
+    parser.add_argument('--measure', type=int, metavar='TICKS',
+                        help="print the per-tick sampling latency of the backend over TICKS ticks and exit")
+    parser.add_argument('--bench', action='store_true',
+                        help="run the hot-path benchmarks on fake data and exit")
+    parser.add_argument('--bench-filter', metavar='TEXT',
+                        help="only run the benchmarks whose name contains TEXT")
+    parser.add_argument('--bench-save', metavar='FILE',
+                        help="write the benchmark results to FILE as a baseline")
+    parser.add_argument('--bench-baseline', metavar='FILE',
+                        help="compare against a saved baseline and exit with status 1 on a regression")
+    parser.add_argument('--bench-tolerance', type=float, default=BENCH_TOLERANCE, metavar='FRACTION',
+                        help=f"slowdown against the baseline treated as a regression (default: {BENCH_TOLERANCE})")
+    parser.add_argument('--headless', action='store_true',
+                        help="collect without a window and export through --listen and/or --json-lines")
+    parser.add_argument('--listen', type=parse_listen_address, metavar='[HOST:]PORT',
+                        help="serve OpenMetrics text on http://HOST:PORT/metrics (headless only, host defaults to 127.0.0.1)")
+    parser.add_argument('--json-lines', metavar='FILE',
+                        help="append one JSON object per tick to FILE, or '-' for stdout (headless only)")
+    parser.add_argument('--interval', type=float, default=SAMPLING_PERIODS['gpu'], metavar='SECONDS',
+                        help=f"utilization, power and clock sampling period (default: {SAMPLING_PERIODS['gpu']})")
+    parser.add_argument('--process-interval', type=float, default=SAMPLING_PERIODS['processes'], metavar='SECONDS',
+                        help=f"process list sampling period (default: {SAMPLING_PERIODS['processes']})")
+    parser.add_argument('--rules', metavar='FILE',
+                        help="JSON list of alert rules replacing the built-in ones")
+    parser.add_argument('--record', metavar='FILE',
+                        help="record every sampled tick to FILE (gzip'd JSON lines) for later --replay")
+    parser.add_argument('--replay', metavar='FILE',
+                        help="replay a recording instead of sampling, into the window or with --headless")
+    parser.add_argument('--speed', type=float, default=1.0, metavar='N',
+                        help="replay speed, N times real time; 0 replays as fast as possible (default: 1)")
+    parser.add_argument('--store-dir', metavar='DIR',
+                        help=f"directory of the persistent metric history (default: {DEFAULT_STORE_DIR}; "
+                             f"the fake backend keeps history in memory unless this is given)")
+    parser.add_argument('--no-store', action='store_true',
+                        help="keep history in memory only")
+    parser.add_argument('--agent', type=parse_listen_address, metavar='[HOST:]PORT',
+                        help="push every sample to the fleet aggregator at HOST:PORT (implies --headless)")
+    parser.add_argument('--transport', choices=('udp', 'tcp'), default='udp',
+                        help="how --agent and --simulate-agents reach the aggregator (default: udp)")
+    parser.add_argument('--aggregate', type=parse_listen_address, metavar='[HOST:]PORT',
+                        help="receive agents on UDP and TCP HOST:PORT and show the fleet, or serve it on --listen with --headless")
+    parser.add_argument('--simulate-agents', type=int, metavar='N',
+                        help="send N simulated hosts of --fake-devices GPUs each to the --agent address and exit on Ctrl+C")
+    args = parser.parse_args()
+
+    periods = {'gpu': args.interval, 'processes': args.process_interval}
+    rules = load_rules(args.rules) if args.rules else DEFAULT_RULES
+    if args.bench:
+        baseline = None
+        if args.bench_baseline:
+            with open(args.bench_baseline, encoding='utf-8') as f:
+                baseline = json.load(f)
+        results, regressions = run_benchmarks(args.bench_filter, baseline, args.bench_tolerance)
+        if args.bench_save:
+            with open(args.bench_save, 'w', encoding='utf-8') as f:
+                json.dump(results, f, indent=1, sort_keys=True)
+        if regressions:
+            print(f"{len(regressions)} benchmark(s) slower than the baseline: {', '.join(regressions)}")
+            sys.exit(1)
+        sys.exit(0)
+
+    if args.simulate_agents:
+        if not args.agent:
+            parser.error("--simulate-agents needs --agent HOST:PORT")
+        simulate_agents(args.agent, args.simulate_agents, args.fake_devices, args.interval, args.transport)
+        sys.exit(0)
+    if args.aggregate:
+        if args.headless:
+            HeadlessAggregator(args.aggregate, listen=args.listen).run()
+        else:
+            load_gui_modules()
+            root = ttk.Window(themename="cyborg")
+            fleet_monitor = FleetMonitor(root, args.aggregate)
+            root.mainloop()
+        sys.exit(0)
+
+    # A replay must not mix old samples into the persistent history, and fake
+    # devices only get one where it was asked for
+    store = None
+    store_dir = args.store_dir or DEFAULT_STORE_DIR
+    if not (args.no_store or args.measure or args.replay or (args.backend == 'fake' and not args.store_dir)):
+        try:
+            store = MetricStore(store_dir)
+        except BlockingIOError:
+            print(f"Another monitor is writing history to {store_dir}, keeping history in memory only "
+                  f"(use --store-dir to choose another directory)", file=sys.stderr)
+
+    if args.replay:
+        try:
+            backend = ReplayBackend(args.replay)
+        except (OSError, ValueError) as e:
+            print(f"Cannot replay {args.replay}: {e}", file=sys.stderr)
+            sys.exit(1)
+    elif args.backend == 'fake':
+        backend = FakeBackend(devices=args.fake_devices)
+    elif args.backend == 'nvidia-smi':
+        backend = NvidiaSmiBackend(smi_path=args.smi_path)
+    elif args.backend == 'nvidia-smi-stream':
+        try:
+            backend = NvidiaSmiStreamBackend(smi_path=args.smi_path, loop_ms=args.loop_ms or max(int(args.interval * 1000), 100))
+        except (OSError, RuntimeError, ValueError) as e:
+            print(f"Cannot start nvidia-smi: {e}", file=sys.stderr)
+            sys.exit(1)
+    else:
+        backend = BACKENDS[args.backend]()
+
+    if args.measure:
+        stats = measure_sampling_latency(backend, args.measure)
+        print(f"{args.backend}: " + ", ".join(f"{key} {value:.3f} ms" for key, value in stats.items()))
+        backend.close()
+    elif args.headless or args.agent:
+        json_output = None
+        if args.json_lines == '-':
+            json_output = sys.stdout
+        elif args.json_lines:
+            json_output = open(args.json_lines, 'a', encoding='utf-8')
+        elif not args.listen and not args.agent:
+            json_output = sys.stdout  # nothing else to export to
+        HeadlessMonitor(backend, periods=periods, history_length=args.history,
+                        listen=args.listen, json_output=json_output, store=store, rules=rules,
+                        record=args.record, speed=args.speed,
+                        agent=(args.agent, args.transport) if args.agent else None).run()
+    else:
+        load_gui_modules()
+        root = ttk.Window(themename="cyborg")
+        gpu_monitor = GPUMonitor(root, backend, history_length=args.history, store=store, periods=periods, rules=rules,
+                                 record=args.record, speed=args.speed)
+        root.mainloop()
@@ -0,0 +1,81 @@
+import os
+import sys
+import threading
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+import autoclicker as ac
+
+STEPS = [
+    {'x': 10, 'y': 20, 'click': 'left', 'repeat': 2, 'delay': 0},
+    {'click': 'double', 'delay': 0},
+    {'x': 30, 'y': 40, 'click': 'right', 'delay': 0}
+]
+
+def test_sequence_compiles_steps_into_columns():
+    sequence = ac.ClickSequence(STEPS)
+    assert len(sequence) == 3
+    assert sequence.has_position.tolist() == [True, False, True]
+    assert sequence.xs.tolist() == [10, 0, 30]
+    assert [sequence.CLICK_TYPE_NAMES[index] for index in sequence.click_types] == ['left', 'double', 'right']
+    assert sequence.repeats.tolist() == [2, 1, 1]
+    # Missing fields take SEQUENCE_STEP_DEFAULTS
+    assert ac.ClickSequence([{}]).delays.tolist() == [ac.SEQUENCE_STEP_DEFAULTS['delay']]
+
+def test_sequence_plan_is_prepared_by_the_backend():
+    backend = ac.RecordingBackend()
+    plan = ac.ClickSequence(STEPS).plan(backend)
+    assert plan == [
+        ((10, 20, 'left', 2), 10, 20, 'left', 2, 2, 0.0),
+        ((None, None, 'left', 2), None, None, 'left', 2, 1, 0.0),
+        ((30, 40, 'right', 1), 30, 40, 'right', 1, 1, 0.0)
+    ]
+
+def test_sequence_plan_is_built_once_per_backend():
+    sequence = ac.ClickSequence(STEPS)
+    first, second = ac.RecordingBackend(), ac.RecordingBackend()
+    plan = sequence.plan(first)
+    assert sequence.plan(first) is plan
+    assert sequence.plan(second) is not plan
+
+@pytest.mark.parametrize('steps, message', [
+    ([{'x': 1}], "step 1: give both x and y"),
+    ([{}, {'click': 'middle'}], "step 2: unknown click type 'middle'"),
+    ([{'repeat': 0}], "repeat of at least 1"),
+    ([{'delay': -1}], "delay of at least 0")
+])
+def test_invalid_steps_are_rejected(steps, message):
+    with pytest.raises(ValueError, match=message):
+        ac.ClickSequence(steps)
+
+def test_sequence_round_trips_through_a_file(tmp_path):
+    path = tmp_path / 'sequence.json'
+    ac.save_sequence(path, ac.ClickSequence(STEPS))
+    assert ac.load_sequence(path).steps == STEPS
+
+def test_run_sequence_repeats_the_steps_until_max_clicks():
+    backend = ac.RecordingBackend(position=(5, 5))
+    clicks = ac.run_sequence(backend, threading.Event(), ac.ClickSequence(STEPS), max_clicks=5)
+    assert clicks == 5
+    assert [event[1:] for event in backend.events] == [
+        (10, 20, 'left', 2),
+        (10, 20, 'left', 2),  # no target, so the double click lands where the last step left the cursor
+        (30, 40, 'right', 1),
+        # The second pass only has one click left, so its first step is cut short
+        (10, 20, 'left', 1)
+    ]
+    # Mouse-button clicks, a double click being two
+    assert backend.sent == 6
+
+def test_run_sequence_stops_when_asked():
+    stop_event = threading.Event()
+    stop_event.set()
+    backend = ac.RecordingBackend()
+    assert ac.run_sequence(backend, stop_event, ac.ClickSequence(STEPS)) == 0
+    assert backend.events == []
+
+def test_empty_sequence_sends_nothing():
+    backend = ac.RecordingBackend()
+    assert ac.run_sequence(backend, threading.Event(), ac.ClickSequence([])) == 0
+    assert backend.events == []
@@ -0,0 +1,213 @@
+import importlib.util
+import json
+import os
+
+import numpy as np
+import pytest
+
+# gpu-monitor.py is a script, not an importable module name
+spec = importlib.util.spec_from_file_location(
+    'gpu_monitor', os.path.join(os.path.dirname(__file__), os.pardir, 'gpu-monitor.py'))
+gm = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(gm)
+
+HOT = {'name': "Hot", 'severity': 'critical', 'when': [('temperature', '>', 80)], 'clear': [75], 'for': 10}
+
+def snapshot(current_time, **temperatures):
+    # One sample per device, keyed gpu0, gpu1, ...
+    return gm.Snapshot(current_time, {
+        int(name[3:]): gm.DeviceSample(dict(gm.DEFAULT_GPU_INFO, temperature=value), ())
+        for name, value in temperatures.items()
+    })
+
+def states(result):
+    return [(event.gpu, event.state) for event in result.events]
+
+def test_rule_raises_only_after_holding_for_its_window():
+    engine = gm.RuleEngine([HOT], devices=1)
+    assert states(engine.evaluate(snapshot(0, gpu0=85))) == []
+    assert states(engine.evaluate(snapshot(9, gpu0=85))) == []
+    result = engine.evaluate(snapshot(10, gpu0=85))
+    assert states(result) == [(0, 'raised')]
+    assert result.alerts[0] == (("Hot", 'critical'),)
+
+def test_rule_window_restarts_when_the_condition_breaks():
+    engine = gm.RuleEngine([HOT], devices=1)
+    engine.evaluate(snapshot(0, gpu0=85))
+    engine.evaluate(snapshot(5, gpu0=70))
+    assert states(engine.evaluate(snapshot(10, gpu0=85))) == []
+    assert states(engine.evaluate(snapshot(20, gpu0=85))) == [(0, 'raised')]
+
+def test_rule_clears_only_below_its_clear_threshold():
+    engine = gm.RuleEngine([HOT], devices=1)
+    engine.evaluate(snapshot(0, gpu0=85))
+    engine.evaluate(snapshot(10, gpu0=85))
+    # Between the clear and the fire threshold the alert stays up
+    assert states(engine.evaluate(snapshot(11, gpu0=78))) == []
+    assert engine.active[0, 0]
+    assert states(engine.evaluate(snapshot(12, gpu0=74))) == [(0, 'cleared')]
+    assert engine.evaluate(snapshot(13, gpu0=74)).alerts[0] == ()
+
+def test_rule_clear_for_delays_clearing():
+    engine = gm.RuleEngine([dict(HOT, clear_for=5)], devices=1)
+    engine.evaluate(snapshot(0, gpu0=85))
+    engine.evaluate(snapshot(10, gpu0=85))
+    assert states(engine.evaluate(snapshot(11, gpu0=70))) == []
+    assert states(engine.evaluate(snapshot(15, gpu0=70))) == []
+    assert states(engine.evaluate(snapshot(16, gpu0=70))) == [(0, 'cleared')]
+
+def test_rules_are_tracked_per_device():
+    engine = gm.RuleEngine([dict(HOT, **{'for': 0})], devices=2)
+    assert states(engine.evaluate(snapshot(0, gpu0=85, gpu1=60))) == [(0, 'raised')]
+    # A device missing from a snapshot keeps its state
+    assert states(engine.evaluate(snapshot(1, gpu1=90))) == [(1, 'raised')]
+    assert engine.active[:, 0].tolist() == [True, True]
+
+def test_rule_with_several_conditions_needs_all_of_them():
+    rule = {'name': "Slow", 'severity': 'warning', 'when': [('temperature', '>', 80), ('gpu_util', '>', 50)],
+            'clear': [75, 40]}
+    engine = gm.RuleEngine([rule], devices=1)
+    assert states(engine.evaluate(snapshot(0, gpu0=85))) == []
+    busy = gm.Snapshot(1, {0: gm.DeviceSample(dict(gm.DEFAULT_GPU_INFO, temperature=85, gpu_util=60), ())})
+    assert states(engine.evaluate(busy)) == [(0, 'raised')]
+
+@pytest.mark.parametrize('change, message', [
+    ({'clear': [75, 70]}, "one threshold per"),
+    ({'when': [('nonsense', '>', 1)], 'clear': None}, "unknown metric"),
+    ({'when': [('temperature', '!=', 1)], 'clear': None}, "unknown operator"),
+    ({'severity': 'fatal'}, "severity")
+])
+def test_invalid_rules_are_rejected(change, message):
+    with pytest.raises(ValueError, match=message):
+        gm.RuleEngine([dict(HOT, **change)], devices=1)
+
+def test_default_rules_compile():
+    gm.RuleEngine(gm.DEFAULT_RULES, devices=4)
+
+def record_fake_run(path, ticks, devices=2):
+    sampler = gm.DeviceSampler(gm.FakeBackend(devices=devices))
+    recorder = gm.SnapshotRecorder(path, sampler)
+    snapshots = []
+    try:
+        for tick in range(ticks):
+            # Processes only every other tick, like a slower process group
+            due = ('gpu', 'processes') if tick % 2 == 0 else ('gpu',)
+            snapshot = gm.make_snapshot(1000.0 + tick, sampler.sample(processes='processes' in due))
+            recorder.record(snapshot, due)
+            snapshots.append((snapshot, due))
+    finally:
+        recorder.close()
+        sampler.close()
+    return sampler, snapshots
+
+def test_recording_replays_what_was_sampled(tmp_path):
+    path = tmp_path / 'run.jsonl.gz'
+    recorded_sampler, recorded = record_fake_run(path, ticks=10)
+
+    backend = gm.ReplayBackend(path)
+    scheduler = gm.ReplayScheduler(backend, speed=0)
+    sampler = gm.DeviceSampler(backend)
+    try:
+        assert sampler.static == recorded_sampler.static
+        assert sampler.cuda_version == recorded_sampler.cuda_version
+        for snapshot, due in recorded:
+            assert scheduler.wait() == list(due)
+            assert scheduler.now() == snapshot.time
+            samples = sampler.sample()
+            for index, sample in snapshot.samples.items():
+                gpu_info, processes = samples[index]
+                assert gpu_info == dict(sample.gpu_info)
+                assert processes == [dict(process) for process in sample.processes]
+        assert scheduler.wait() is None
+    finally:
+        sampler.close()
+
+def test_recording_cut_short_replays_its_complete_frames(tmp_path):
+    path = tmp_path / 'run.jsonl.gz'
+    record_fake_run(path, ticks=10)
+    data = path.read_bytes()
+    path.write_bytes(data[:len(data) * 2 // 3])
+    header, frames = gm.read_recording(path)
+    assert header['format'] == gm.RECORDING_FORMAT
+    assert 0 < len(frames) < 10
+    assert [frame['t'] for frame in frames] == [1000.0 + tick for tick in range(len(frames))]
+
+def test_recorder_leaves_a_header_before_its_first_flush(tmp_path):
+    path = tmp_path / 'run.jsonl.gz'
+    sampler = gm.DeviceSampler(gm.FakeBackend())
+    recorder = gm.SnapshotRecorder(path, sampler)
+    try:
+        # The recorder is still open, as if the process were killed now
+        header, frames = gm.read_recording(path)
+        assert header['devices'] == sampler.static
+        assert frames == []
+    finally:
+        recorder.close()
+        sampler.close()
+
+@pytest.mark.parametrize('content', [b'', b'not gzip at all', b'\x1f\x8b\x08\x00'])
+def test_broken_recordings_are_rejected(tmp_path, content):
+    path = tmp_path / 'broken.jsonl.gz'
+    path.write_bytes(content)
+    with pytest.raises(ValueError, match="no complete recording header"):
+        gm.ReplayBackend(path)
+
+def fleet_device(index, **values):
+    return index, dict(gm.DEFAULT_GPU_INFO, **values), ()
+
+def test_fleet_samples_round_trip():
+    packet = gm.encode_fleet_samples("node-1", 1234.5, [
+        fleet_device(0, gpu_util=42, temperature=61),
+        (3, dict(gm.DEFAULT_GPU_INFO, power_draw=250.5), (("Hot", 'critical'),))
+    ])
+    kind, host, current_time, payload = gm.decode_fleet_packet(packet)
+    assert (kind, host, current_time) == (gm.FLEET_SAMPLES, "node-1", 1234.5)
+    records = np.frombuffer(payload, dtype=gm.FLEET_RECORD)
+    assert records['index'].tolist() == [0, 3]
+    assert [gm.HEALTH_STATES[health] for health in records['health']] == ["Good", "Poor"]
+    assert records['alerts'].tolist() == [0, 1]
+    values = dict(zip(gm.FLEET_FIELDS, records['values'][1].tolist()))
+    assert values['power_draw'] == 250.5
+
+def test_fleet_packets_from_elsewhere_are_rejected():
+    with pytest.raises(ValueError):
+        gm.decode_fleet_packet(b'HTTP' + bytes(gm.FLEET_HEADER.size))
+
+def test_aggregator_keeps_the_latest_sample_per_device():
+    aggregator = gm.FleetAggregator(capacity=1, history_length=4)
+    devices = json.dumps([{'index': 1, 'name': "Test GPU", 'uuid': "GPU-1"}]).encode('utf-8')
+    aggregator.ingest(gm.encode_fleet_packet(gm.FLEET_DEVICES, "a", 100.0, devices))
+    for tick in range(6):
+        aggregator.ingest(gm.encode_fleet_samples("a", 100.0 + tick, [fleet_device(1, gpu_util=tick)]))
+    # A second host outgrows the initial capacity of one row
+    aggregator.ingest(gm.encode_fleet_samples("b", 105.0, [fleet_device(0, temperature=90)]))
+    rows = {row['device']: row for row in aggregator.rows(now=105.0)}
+    assert (aggregator.packets, aggregator.errors) == (8, 0)
+    assert rows["a:1"]['name'] == "Test GPU"
+    assert rows["a:1"]['gpu_util'] == 5
+    assert rows["b:0"]['temperature'] == 90
+    assert aggregator.rows(now=200.0)[0]['health'] == "Stale"
+    assert sorted(aggregator.history_times[aggregator.slots[("a", 1)]].tolist()) == [102.0, 103.0, 104.0, 105.0]
+
+def corrupt(packet, field, value):
+    # The samples packet with one field of its first record overwritten
+    kind, host, current_time, payload = gm.decode_fleet_packet(packet)
+    records = np.frombuffer(payload, dtype=gm.FLEET_RECORD).copy()
+    records[field][0] = value
+    return gm.encode_fleet_packet(kind, host, current_time, records.tobytes())
+
+@pytest.mark.parametrize('packet', [
+    b'',
+    b'GPMF',
+    corrupt(gm.encode_fleet_samples("a", 1.0, [fleet_device(0)]), 'health', len(gm.HEALTH_STATES)),
+    corrupt(gm.encode_fleet_samples("a", 1.0, [fleet_device(0)]), 'index', gm.FLEET_MAX_DEVICES),
+    gm.encode_fleet_samples("a", 1.0, [fleet_device(0)])[:-1],
+    gm.encode_fleet_packet(gm.FLEET_DEVICES, "a", 1.0, b'[{"index": 70000, "name": "x"}]'),
+    gm.encode_fleet_packet(gm.FLEET_DEVICES, "a", 1.0, b'not json'),
+    gm.encode_fleet_packet(7, "a", 1.0, b'')
+])
+def test_aggregator_drops_malformed_packets(packet):
+    aggregator = gm.FleetAggregator()
+    aggregator.ingest(packet)
+    assert (aggregator.packets, aggregator.errors) == (0, 1)
+    assert aggregator.keys == []